@@ -0,0 +1,156 @@
+"""
+Python API to grade submissions in this process, with the results passed in memory instead of through result files.
+For example,
+
+    from autogradescoper.grader import Grader, Problem
+
+    with Grader("/autograder/source/solution", fork_server=True, show_details=True) as grader:
+        problems = Problem.load_all("/autograder/source/config/config.yaml")
+        result = grader.grade(problems, "/autograder/submission")
+    print(result.score, [p.score for p in result.problems])
+
+The command line tools eval_r_func_probset, eval_r_func_problem, and eval_r_func_roster evaluate the test cases in the same way.
+"""
+import os, functools, tempfile, json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from autogradescoper.utils.utils import create_custom_logger, run_parallel, parse_usage
+from autogradescoper.utils.problem import Problem, TestCase
+from autogradescoper.scripts.eval_r_func_problem import collect_problem_results, run_batch_solution, precheck_submission, evaluate_problem_case
+from autogradescoper.scripts.eval_r_func_probset import default_arguments as default_probset_arguments, problem_arguments, probset_results
+
+@dataclass
+class CaseResult:
+    """
+    Result of a test case. score is "pass", "incorrect", "error", "timeout", or a number (as a string) from a custom scoring function.
+    """
+    score: str
+    elapsed: float
+    exit_code: Optional[int]
+    args: str
+    details: str
+    diffs: str
+    errors: str
+    usage: Dict[str, Optional[float]]
+    scaling: Optional[Dict[str, Any]] = None
+    time_limit: Optional[Dict[str, Any]] = None ## "max_time" applied, and how it was calibrated from the solution if it was
+
+    @classmethod
+    def from_fields(cls, fields: Dict[str, Any]) -> "CaseResult":
+        """
+        Result from the fields returned by evaluate_case() in eval_r_func_args
+        """
+        return cls(score=str(fields["score"]), elapsed=float(fields["usr_time"]),
+                   exit_code=None if fields.get("usr_exitcode") is None else int(fields["usr_exitcode"]),
+                   args=fields["args"], details=fields["details"], diffs=fields["diffs"], errors=fields["errors"],
+                   usage=parse_usage(fields.get("usr_usage")), scaling=json.loads(fields["scaling"]) if fields.get("scaling") is not None else None,
+                   time_limit=json.loads(fields["time_limit"]) if fields.get("time_limit") is not None else None)
+
+    @property
+    def passed(self) -> bool:
+        return self.score == "pass"
+
+@dataclass
+class ProblemResult:
+    """
+    Result of a problem. results is the dict written to {out_prefix}.{filename}.json by the command line tools.
+    """
+    name: str
+    score: float
+    max_score: float
+    elapsed: float
+    cases: List[CaseResult]
+    results: Dict[str, Any] = field(repr=False)
+
+@dataclass
+class SubmissionResult:
+    """
+    Result of a submission. results is the dict written to results.json for Gradescope by eval_r_func_probset.
+    """
+    score: float
+    execution_time: float
+    problems: List[ProblemResult]
+    results: Dict[str, Any] = field(repr=False)
+
+class Grader:
+    """
+    Grades submissions of the problems against the solutions in solution_dir, evaluating the test cases in this process.
+    The R scripts and outputs of the test cases are written to a new subdirectory of work_dir for each graded submission.
+    Without work_dir, a temporary directory is created, and removed by close() (or at the end of a with block).
+    The other keyword arguments are the options of eval_r_func_probset, e.g. fork_server=True, jobs=4, show_details=True.
+    """
+    def __init__(self, solution_dir: str, work_dir: Optional[str] = None, **options):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix="autogradescoper.") if work_dir is None else None
+        self.work_dir = work_dir if work_dir is not None else self.temp_dir.name
+        os.makedirs(self.work_dir, exist_ok=True)
+        for name in options:
+            if name in ["config", "solution_dir", "submission_dir", "out_prefix", "results_db", "trace", "incremental", "time_budget"]:
+                raise TypeError(f"Unknown option {name} of Grader")
+        self.options = default_probset_arguments(solution_dir=solution_dir, out_prefix=f"{self.work_dir}/results", **options) ## out_prefix is replaced for each submission
+        self.logger = create_custom_logger(__name__)
+
+    def close(self):
+        """
+        Remove the temporary directory created without work_dir
+        """
+        if self.temp_dir is not None:
+            self.temp_dir.cleanup()
+
+    def __enter__(self) -> "Grader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def problem_args(self, problem: Problem, submission: str, run_dir: str):
+        """
+        Arguments of eval_r_func_problem for the problem and the submitted R file, writing the outputs of the test cases to run_dir
+        """
+        prob_args = problem_arguments(self.options, problem, submission)
+        prob_args.out_prefix = f"{run_dir}/results.{problem.filename}"
+        return prob_args
+
+    def grade_problem(self, problem: Problem, submission: str) -> ProblemResult:
+        """
+        Grade the submitted R file for a problem
+        """
+        return self._grade([(problem, submission)])[0]
+
+    def grade(self, problems: List[Problem], submission_dir: str) -> SubmissionResult:
+        """
+        Grade the submission in submission_dir (containing {filename}.R for each problem), evaluating the test cases of all problems from a single queue
+        """
+        problem_results = self._grade([(p, f"{submission_dir}/{p.filename}.R") for p in problems])
+        results = probset_results([p.results for p in problem_results], self.options.memory_leaderboard)
+        return SubmissionResult(score=results["score"], execution_time=results["execution_time"], problems=problem_results, results=results)
+
+    def _grade(self, submissions) -> List[ProblemResult]:
+        ## each graded submission gets its own directory, so that grading the same problem again does not overwrite the outputs of another submission
+        run_dir = tempfile.mkdtemp(prefix="submission.", dir=self.work_dir)
+        units = [(self.problem_args(problem, submission, run_dir), problem.cases) for (problem, submission) in submissions]
+        case_results = {}
+        runnable = units
+        if not self.options.no_precheck:
+            failures = run_parallel([functools.partial(lambda prob_args, config, core: precheck_submission(prob_args, config, self.logger, core, False), prob_args, config)
+                                     for (prob_args, config) in units], self.options.jobs, self.options.pin_cores)
+            runnable = [unit for (unit, failed) in zip(units, failures) if failed is None]
+            for failed in failures:
+                case_results.update(failed or {})
+        if self.options.batch_solution:
+            run_parallel([functools.partial(lambda prob_args, config, core: run_batch_solution(prob_args, config, self.logger), prob_args, config)
+                          for (prob_args, config) in runnable], self.options.jobs)
+
+        cases = [(prob_args, j, c) for (prob_args, config) in runnable for j, c in enumerate(config)]
+        case_fields = run_parallel([functools.partial(evaluate_problem_case, prob_args, j, c, write_results=False) for (prob_args, j, c) in cases],
+                                   self.options.jobs, self.options.pin_cores)
+        for ((prob_args, j, c), fields) in zip(cases, case_fields):
+            case_results[f"{prob_args.out_prefix}.{j}"] = fields
+
+        problem_results = []
+        for (prob_args, config) in units:
+            outdict = collect_problem_results(prob_args, config, case_results)
+            problem_results.append(ProblemResult(name=outdict["name"], score=outdict["score"], max_score=outdict["max_score"], elapsed=outdict["elapsed"],
+                                                 cases=[CaseResult.from_fields(case_results[f"{prob_args.out_prefix}.{j}"]) for j in range(len(config))],
+                                                 results=outdict))
+        return problem_results
@@ -0,0 +1,199 @@
+import sys, os, gzip, argparse, logging, warnings, shutil, subprocess, ast, json, time, shlex, platform, statistics
+import numpy as np
+
+from autogradescoper.utils.utils import get_func, create_custom_logger, load_file_to_dict, write_dict_to_file, available_cores
+from autogradescoper.utils.stages import stage_totals, reset_stages
+
+def parse_arguments(_args):
+    repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+    parser = argparse.ArgumentParser(prog=f"autogradescoper benchmark_r_func_probset", description="Benchmark the whole grading pipeline of eval_r_func_probset on a synthetic problem set")
+
+    inout_params = parser.add_argument_group("Required Input/Output Parameters", "Input/output directory/files.")
+    inout_params.add_argument('--out-dir', type=str, required=True, help='Directory to write the synthetic problem set, the grading results, and the benchmark results')
+    inout_params.add_argument('--out-json', type=str, help='JSON file to write the benchmark results (default: {out_dir}/benchmark.json)')
+    inout_params.add_argument('--history', type=str, help='JSONL file to append the benchmark results to, so that runs can be compared over time')
+
+    key_params = parser.add_argument_group("Key Parameters with default values", "Key parameters frequently used by users")
+    key_params.add_argument('--problems', type=int, default=4, help='Number of problems')
+    key_params.add_argument('--cases', type=int, default=10, help='Number of test cases per problem')
+    key_params.add_argument('--arg-types', type=str, default="scalar,bin,rds,df", help='Comma-separated types of input arguments, assigned to the problems in turn. scalar: numbers (as in examples/mypexp), bin/rds: a matrix and a vector for a least squares fit (as in examples/testlm), df: a data frame to aggregate')
+    key_params.add_argument('--size', type=int, default=1000, help='Number of rows of the matrices and data frames')
+    key_params.add_argument('--cols', type=int, default=10, help='Number of columns of the matrices')
+    key_params.add_argument('--repeats', type=int, default=3, help='Number of times to grade the problem set')
+    key_params.add_argument('--seed', type=int, default=0, help='Random seed to generate the input arguments')
+    key_params.add_argument('--label', type=str, default="", help='Label of this benchmark run (e.g. the options being compared)')
+    key_params.add_argument('--probset-args', type=str, default="", help='Additional arguments of eval_r_func_probset, e.g. "--fork-server --jobs 4"')
+    key_params.add_argument('--preload-all', type=str, default=f"{repo_dir}/assets/autogradescoper_utils.R", help='R script defining read.binary.matrix(), used to convert the bin files to rds files')
+    key_params.add_argument('--log', action='store_true', default=False, help='Write log to file')
+
+    if len(_args) == 0:
+        parser.print_help()
+        sys.exit(1)
+
+    return parser.parse_args(_args)
+
+## R functions of the synthetic problems, by the type of their arguments
+BENCH_FUNCS = {
+    "scalar": "{func} <- function(x, n) {{\n    s <- 0\n    for (i in 0:n) s <- s + x^i / factorial(i)\n    s\n}}\n",
+    "bin": "{func} <- function(X, y) {{\n    drop(solve(crossprod(X), crossprod(X, y)))\n}}\n",
+    "rds": "{func} <- function(X, y) {{\n    drop(solve(crossprod(X), crossprod(X, y)))\n}}\n",
+    "df": "{func} <- function(df) {{\n    aggregate(value ~ group, data = df, FUN = mean)\n}}\n",
+}
+
+def write_binary_matrix(mat, filename):
+    """
+    Write a matrix in the format read by read.binary.matrix() in assets/autogradescoper_utils.R
+    """
+    with open(filename, 'wb') as f:
+        f.write(np.array(mat.shape, dtype="<i4").tobytes())
+        f.write(np.asarray(mat, dtype="<f8").tobytes(order='F'))
+
+def generate_problem_set(args):
+    """
+    Write a synthetic problem set shaped like /autograder/source, with a submission identical to the solution.
+    Returns the paths of the top-level config, the solution directory, and the submission directory.
+    """
+    src_dir = f"{args.out_dir}/source"
+    (sol_dir, sub_dir, args_dir, config_dir) = (f"{src_dir}/solution", f"{args.out_dir}/submission", f"{src_dir}/args", f"{src_dir}/config")
+    for d in [sol_dir, sub_dir, args_dir, config_dir]:
+        os.makedirs(d, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+    arg_types = args.arg_types.split(",")
+    rds_files = [] ## (bin, rds) pairs to convert in R
+
+    config = []
+    for k in range(args.problems):
+        arg_type = arg_types[k % len(arg_types)]
+        if arg_type not in BENCH_FUNCS:
+            raise ValueError(f"Unknown argument type {arg_type}")
+        func = f"bench{k+1}"
+        for d in [sol_dir, sub_dir]:
+            with open(f"{d}/{func}.R", 'w') as f:
+                f.write(BENCH_FUNCS[arg_type].format(func=func))
+
+        prob_config = []
+        for i in range(args.cases):
+            args_path = f"{args_dir}/{func}.{i+1}.args"
+            with open(args_path, 'w') as f:
+                if arg_type == "scalar":
+                    f.write(f"numeric:{rng.uniform(-2, 2):.6f}\nint:{int(rng.integers(5, 30))}\n")
+                elif arg_type in ["bin", "rds"]:
+                    X = rng.normal(size=(args.size, args.cols))
+                    y = X @ rng.normal(size=(args.cols, 1)) + rng.normal(size=(args.size, 1))
+                    for (name, mat) in [("X", X), ("y", y)]:
+                        bin_path = f"{args_dir}/{func}.{i+1}.{name}.bin"
+                        write_binary_matrix(mat, bin_path)
+                        if arg_type == "rds":
+                            rds_files.append((bin_path, bin_path[:-4] + ".rds"))
+                        f.write(f"{arg_type}:{bin_path if arg_type == 'bin' else bin_path[:-4] + '.rds'}\n")
+                else:
+                    df_path = f"{args_dir}/{func}.{i+1}.df.tsv"
+                    groups = rng.integers(1, 11, size=args.size)
+                    values = rng.normal(size=args.size)
+                    with open(df_path, 'w') as fdf:
+                        fdf.write("id\tgroup\tvalue\n")
+                        fdf.writelines([f"{j+1}\tg{groups[j]}\t{values[j]:.10g}\n" for j in range(args.size)])
+                    f.write(f"df:{df_path}\n")
+            prob_config.append({"args": args_path, "maxtime": 60})
+        write_dict_to_file(prob_config, f"{config_dir}/config.{func}.yaml")
+        config.append({"func": func, "filename": func, "digits": 8, "config": f"{config_dir}/config.{func}.yaml"})
+    write_dict_to_file(config, f"{config_dir}/config.yaml")
+
+    if len(rds_files) > 0: ## rds files can only be written by R
+        conv_path = f"{args_dir}/convert_rds.R"
+        with open(conv_path, 'w') as f:
+            f.write(f"source('{args.preload_all}')\n")
+            for (bin_path, rds_path) in rds_files:
+                f.write(f"saveRDS(read.binary.matrix('{bin_path}'), '{rds_path}')\n")
+        proc = subprocess.run(["Rscript", conv_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Failed to write the rds files with {conv_path}:\n{proc.stderr.decode()}")
+
+    return (f"{config_dir}/config.yaml", sol_dir, sub_dir)
+
+def git_commit(repo_dir):
+    """
+    Current git commit of the repository, or None if not available
+    """
+    try:
+        proc = subprocess.run(["git", "-C", repo_dir, "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return proc.stdout.decode().strip() if proc.returncode == 0 else None
+    except FileNotFoundError:
+        return None
+
+def benchmark_r_func_probset(_args):
+    # parse argument
+    args=parse_arguments(_args)
+    repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    log_path = f"{args.out_dir}/benchmark.log"
+    logger = create_custom_logger(__name__, log_path if args.log else None)
+
+    logger.info(f"Generating {args.problems} problems with {args.cases} test cases each in {args.out_dir}")
+    (config_path, sol_dir, sub_dir) = generate_problem_set(args)
+    n_cases = args.problems * args.cases
+
+    results_dir = f"{args.out_dir}/results"
+    runs = []
+    for r in range(args.repeats):
+        shutil.rmtree(results_dir, ignore_errors=True)
+        os.makedirs(results_dir)
+        reset_stages()
+        start_time = time.perf_counter()
+        get_func("eval_r_func_probset")(["--config", config_path, "--solution-dir", sol_dir, "--submission-dir", sub_dir,
+                                         "--out-prefix", f"{results_dir}/results", "--stage-times"] + shlex.split(args.probset_args))
+        wall_time = time.perf_counter() - start_time
+        results = load_file_to_dict(f"{results_dir}/results.json", "json")
+        if results["score"] != n_cases:
+            logger.warning(f"Only {results['score']} of {n_cases} test cases passed, so the benchmark may not be representative")
+        runs.append({"wall_seconds": wall_time, "cases_per_sec": n_cases / wall_time, "score": results["score"], "stages": stage_totals()})
+        logger.info(f"Run {r+1}/{args.repeats}: {wall_time:.3f}s, {n_cases / wall_time:.2f} cases/sec")
+
+    ## average of the stages over the runs
+    stage_names = sorted(set(name for run in runs for name in run["stages"]))
+    stages = {}
+    for name in stage_names:
+        seconds = statistics.mean([run["stages"].get(name, {}).get("seconds", 0) for run in runs])
+        count = statistics.mean([run["stages"].get(name, {}).get("count", 0) for run in runs])
+        stages[name] = {"seconds": seconds, "count": count, "ms_per_call": seconds / count * 1000 if count > 0 else None}
+
+    wall_times = [run["wall_seconds"] for run in runs]
+    outdict = {
+        "benchmark": "eval_r_func_probset",
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(repo_dir),
+        "host": platform.node(),
+        "cpus": len(available_cores()),
+        "params": {"problems": args.problems, "cases": args.cases, "arg_types": args.arg_types, "size": args.size, "cols": args.cols,
+                   "repeats": args.repeats, "seed": args.seed, "probset_args": args.probset_args},
+        "n_cases": n_cases,
+        "wall_seconds_median": statistics.median(wall_times),
+        "cases_per_sec_median": n_cases / statistics.median(wall_times),
+        "stages": stages,
+        "runs": runs,
+    }
+
+    logger.info(f"Median: {outdict['wall_seconds_median']:.3f}s, {outdict['cases_per_sec_median']:.2f} cases/sec")
+    logger.info("Time spent in each stage per run, summed over parallel jobs:")
+    for (name, s) in sorted(stages.items(), key=lambda x: -x[1]["seconds"]):
+        logger.info(f"  {name:<20s} {s['seconds']:10.3f}s {s['count']:8.0f} calls" + (f" {s['ms_per_call']:10.3f}ms per call" if s['ms_per_call'] is not None else ""))
+
+    out_json = args.out_json if args.out_json is not None else f"{args.out_dir}/benchmark.json"
+    write_dict_to_file(outdict, out_json, "json")
+    if args.history is not None:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(outdict) + "\n")
+    logger.info(f"Benchmark results were written to {out_json}")
+
+if __name__ == "__main__":
+    # Get the base file name without extension
+    script_name = os.path.splitext(os.path.basename(__file__))[0]
+
+    # Dynamically get the function based on the script name
+    func = getattr(sys.modules[__name__], script_name)
+
+    # Call the function with command line arguments
+    func(sys.argv[1:])
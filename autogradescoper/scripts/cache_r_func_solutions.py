@@ -0,0 +1,92 @@
+import sys, os, gzip, argparse, logging, warnings, shutil, subprocess, ast, json, time, tempfile
+
+from autogradescoper.utils.utils import create_custom_logger, write_r_eval_func_script, run_r_eval_script, r_source_scripts
+from autogradescoper.utils.solcache import SolutionCache, solution_cache_key, run_cached_solution, cache_stats
+from autogradescoper.utils.problem import Problem
+
+def parse_arguments(_args):
+    repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+    parser = argparse.ArgumentParser(prog=f"autogradescoper cache_r_func_solutions", description="Fill the persistent cache of solution outputs ahead of time (e.g. in setup.sh), so that the solutions are not run at submission time")
+
+    inout_params = parser.add_argument_group("Required Input/Output Parameters", "Input/output directory/files.")
+    inout_params.add_argument('--config', type=str, default="/autograder/source/config/config.yaml", help='JSON/YAML files containing "func", "config", "digits", "preload" for each problem (default:/autograder/source/config/config.yaml)')
+    inout_params.add_argument('--sol-cache', type=str, default="/autograder/source/cache/solution", help='Directory of the persistent cache of solution outputs (default: /autograder/source/cache/solution)')
+
+    key_params = parser.add_argument_group("Key Parameters with default values", "Key parameters frequently used by users")
+    key_params.add_argument('--solution-dir', type=str, default="/autograder/source/solution", help='R script containing the correct solution (default: /autograder/source/solution)')
+    key_params.add_argument('--work-dir', type=str, help='Directory to write the temporary R scripts and outputs (default: a temporary directory)')
+    key_params.add_argument('--preload-all', type=str, default=f"{repo_dir}/assets/autogradescoper_utils.R", help='For all cases, load this R script before the R function')
+    key_params.add_argument('--clear', action='store_true', default=False, help='Remove all existing cache entries before filling the cache')
+    key_params.add_argument('--sol-cache-max-mb', type=float, help='Maximum size of the solution cache in megabytes. Least recently used outputs are evicted')
+    key_params.add_argument('--fork-server', action='store_true', default=False, help='Source the preload scripts and R file once per problem, and fork it for each test case')
+    key_params.add_argument('--binary-output', action='store_true', default=False, help='For all problems, write numeric vectors and matrices in a binary format (must match eval_r_func_probset)')
+    key_params.add_argument('--log', action='store_true', default=False, help='Write log to file')
+
+    if len(_args) == 0:
+        parser.print_help()
+        sys.exit(1)
+
+    return parser.parse_args(_args)
+
+def cache_case_solution(sol_cache, problem, i, c, solution_dir, work_dir, preload_all, fork_server = False, binary_output = False):
+    """
+    Run the solution for the i-th test case c (a TestCase) of the Problem, unless it is already in the cache.
+    Returns ((elapsed_time, exit_code, error_message), hit).
+    """
+    func = problem.func
+    solution = f"{solution_dir}/{problem.filename}.R"
+    sol_preloads = [preload_all, problem.preload_sol]
+    binary_output = problem.get("binary_output", binary_output)
+
+    out_sol_prefix = f"{work_dir}/{problem.filename}.{i}.sol"
+    write_r_eval_func_script(func, out_sol_prefix, solution, c.args, problem.digits, problem.format, sol_preloads, fork_server, binary_output)
+    sol_key = solution_cache_key(func, solution, c.args, problem.digits, problem.format, sol_preloads, binary_output)
+    return run_cached_solution(sol_cache, sol_key, out_sol_prefix,
+                    lambda: run_r_eval_script(out_sol_prefix, c.get("maxtime"), r_source_scripts(solution, sol_preloads) if fork_server else None),
+                    "forked" if fork_server else "plain")
+
+def cache_r_func_solutions(_args):
+    # parse argument
+    args=parse_arguments(_args)
+
+    log_path = f"{args.sol_cache}/cache.log"
+    logger = create_custom_logger(__name__, log_path if args.log else None)
+    logger.info("Started filling the solution cache")
+
+    sol_cache = SolutionCache(args.sol_cache, args.sol_cache_max_mb)
+    if args.clear:
+        logger.info(f"Removing all entries in {args.sol_cache}")
+        sol_cache.clear()
+
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp(prefix="autogradescoper.")
+    os.makedirs(work_dir, exist_ok=True)
+
+    n_failed = 0
+    for problem in Problem.load_all(args.config):
+        func = problem.func
+        for i, c in enumerate(problem.cases):
+            if c.scaling is not None: ## the running time of the solution is measured at grading time
+                continue
+            ((elapsed_time, exit_code, error_message), hit) = cache_case_solution(sol_cache, problem, i, c, args.solution_dir, work_dir, args.preload_all, args.fork_server, args.binary_output)
+            if exit_code != 0:
+                n_failed += 1
+                logger.info(f"{func} case {i+1}: the solution returned an error with exit code {exit_code}, not cached\n{error_message}")
+            else:
+                logger.info(f"{func} case {i+1}: {'already cached' if hit else f'cached in {elapsed_time:.2f}s'}")
+
+    if args.work_dir is None:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    logger.info(f"Solution cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {n_failed} failed")
+    logger.info(f"Analysis finished")
+
+if __name__ == "__main__":
+    # Get the base file name without extension
+    script_name = os.path.splitext(os.path.basename(__file__))[0]
+
+    # Dynamically get the function based on the script name
+    func = getattr(sys.modules[__name__], script_name)
+
+    # Call the function with command line arguments
+    func(sys.argv[1:])
@@ -0,0 +1,60 @@
+import sys, os, gzip, argparse, logging, warnings, shutil, subprocess, ast, json, time
+
+from autogradescoper.utils.utils import create_custom_logger
+from autogradescoper.utils.argcache import ArgCache, args_specs
+from autogradescoper.utils.problem import Problem
+
+def parse_arguments(_args):
+    repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+    parser = argparse.ArgumentParser(prog=f"autogradescoper compile_r_func_args", description="Compile the df, mat, and eval input arguments of all test cases into fast-loading RDS files ahead of time (e.g. in setup.sh)")
+
+    inout_params = parser.add_argument_group("Required Input/Output Parameters", "Input/output directory/files.")
+    inout_params.add_argument('--config', type=str, default="/autograder/source/config/config.yaml", help='JSON/YAML files containing "func", "config", "digits", "preload" for each problem (default:/autograder/source/config/config.yaml)')
+    inout_params.add_argument('--arg-cache', type=str, default="/autograder/source/cache/args", help='Directory to store the compiled input arguments (default: /autograder/source/cache/args)')
+
+    key_params = parser.add_argument_group("Key Parameters with default values", "Key parameters frequently used by users")
+    key_params.add_argument('--preload-all', type=str, default=f"{repo_dir}/assets/autogradescoper_utils.R", help='R script to load before evaluating the eval arguments')
+    key_params.add_argument('--clear', action='store_true', default=False, help='Remove all existing compiled arguments before compiling')
+    key_params.add_argument('--log', action='store_true', default=False, help='Write log to file')
+
+    if len(_args) == 0:
+        parser.print_help()
+        sys.exit(1)
+
+    return parser.parse_args(_args)
+
+def compile_r_func_args(_args):
+    # parse argument
+    args=parse_arguments(_args)
+
+    if args.clear:
+        shutil.rmtree(args.arg_cache, ignore_errors=True)
+    os.makedirs(args.arg_cache, exist_ok=True)
+
+    log_path = f"{args.arg_cache}/compile.log"
+    logger = create_custom_logger(__name__, log_path if args.log else None)
+    logger.info("Started compiling the input arguments")
+
+    ## collect the arguments of all test cases, so that they are compiled in a single R process
+    specs = []
+    for problem in Problem.load_all(args.config):
+        for c in problem.cases:
+            specs.extend(args_specs(c.args))
+
+    arg_cache = ArgCache(args.arg_cache)
+    (n_compiled, n_cached, error_message) = arg_cache.compile(specs, [args.preload_all])
+    if len(error_message) > 0:
+        logger.info(f"Messages from R:\n{error_message}")
+    logger.info(f"Compiled {n_compiled} input arguments, {n_cached} were already compiled")
+    logger.info(f"Analysis finished")
+
+if __name__ == "__main__":
+    # Get the base file name without extension
+    script_name = os.path.splitext(os.path.basename(__file__))[0]
+
+    # Dynamically get the function based on the script name
+    func = getattr(sys.modules[__name__], script_name)
+
+    # Call the function with command line arguments
+    func(sys.argv[1:])
@@ -1,8 +1,22 @@
 import sys, os, gzip, argparse, logging, warnings, shutil, subprocess, ast, json, time, difflib
 
-from autogradescoper.utils.utils import create_custom_logger, load_file_to_dict, write_dict_to_file, write_r_eval_func_script, run_r_eval_script, params2str, diff_files
+from autogradescoper.utils.utils import create_custom_logger, close_custom_logger, load_file_to_dict, write_dict_to_file, write_r_eval_func_script, run_r_eval_script, params2str, diff_files, r_source_scripts, format_usage, args_data_files, file_digest, hash_files, parser_defaults, default_namespace
+from autogradescoper.utils.solcache import SolutionCache, solution_cache_key, run_cached_solution, timing_context, read_timing_context, write_timing_context
+from autogradescoper.utils.compare import COMPARE_MODES, MappedOutput, canonicalize_outputs, compare_outputs_numeric, compare_outputs_exact, compare_binary_results, is_binary_result, format_binary_preview
+from autogradescoper.utils.jsonstream import load_json_object
+from autogradescoper.utils.store import ResultsStore, export_case_files
+from autogradescoper.utils.stages import stage, record_stage, traced
+from autogradescoper.utils.argcache import ArgCache
+from autogradescoper.utils.driver import OUTPUT_LIMIT_EXIT_CODE
+from autogradescoper.utils.scaling import write_r_scaling_script, read_scaling_times, score_scaling
+from autogradescoper.utils.timeouts import r_startup_overhead, adaptive_time_limit
 
-def parse_arguments(_args):
+## without --max-output-mb, the submission may print or write this multiple of the size of the solution output, so that
+## the limit only stops runaway output (e.g. printing in an infinite loop), however large the expected output is
+OUTPUT_LIMIT_FACTOR = 10
+MIN_OUTPUT_LIMIT_MB = 64
+
+def argument_parser():
     repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 
     parser = argparse.ArgumentParser(prog=f"autogradescoper eval_r_func_args", description="Automatic grading of a single R function for a single example input/output")
@@ -18,7 +32,13 @@ def parse_arguments(_args):
     key_params = parser.add_argument_group("Key Parameters with default values", "Key parameters frequently used by users")
     key_params.add_argument('--log', action='store_true', default=False, help='Write log to file')
     key_params.add_argument('--log-path', type=str, help='The suffix for the log file. Default: {out_prefix}.log')
-    key_params.add_argument('--max-time', type=int, default=10, help='Maximum time in seconds to run the R function')
+    key_params.add_argument('--max-time', type=int, default=10, help='Maximum time in seconds to run the R function (and the solution)')
+    key_params.add_argument('--max-time-factor', type=float, help='If set, the time limit of the submission is this multiple of the time spent by the solution in the function, plus --max-time-floor, measured on this machine. --max-time still limits the solution')
+    key_params.add_argument('--max-time-floor', type=float, default=1, help='Seconds added to the time limit calibrated with --max-time-factor')
+    key_params.add_argument('--deadline', type=float, help='Time (in seconds since the epoch) by which the test case must finish, e.g. set by eval_r_func_probset --time-budget. Runs are stopped at the deadline, and the test case is reported as skipped if it could not finish because of it')
+    key_params.add_argument('--max-memory', type=float, help='Maximum memory (virtual address space) in megabytes for the R process running the submission')
+    key_params.add_argument('--max-cpu-time', type=float, help='Maximum CPU time (user + system) in seconds for the R process running the submission')
+    key_params.add_argument('--max-output-mb', type=float, help=f'Maximum size in megabytes of the printed output and of each file written by the R process running the submission (default: {OUTPUT_LIMIT_FACTOR} times the size of the solution output, and at least {MIN_OUTPUT_LIMIT_MB}MB)')
     key_params.add_argument('--digits', type=int, default=8, help='Number of digits to to write the output')
     key_params.add_argument('--format', type=str, default="g", help='C-style format out output ("d", "f", "g", "e", "s", ..) to write the output')
     key_params.add_argument('--preload-usr', type=str, help='User R script to load before the R function')
@@ -26,19 +46,233 @@ def parse_arguments(_args):
     key_params.add_argument('--preload-all', type=str, help='For all cases, load this R script before the R function')
     key_params.add_argument('--max-show-chars', type=int, default=500, help='Maximum number of characters to show in the output')
     key_params.add_argument('--log-show-chars', type=int, default=500, help='Maximum number of characters to show in the log')
+    key_params.add_argument('--fork-server', action='store_true', default=False, help='Source the preload scripts and R file once in a long-lived R process, and fork it for each test case')
+    key_params.add_argument('--sol-cache', type=str, help='Directory of the persistent cache of solution outputs. The solution is not run if its output is found in the cache')
+    key_params.add_argument('--sol-cache-max-mb', type=float, help='Maximum size of the solution cache in megabytes. Least recently used outputs are evicted')
+    key_params.add_argument('--cpu-core', type=int, help='Run R only on this CPU core')
+    key_params.add_argument('--solution-precomputed', action='store_true', default=False, help='Do not run the solution, and use the existing {out_prefix}.sol.out (e.g. written by a batch solution script)')
+    key_params.add_argument('--atol', type=float, help='Absolute tolerance to compare numeric outputs. If --atol or --rtol is set, numeric values are compared with tolerance instead of as text')
+    key_params.add_argument('--rtol', type=float, help='Relative tolerance to compare numeric outputs, relative to the expected value')
+    key_params.add_argument('--compare', type=str, default="exact", choices=COMPARE_MODES, help='Compare the outputs exactly, or regardless of the order of rows (sort-rows), of rows and duplicates (set-rows), or of list names (sort-keys)')
+    key_params.add_argument('--diff-style', type=str, default="normal", choices=["normal", "side-by-side"], help='Format of the differences between the expected and observed output: same as `diff` (normal), or side by side with line numbers')
+    key_params.add_argument('--binary-output', action='store_true', default=False, help='Write numeric vectors and matrices in a binary format (requires write.binary.result() in assets/autogradescoper_utils.R), and compare them without text formatting')
+    key_params.add_argument('--results-db', type=str, help='SQLite database to store the results in, instead of the .score, .args, .details, .diffs, .errors, .time, .exitcode, and .err files')
+    key_params.add_argument('--export-files', action='store_true', default=False, help='With --results-db, also write the results to the individual files (e.g. for debugging)')
+    key_params.add_argument('--arg-cache', type=str, help='Directory of the input arguments compiled by compile_r_func_args. Compiled arguments are loaded from their RDS files')
+    key_params.add_argument('--scaling-sizes', type=str, help='Comma-separated input sizes (e.g. 1000,2000,4000,8000). If set, the running time of the function is measured for each size (available as n in the eval arguments), and its growth is compared with the solution instead of the output')
+    key_params.add_argument('--scaling-warmup', type=int, default=1, help='Number of untimed calls for each size before the timed calls')
+    key_params.add_argument('--scaling-repeats', type=int, default=3, help='Number of timed calls for each size. The median time is used')
+    key_params.add_argument('--scaling-tolerance', type=float, default=0.25, help='Maximum difference between the scaling exponents of the submission and the solution to pass')
+    key_params.add_argument('--scaling-exponent', type=float, help='Expected scaling exponent (e.g. 1 for linear time). If set, the solution is not run')
+    key_params.add_argument('--scaling-points', type=float, default=1, help='Score when the scaling exponent is within the tolerance')
+    key_params.add_argument('--scaling-penalty', type=float, default=0, help='Points deducted when the scaling exponent exceeds the tolerance')
+    key_params.add_argument('--stage-times', action='store_true', default=False, help='Write timestamps in the R scripts to measure the time spent in each stage inside R ({out_prefix}.*.timing)')
+
+    return parser
+
+## default values of the arguments, to build them in Python (e.g. from a Problem and its TestCase) without parsing a command line
+ARGUMENT_DEFAULTS = parser_defaults(argument_parser())
 
+def default_arguments(**values):
+    """
+    Arguments of eval_r_func_args with the default values replaced by the given values
+    """
+    return default_namespace(ARGUMENT_DEFAULTS, values)
+
+def parse_arguments(_args):
+    parser = argument_parser()
     if len(_args) == 0:
         parser.print_help()
         sys.exit(1)
 
     return parser.parse_args(_args)
 
-def eval_r_func_args(_args):
-    # parse argument
-    args=parse_arguments(_args)
+def read_output_preview(path):
+    """
+    Output as text to show in the details, with binary results summarized
+    """
+    if is_binary_result(path):
+        return format_binary_preview(path)
+    with open(path, 'r', errors='replace') as fout:
+        return fout.read().strip()
+
+def shown_fields(args, score, str_args, str_details, str_diffs, str_errors):
+    """
+    Score and outputs shown to the user, truncated to --max-show-chars
+    """
+    def truncate(text):
+        if len(text) > args.max_show_chars:
+            return text[0:args.max_show_chars] + "\n... (truncated)\n"
+        return text + "\n"
+
+    return {"score": score, "args": truncate(str_args), "details": truncate(str_details), "diffs": truncate(str_diffs), "errors": truncate(str_errors)}
+
+## options that do not change the results of a test case, and are left out of its input hash
+RUN_ONLY_OPTIONS = ["out_prefix", "log", "log_path", "log_show_chars", "fork_server", "sol_cache", "sol_cache_max_mb", "cpu_core",
+                    "solution_precomputed", "results_db", "export_files", "arg_cache", "stage_times", "deadline"]
+
+def case_input_hash(args):
+    """
+    Content hash of everything that determines the results of the test case with the parsed arguments args:
+    the submitted and solution files, the args file and the data files it reads, the preload scripts, and the other options.
+    None if the input arguments may read files that cannot be tracked (see args_data_files()), so that the results are never reused.
+    """
+    data_files = args_data_files(args.args) if os.path.isfile(args.args) else []
+    if data_files is None:
+        return None
+    paths = [args.submission, args.solution, args.args] + data_files + [args.preload_all, args.preload_usr, args.preload_sol]
+    digests = [file_digest(p) if p is not None and os.path.isfile(p) else "none" for p in paths]
+    options = [f"{name}={value}" for (name, value) in sorted(vars(args).items()) if name not in RUN_ONLY_OPTIONS]
+    return hash_files([], extra=digests + options)
+
+def read_precomputed_solution_time(out_sol_prefix):
+    """
+    (elapsed time, whether it succeeded) of the solution precomputed by a batch solution script or found in the solution cache
+    """
+    if not os.path.exists(f"{out_sol_prefix}.time") or not os.path.exists(f"{out_sol_prefix}.exitcode"):
+        return (None, False)
+    with open(f"{out_sol_prefix}.time", 'r') as ftime, open(f"{out_sol_prefix}.exitcode", 'r') as fexit:
+        return (float(ftime.read().strip()), fexit.read().strip() == "0")
+
+def read_precomputed_solution_failure(out_sol_prefix):
+    """
+    (exit code, error message) of the solution precomputed by a batch solution script if it failed, or None if it succeeded or is unknown
+    """
+    if not os.path.exists(f"{out_sol_prefix}.exitcode"):
+        return None
+    with open(f"{out_sol_prefix}.exitcode", 'r') as fexit:
+        exit_code = int(fexit.read().strip())
+    if exit_code == 0:
+        return None
+    error_message = ""
+    if os.path.exists(f"{out_sol_prefix}.err"):
+        with open(f"{out_sol_prefix}.err", 'r') as ferr:
+            error_message = ferr.read()
+    return (exit_code, error_message)
+
+def retime_solution(args, out_sol_prefix, time_limit, arg_cache=None):
+    """
+    Run the solution of the test case again on this machine, with the fork server if --fork-server, only to measure its time.
+    Returns (elapsed_time, exit_code, error_message).
+    """
+    sol_preloads = [args.preload_all, args.preload_sol]
+    write_r_eval_func_script(args.r_func, out_sol_prefix, args.solution, args.args, args.digits, args.format, sol_preloads, args.fork_server, args.binary_output, args.stage_times, arg_cache)
+    (elapsed_time, exit_code, error_message) = run_r_eval_script(out_sol_prefix, time_limit, r_source_scripts(args.solution, sol_preloads) if args.fork_server else None, args.cpu_core, False)
+    write_timing_context(out_sol_prefix, "forked" if args.fork_server else "plain")
+    return (elapsed_time, exit_code, error_message)
+
+def write_case_results(args, case_fields):
+    """
+    Write the results of the test case to the results database and/or the individual files
+    """
+    with stage("results_write"):
+        if args.results_db is not None:
+            ResultsStore(args.results_db).write_case(args.out_prefix, case_fields)
+        if args.results_db is None or args.export_files:
+            export_case_files(args.out_prefix, case_fields)
+
+def write_usr_files(args, case_fields):
+    """
+    Write the .time, .exitcode, .usage, and .err files of the submission, as written by run_r_eval_script(), for a test case that was not run
+    """
+    out_usr_prefix = f"{args.out_prefix}.usr"
+    for (suffix, value) in [("time", case_fields["usr_time"]), ("exitcode", case_fields["usr_exitcode"]), ("usage", case_fields["usr_usage"])]:
+        with open(f"{out_usr_prefix}.{suffix}", 'w') as f:
+            f.write(f"{'' if value is None else value}\n")
+    with open(f"{out_usr_prefix}.err", 'w') as f:
+        f.write(case_fields["usr_err"])
+
+def record_precheck_failure(args, elapsed_time, exit_code, error_message, write_results=True):
+    """
+    Results of the test case with the parsed arguments args of eval_r_func_args, failed without running it
+    because the submitted file could not be loaded (see precheck_submission() in eval_r_func_problem).
+    With write_results, the results are also written in the same way as eval_r_func_args.
+    """
+    if exit_code == 124:
+        score = "timeout"
+        str_details = f"TIMEOUT: Loading the submitted file was terminated at {elapsed_time:.2f}s, because it exceeded the time limit, so the test case was not run."
+    else:
+        score = "error"
+        str_details = f"ERROR: The submitted file could not be loaded, with exit code {exit_code}, so the test case was not run.\n"
+    usage = {"user": None, "sys": None, "maxrss_kb": None}
+    case_fields = {"usr_time": f"{elapsed_time:.2f}", "usr_exitcode": exit_code, "usr_err": error_message, "usr_usage": format_usage(usage), "input_hash": case_input_hash(args)}
+    if write_results and ( args.results_db is None or args.export_files ):
+        write_usr_files(args, case_fields)
+    case_fields.update(shown_fields(args, score, params2str(args.args), str_details, str_details, f"Error message: {error_message}"))
+    if write_results:
+        write_case_results(args, case_fields)
+    return case_fields
+
+def record_skipped_case(args, str_details, elapsed_time=0, record_files=False, str_errors=""):
+    """
+    Results of the test case with the parsed arguments args of eval_r_func_args, skipped because the time budget ran out
+    (or not evaluated yet), without writing them. Skipped test cases score 0, and are evaluated again with --incremental.
+    With record_files, the .time, .exitcode, .usage, and .err files of the submission are written as if it was run.
+    """
+    usage = {"user": None, "sys": None, "maxrss_kb": None}
+    case_fields = {"usr_time": f"{elapsed_time:.2f}", "usr_exitcode": None, "usr_err": "", "usr_usage": format_usage(usage)}
+    if record_files:
+        write_usr_files(args, case_fields)
+    case_fields.update(shown_fields(args, "skipped", params2str(args.args), str_details, str_details, str_errors))
+    return case_fields
+
+def record_solution_failure(args, elapsed_time, exit_code, error_message, record_files=False):
+    """
+    Results of the test case with the parsed arguments args of eval_r_func_args, skipped without running the submission
+    because the solution failed (an error or a timeout), so that the submission is not graded against an empty or partial output.
+    """
+    if exit_code == 124:
+        str_details = f"SKIPPED: The solution was terminated at {elapsed_time:.2f}s, because it exceeded the limit {args.max_time}s, so the test case was not graded."
+    else:
+        str_details = f"SKIPPED: The solution returned an error, with exit code {exit_code}, so the test case was not graded."
+    case_fields = record_skipped_case(args, str_details, 0, record_files, f"Error message of the solution: {error_message}")
+    case_fields.update({"sol_time": f"{elapsed_time:.2f}", "sol_exitcode": exit_code, "sol_err": error_message})
+    return case_fields
 
+def output_limit(args, out_sol_prefix):
+    """
+    Output limit of the submission in megabytes: --max-output-mb, or OUTPUT_LIMIT_FACTOR times the size of the solution output
+    rounded up to a power of two times MIN_OUTPUT_LIMIT_MB (so that test cases with similar outputs share the fork servers started
+    with the same limits), or None if there is no solution output
+    """
+    if args.max_output_mb is not None:
+        return args.max_output_mb
+    if args.skip_solution or not os.path.exists(f"{out_sol_prefix}.out"):
+        return None
+    needed = os.path.getsize(f"{out_sol_prefix}.out") / 1024 / 1024 * OUTPUT_LIMIT_FACTOR
+    limit = MIN_OUTPUT_LIMIT_MB
+    while limit < needed:
+        limit *= 2
+    return limit
+
+def deadline_limit(args, max_time):
+    """
+    Time limit of a run starting now: max_time, or the time left until --deadline if shorter
+    """
+    if args.deadline is None:
+        return max_time
+    return min(max_time, round(args.deadline - time.time(), 2))
+
+@traced("eval_r_func_args")
+def evaluate_case(args, record_files=None):
+    """
+    Evaluate a test case with the parsed arguments args of eval_r_func_args, and return its results as a dict of
+    the fields stored by ResultsStore (see utils/store.py), without writing them.
+    record_files is whether the .time, .exitcode, .usage, and .err files of each side are kept (default: unless --results-db is given without --export-files).
+    """
     log_path = args.log_path if args.log_path is not None else f"{args.out_prefix}.log"
-    logger = create_custom_logger(__name__, log_path if args.log else None)
+    ## one logger per test case, so that test cases evaluated in parallel do not write to each other's log file,
+    ## and its log file is closed when the test case finishes
+    logger = create_custom_logger(f"{__name__}.{args.out_prefix.replace('.', '_')}", log_path if args.log else None)
+    try:
+        return evaluate_case_logged(args, record_files, logger)
+    finally:
+        close_custom_logger(logger)
+
+def evaluate_case_logged(args, record_files, logger):
+    """
+    Evaluate a test case as evaluate_case, writing the log messages to logger
+    """
 #    logger.info("Analysis Started")
 
     # write an R script to run the test
@@ -51,13 +285,106 @@ def eval_r_func_args(_args):
     else:
         logger.info(str_args)
 
+    ## the individual result files are not needed if the results are stored in the database
+    if record_files is None:
+        record_files = args.results_db is None or args.export_files
+    case_fields = {"input_hash": case_input_hash(args)}
+    arg_cache = ArgCache(args.arg_cache) if args.arg_cache is not None else None
+    scaling_sizes = [int(n) for n in args.scaling_sizes.split(",")] if args.scaling_sizes is not None else None
+    sol_scaling_times = None
+    budget_skip = "SKIPPED: The test case was not evaluated, because the time budget of the autograder ran out."
+    sol_limit = deadline_limit(args, args.max_time)
+    if sol_limit <= 0:
+        logger.info(budget_skip)
+        return record_skipped_case(args, budget_skip, 0, record_files)
+
     # logger.info(f"Writing the R scripts to evaluate the function {args.r_func}")
-    if ( not args.skip_solution ):
-        write_r_eval_func_script(args.r_func, out_sol_prefix, args.solution, args.args, args.digits, args.format, [args.preload_all, args.preload_sol])
-        (sol_elapsed_time, sol_exit_code, sol_error_message) = run_r_eval_script(out_sol_prefix, None)
+    if scaling_sizes is not None:
+        ## the running times are not cached, and the solution is timed on the same core as the submission
+        if ( not args.skip_solution and args.scaling_exponent is None ):
+            write_r_scaling_script(args.r_func, out_sol_prefix, args.solution, args.args, scaling_sizes, args.scaling_warmup, args.scaling_repeats, [args.preload_all, args.preload_sol])
+            (sol_elapsed_time, sol_exit_code, sol_error_message) = run_r_eval_script(out_sol_prefix, sol_limit, None, args.cpu_core, record_files)
+            sol_scaling_times = read_scaling_times(f"{out_sol_prefix}.out", scaling_sizes)
+            case_fields.update({"sol_time": f"{sol_elapsed_time:.2f}", "sol_exitcode": sol_exit_code, "sol_err": sol_error_message})
+    elif ( not args.skip_solution and not args.solution_precomputed ):
+        sol_preloads = [args.preload_all, args.preload_sol]
+        write_r_eval_func_script(args.r_func, out_sol_prefix, args.solution, args.args, args.digits, args.format, sol_preloads, args.fork_server, args.binary_output, args.stage_times, arg_cache)
+        sol_cache = SolutionCache(args.sol_cache, args.sol_cache_max_mb) if args.sol_cache is not None else None
+        sol_key = solution_cache_key(args.r_func, args.solution, args.args, args.digits, args.format, sol_preloads, args.binary_output) if sol_cache is not None else None
+        ((sol_elapsed_time, sol_exit_code, sol_error_message), sol_cache_hit) = run_cached_solution(sol_cache, sol_key, out_sol_prefix,
+                        lambda: run_r_eval_script(out_sol_prefix, sol_limit, r_source_scripts(args.solution, sol_preloads) if args.fork_server else None, args.cpu_core,
+                                                  record_files or sol_cache is not None),
+                "forked" if args.fork_server else "plain")
+        if sol_cache is not None:
+            logger.info(f"Solution cache {'hit' if sol_cache_hit else 'miss'}: {sol_key}")
+        case_fields.update({"sol_time": f"{sol_elapsed_time:.2f}", "sol_exitcode": sol_exit_code, "sol_err": sol_error_message})
 
-    write_r_eval_func_script(args.r_func, out_usr_prefix, args.submission, args.args, args.digits, args.format, [args.preload_all, args.preload_usr])
-    (usr_elapsed_time, usr_exit_code, usr_error_message) = run_r_eval_script(out_usr_prefix, args.max_time)
+    if case_fields.get("sol_exitcode") == 124 and sol_limit < args.max_time: ## stopped at the deadline rather than at the time limit
+        str_details = f"SKIPPED: The solution was stopped at {sol_elapsed_time:.2f}s, because the time budget of the autograder ran out, so the test case was not evaluated."
+        logger.info(str_details)
+        return record_skipped_case(args, str_details, sol_elapsed_time, record_files)
+    if args.solution_precomputed and scaling_sizes is None and not args.skip_solution:
+        sol_failure = read_precomputed_solution_failure(out_sol_prefix)
+        if sol_failure is not None:
+            (sol_elapsed_time, _) = read_precomputed_solution_time(out_sol_prefix)
+            case_fields.update({"sol_time": f"{sol_elapsed_time or 0:.2f}", "sol_exitcode": sol_failure[0], "sol_err": sol_failure[1]})
+    if case_fields.get("sol_exitcode") not in [None, 0]: ## the solution output is empty or partial, so the submission is not graded against it
+        logger.info(f"The solution failed with exit code {case_fields['sol_exitcode']}, so the test case was not graded\n{case_fields['sol_err']}")
+        return record_solution_failure(args, float(case_fields["sol_time"]), case_fields["sol_exitcode"], case_fields["sol_err"], record_files)
+
+    ## time limit of the submission, calibrated from the time of the solution if requested
+    max_time = args.max_time
+    time_limit = {"max_time": max_time}
+    if args.max_time_factor is not None and not args.skip_solution and ( scaling_sizes is None or sol_scaling_times is not None ):
+        ## without the fork server, the elapsed time includes starting R and sourcing the scripts, which is not scaled by the factor
+        forked = args.fork_server and scaling_sizes is None
+        precomputed = args.solution_precomputed and scaling_sizes is None
+        if scaling_sizes is None and read_timing_context(out_sol_prefix) != timing_context("batch" if precomputed else "forked" if forked else "plain"):
+            ## the solution time was measured on another machine or in another way (e.g. found in a solution cache filled elsewhere)
+            (sol_elapsed_time, sol_exit_code, sol_error_message) = retime_solution(args, out_sol_prefix, sol_limit, arg_cache)
+            case_fields.update({"sol_time": f"{sol_elapsed_time:.2f}", "sol_exitcode": sol_exit_code, "sol_err": sol_error_message})
+            logger.info(f"Timed the solution again on this machine to calibrate the time limit: {sol_elapsed_time:.2f}s")
+            if sol_exit_code == 124 and sol_limit < args.max_time:
+                str_details = f"SKIPPED: The solution was stopped at {sol_elapsed_time:.2f}s, because the time budget of the autograder ran out, so the test case was not evaluated."
+                logger.info(str_details)
+                return record_skipped_case(args, str_details, sol_elapsed_time, record_files)
+            if sol_exit_code != 0: ## its output was written again, and may be partial
+                return record_solution_failure(args, sol_elapsed_time, sol_exit_code, sol_error_message, record_files)
+            precomputed = False
+        overhead = 0 if forked else r_startup_overhead(args.r_func, args.solution, [args.preload_all, args.preload_sol], out_sol_prefix)
+        if precomputed: ## timed inside the batch script, after starting R
+            (sol_time, sol_ok) = read_precomputed_solution_time(out_sol_prefix)
+        else:
+            (sol_time, sol_ok) = (max(0.0, float(case_fields["sol_time"]) - overhead), int(case_fields["sol_exitcode"]) == 0)
+        if sol_ok:
+            max_time = adaptive_time_limit(sol_time, overhead, args.max_time_factor, args.max_time_floor)
+            time_limit = {"max_time": max_time, "solution_time": round(sol_time, 3), "overhead": round(overhead, 3),
+                          "factor": args.max_time_factor, "floor": args.max_time_floor}
+            logger.info(f"Time limit: {max_time}s, calibrated from the solution time {sol_time:.3f}s (with {overhead:.3f}s to start R)")
+        else:
+            logger.info(f"Time limit: {max_time}s, as the solution failed and could not be used to calibrate it")
+    case_fields["time_limit"] = json.dumps(time_limit)
+
+    usr_preloads = [args.preload_all, args.preload_usr]
+    if scaling_sizes is not None:
+        write_r_scaling_script(args.r_func, out_usr_prefix, args.submission, args.args, scaling_sizes, args.scaling_warmup, args.scaling_repeats, usr_preloads)
+    else:
+        write_r_eval_func_script(args.r_func, out_usr_prefix, args.submission, args.args, args.digits, args.format, usr_preloads, args.fork_server, args.binary_output, args.stage_times, arg_cache)
+    usr_limit = deadline_limit(args, max_time)
+    if usr_limit <= 0:
+        logger.info(budget_skip)
+        return record_skipped_case(args, budget_skip, 0, record_files)
+    usr_usage = {}
+    max_output = output_limit(args, out_sol_prefix)
+    (usr_elapsed_time, usr_exit_code, usr_error_message) = run_r_eval_script(out_usr_prefix, usr_limit,
+                        r_source_scripts(args.submission, usr_preloads) if args.fork_server and scaling_sizes is None else None, args.cpu_core, record_files,
+                        args.max_memory, args.max_cpu_time, usr_usage, max_output)
+    case_fields.update({"usr_time": f"{usr_elapsed_time:.2f}", "usr_exitcode": usr_exit_code, "usr_err": usr_error_message, "usr_usage": format_usage(usr_usage)})
+    usr_cpu_time = ( usr_usage.get("user") or 0 ) + ( usr_usage.get("sys") or 0 )
+    if usr_exit_code == 124 and usr_limit < max_time: ## stopped at the deadline rather than at the time limit
+        str_details = f"SKIPPED: The code was stopped at {usr_elapsed_time:.2f}s, before reaching the limit {max_time}s, because the time budget of the autograder ran out, so the test case was not graded."
+        logger.info(str_details)
+        return record_skipped_case(args, str_details, usr_elapsed_time, record_files)
 
     # Calculate score and handle errors
     str_details = ""
@@ -66,61 +393,100 @@ def eval_r_func_args(_args):
     if usr_exit_code != 0:
         if usr_exit_code == 124: ## timeout
             score = "timeout"
-            #logger.info(f"TIMEOUT: The code took {usr_elapsed_time}s, which exceeds the limit {args.max_time}s.")
-            str_details = f"TIMEOUT: The code returned a timeout error, terminated at {usr_elapsed_time}s, because it exceeded the limit {args.max_time}s."
-            str_diffs = f"TIMEOUT: The code returned a timeout error, terminated at {usr_elapsed_time}s, because it exceeded the limit {args.max_time}s."
+            #logger.info(f"TIMEOUT: The code took {usr_elapsed_time}s, which exceeds the limit {max_time}s.")
+            str_details = f"TIMEOUT: The code returned a timeout error, terminated at {usr_elapsed_time}s, because it exceeded the limit {max_time}s."
+            str_diffs = f"TIMEOUT: The code returned a timeout error, terminated at {usr_elapsed_time}s, because it exceeded the limit {max_time}s."
+        elif args.max_cpu_time is not None and ( usr_exit_code == 128 + 24 or ( usr_exit_code == 128 + 9 and usr_cpu_time >= args.max_cpu_time ) ): ## SIGXCPU or SIGKILL at the CPU time limit
+            score = "timeout"
+            str_details = f"TIMEOUT: The code was terminated after using {usr_cpu_time:.2f}s of CPU time, because it exceeded the CPU time limit {args.max_cpu_time}s."
+            str_diffs = str_details
         else: ## other errors
             score = "error"
             # Print or log the error message
-            str_details = f"ERROR: The code returned an error, with exit code {usr_exit_code}.\n"
+            if usr_exit_code == OUTPUT_LIMIT_EXIT_CODE:
+                str_details = f"ERROR: The code was terminated, because it printed or wrote more than {max_output}MB of output.\n"
+            elif args.max_memory is not None and ( "cannot allocate" in usr_error_message or usr_exit_code == 128 + 9 ):
+                str_details = f"ERROR: The code exceeded the memory limit of {args.max_memory}MB, with exit code {usr_exit_code}.\n"
+            else:
+                str_details = f"ERROR: The code returned an error, with exit code {usr_exit_code}.\n"
             str_errors = f"Error message: {usr_error_message}"
-    elif usr_elapsed_time < args.max_time:
-        if ( args.skip_solution ):
-            ## parse the usr output as a JSON file
-            with open(f"{args.out_prefix}.usr.out", 'r') as fusrout:
-                usrout = fusrout.read()
+    elif usr_elapsed_time < max_time:
+        if scaling_sizes is not None:
+            ## compare the growth of the running time with the input size, instead of the output
+            (score, str_details, scaling_summary) = score_scaling(scaling_sizes, read_scaling_times(f"{out_usr_prefix}.out", scaling_sizes), sol_scaling_times,
+                                                                  args.scaling_exponent, args.scaling_tolerance, args.scaling_points, args.scaling_penalty)
+            str_diffs = str_details
+            case_fields["scaling"] = json.dumps(scaling_summary)
+        elif ( args.skip_solution ):
+            ## parse the usr output as a JSON file, one element at a time
+            try:
+                usr_json = load_json_object(f"{args.out_prefix}.usr.out")
+                score = usr_json.get("score", "error")
                 try:
-                    usr_json = json.loads(usrout)
-                    score = usr_json.get("score", "error")
-                    try:
-                        fscore = float(score)
-                        if score < 0 or score > 10:
-                            score = "error"
-                            str_errors = f"Error message: The score {score} is not within the range [0, 1]"
-                    except ValueError as e:
+                    fscore = float(score)
+                    if score < 0 or score > 10:
                         score = "error"
-                        str_errors = f"Error message: The score {score} could not be converted to a numeric value"
-                    str_details = usr_json.get("details", "")
-                    str_diffs = usr_json.get("diffs", "")
-                except json.JSONDecodeError as e:
+                        str_errors = f"Error message: The score {score} is not within the range [0, 1]"
+                except ValueError as e:
                     score = "error"
-                    str_details = f"ERROR: The code returned an error in parsing the JSON output: {usrout}\n"
-                    str_errors = f"Error message: the output JSON file could not be parsed\n"
+                    str_errors = f"Error message: The score {score} could not be converted to a numeric value"
+                str_details = usr_json.get("details", "")
+                str_diffs = usr_json.get("diffs", "")
+            except ValueError as e:
+                score = "error"
+                with MappedOutput(f"{args.out_prefix}.usr.out") as usrout:
+                    str_details = f"ERROR: The code returned an error in parsing the JSON output: {usrout.preview(args.max_show_chars)}\n"
+                str_errors = f"Error message: the output JSON file could not be parsed\n"
         else:
-            ## compare if the output if identical
-            with open(f"{args.out_prefix}.sol.out", 'r') as fsolout:
-                with open(f"{args.out_prefix}.usr.out", 'r') as fusrout:
-                    solout = fsolout.read().strip()
-                    usrout = fusrout.read().strip()
-                    if solout == usrout:
-                        score = "pass"
-                        #logger.info(f"PASS: The code returned a correct output: {usrout}.")
-                        str_details = f"PASS: The code returned a correct output: {usrout}."
-                        str_diffs = f"PASS: The code returned the same output to the expected output."
-                    else:
-                        score = "incorrect"
-                        #logger.info(f"INCORRECT: The code returned an incorrect output")
-                        #logger.info(f"Expected output: {solout}")
-                        #logger.info(f"Observed output: {usrout}")
-
-                        str_details = f"INCORRECT: The code returned an incorrect output\nExpected output: {solout}\nObserved output: {usrout}"
-                        #str_diffs = f"INCORRECT: The code an incorrect output with the following diff\n" + show_diff_with_line_numbers(solout, usrout)
-                        str_diffs = f"INCORRECT: The code an incorrect output with the following diff (solution vs. submission)\n" + diff_files(f"{args.out_prefix}.sol.out", f"{args.out_prefix}.usr.out")
+            ## compare the numeric values with tolerance if requested, otherwise check if the output is identical
+            cmp_start_time = time.time()
+            (sol_out_path, usr_out_path) = (f"{args.out_prefix}.sol.out", f"{args.out_prefix}.usr.out")
+            (cmp_passed, cmp_message, mismatch) = (None, None, None)
+            if args.binary_output and ( is_binary_result(sol_out_path) or is_binary_result(usr_out_path) ):
+                if is_binary_result(sol_out_path):
+                    (cmp_passed, cmp_message) = compare_binary_results(sol_out_path, usr_out_path, args.digits, args.format, args.atol, args.rtol)
+                else:
+                    (cmp_passed, cmp_message) = (False, "The output is a numeric vector or matrix, but a different type was expected")
+                (solout, usrout) = (read_output_preview(sol_out_path), read_output_preview(usr_out_path))
+            else:
+                ## identical outputs pass without parsing them, even with tolerance or in any order
+                (same_output, solout, usrout, mismatch) = compare_outputs_exact(sol_out_path, usr_out_path, args.max_show_chars)
+                if not same_output and args.compare != "exact":
+                    (sol_out_path, usr_out_path) = canonicalize_outputs(sol_out_path, usr_out_path, args.compare, f"{args.out_prefix}.sol.cmp", f"{args.out_prefix}.usr.cmp")
+                    (same_output, solout, usrout, mismatch) = compare_outputs_exact(sol_out_path, usr_out_path, args.max_show_chars)
+                if not same_output and ( args.atol is not None or args.rtol is not None ):
+                    (cmp_passed, cmp_message) = compare_outputs_numeric(sol_out_path, usr_out_path,
+                                                                        args.atol if args.atol is not None else 0, args.rtol if args.rtol is not None else 0)
+                if cmp_passed is None:
+                    (cmp_passed, cmp_message) = (same_output, None)
+            if cmp_passed:
+                score = "pass"
+                #logger.info(f"PASS: The code returned a correct output: {usrout}.")
+                str_details = f"PASS: The code returned a correct output: {usrout}."
+                if args.atol is None and args.rtol is None:
+                    str_diffs = f"PASS: The code returned the same output to the expected output."
+                else:
+                    str_diffs = f"PASS: The code returned the expected output within the tolerance."
+            else:
+                score = "incorrect"
+                #logger.info(f"INCORRECT: The code returned an incorrect output")
+                #logger.info(f"Expected output: {solout}")
+                #logger.info(f"Observed output: {usrout}")
+
+                str_details = f"INCORRECT: The code returned an incorrect output\nExpected output: {solout}\nObserved output: {usrout}"
+                if mismatch is not None and mismatch["windowed"]:
+                    str_details = f"INCORRECT: The code returned an incorrect output, first differing at line {mismatch['line']}\nExpected output: {solout}\nObserved output: {usrout}"
+                if cmp_message is None:
+                    (start_offset, start_line) = (mismatch["offset"], mismatch["start_line"]) if mismatch["offset"] is not None else (0, 0)
+                    str_diffs = f"INCORRECT: The code an incorrect output with the following diff (solution vs. submission)\n" + diff_files(sol_out_path, usr_out_path, args.max_show_chars, args.diff_style, start_offset, start_line)
+                else:
+                    str_diffs = f"INCORRECT: The code returned an incorrect output. " + cmp_message
+            record_stage("comparison", time.time() - cmp_start_time, cmp_start_time)
     else: ## undetected timeout without error code.. does this ever happen?
         score = "timeout"
-        #logger.info(f"TIMEOUT: The code took {usr_elapsed_time}s, which exceeds the limit {args.max_time}s.")
-        str_details = f"TIMEOUT: The code took {usr_elapsed_time}s, which exceeds the limit {args.max_time}s."
-        str_diffs = f"TIMEOUT: The code took {usr_elapsed_time}s, which exceeds the limit {args.max_time}s."
+        #logger.info(f"TIMEOUT: The code took {usr_elapsed_time}s, which exceeds the limit {max_time}s.")
+        str_details = f"TIMEOUT: The code took {usr_elapsed_time}s, which exceeds the limit {max_time}s."
+        str_diffs = f"TIMEOUT: The code took {usr_elapsed_time}s, which exceeds the limit {max_time}s."
 
     ## print log messages to the autograder output (hidden from students)
     if len(str_details) > 0:
@@ -139,50 +505,16 @@ def eval_r_func_args(_args):
         else:
             logger.info(str_errors)
 
-    with open(f"{args.out_prefix}.score", 'w') as fscore:
-        fscore.write(f"{score}\n")
-    
-    ## write the input arguments to the output file
-    with open(f"{args.out_prefix}.args", 'w') as fargs:
-        if ( len(str_args) > args.max_show_chars ):
-            fargs.write(str_args[0:args.max_show_chars])
-            fargs.write("\n")
-            fargs.write("... (truncated)\n")
-        else:
-            fargs.write(str_args)
-            fargs.write("\n")
-    
-    ## write the detailed output to the output file
-    with open(f"{args.out_prefix}.details", 'w') as fdetails:
-        if ( len(str_details) > args.max_show_chars ):
-            fdetails.write(str_details[0:args.max_show_chars])
-            fdetails.write("\n")
-            fdetails.write("... (truncated)\n")
-        else:
-            fdetails.write(str_details)
-            fdetails.write("\n")
-
-    with open(f"{args.out_prefix}.diffs", 'w') as fdiffs:
-        if ( len(str_diffs) > args.max_show_chars ):
-            fdiffs.write(str_diffs[0:args.max_show_chars])
-            fdiffs.write("\n")
-            fdiffs.write("... (truncated)\n")
-        else:
-            fdiffs.write(str_diffs)
-            fdiffs.write("\n")
-
-    ## write the detailed errors to the output file
-    with open(f"{args.out_prefix}.errors", 'w') as ferrors:
-        if ( len(str_errors) > args.max_show_chars ):
-            ferrors.write(str_errors[0:args.max_show_chars])
-            ferrors.write("\n")
-            ferrors.write("... (truncated)\n")
-        else:
-            ferrors.write(str_errors)
-            ferrors.write("\n")
+#    logger.info(f"Analysis finished with the final score: {score} and elapsed time: {usr_elapsed_time:.3f}s")
+    case_fields.update(shown_fields(args, score, str_args, str_details, str_diffs, str_errors))
+    return case_fields
 
+def eval_r_func_args(_args):
+    # parse argument
+    args=parse_arguments(_args)
 
-#    logger.info(f"Analysis finished with the final score: {score} and elapsed time: {usr_elapsed_time:.3f}s")
+    case_fields = evaluate_case(args)
+    write_case_results(args, case_fields)
 
 if __name__ == "__main__":
     # Get the base file name without extension
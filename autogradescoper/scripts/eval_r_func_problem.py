@@ -1,8 +1,16 @@
-import sys, os, gzip, argparse, logging, warnings, shutil, subprocess, ast, json, time
+import sys, os, gzip, argparse, logging, warnings, shutil, subprocess, ast, json, time, functools
 
-from autogradescoper.utils.utils import get_func, create_custom_logger, load_file_to_dict, write_dict_to_file, write_r_eval_func_script, run_r_eval_script
+from autogradescoper.utils.utils import get_func, create_custom_logger, load_file_to_dict, write_dict_to_file, write_r_eval_func_script, write_r_eval_batch_script, write_r_precheck_script, run_r_eval_script, run_parallel, parse_usage, r_source_scripts, parser_defaults, default_namespace
+from autogradescoper.utils.solcache import SolutionCache, solution_cache_key, cache_stats, CACHED_SUFFIXES, write_timing_context
+from autogradescoper.utils.store import ResultsStore, read_case_files
+from autogradescoper.utils.stages import start_tracing, add_span, write_trace, span
+from autogradescoper.utils.argcache import ArgCache
+from autogradescoper.utils.timeouts import r_startup_overhead
+from autogradescoper.utils.compare import COMPARE_MODES
+from autogradescoper.utils.problem import TestCase
+from autogradescoper.scripts.eval_r_func_args import default_arguments as default_case_arguments, evaluate_case, write_case_results, record_precheck_failure, case_input_hash, MIN_OUTPUT_LIMIT_MB
 
-def parse_arguments(_args):
+def argument_parser():
     repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 
     parser = argparse.ArgumentParser(prog=f"autogradescoper eval_r_func_problem", description="Automatic grading of a single R function for a set of parameters")
@@ -24,100 +32,349 @@ def parse_arguments(_args):
     key_params.add_argument('--preload-sol', type=str, help='Solution R script to load before the R function')
     key_params.add_argument('--preload-all', type=str, default=f"{repo_dir}/assets/autogradescoper_utils.R", help='For all cases, load this R script before the R function')
     key_params.add_argument('--default-maxtime', type=int, default=10, help='Maximum time in seconds to run the R function')
+    key_params.add_argument('--default-maxtime-factor', type=float, help='Time limit of the submission as a multiple of the time of the solution, measured on this machine (can be overridden by "maxtime_factor" of each test case)')
+    key_params.add_argument('--default-maxtime-floor', type=float, default=1, help='Seconds added to the time limit calibrated with --default-maxtime-factor (can be overridden by "maxtime_floor" of each test case)')
+    key_params.add_argument('--default-maxmemory', type=float, help='Maximum memory in megabytes for the R process running the submission (can be overridden by "maxmemory" of each test case)')
+    key_params.add_argument('--default-maxcputime', type=float, help='Maximum CPU time in seconds for the R process running the submission (can be overridden by "maxcputime" of each test case)')
+    key_params.add_argument('--default-maxoutput', type=float, help='Maximum size in megabytes of the printed output and of each file written by the R process running the submission (can be overridden by "maxoutput" of each test case). Default: derived from the size of the solution output (see eval_r_func_args --max-output-mb)')
     key_params.add_argument('--show-args', action='store_true', default=False, help='Show the arguments to user output')
     key_params.add_argument('--show-details', action='store_true', default=False, help='Show the correct and incorrect output to user output')
     key_params.add_argument('--show-diffs', action='store_true', default=False, help='Show the difference between correct and incorrect output')
     key_params.add_argument('--show-errors', action='store_true', default=False, help='Show the detailed errors to user output')
+    key_params.add_argument('--fork-server', action='store_true', default=False, help='Source the preload scripts and R file once per problem, and fork it for each test case')
+    key_params.add_argument('--sol-cache', type=str, help='Directory of the persistent cache of solution outputs (see autogradescoper cache_r_func_solutions)')
+    key_params.add_argument('--sol-cache-max-mb', type=float, help='Maximum size of the solution cache in megabytes. Least recently used outputs are evicted')
+    key_params.add_argument('--jobs', type=int, help='Number of test cases to evaluate in parallel (default: number of available cores)')
+    key_params.add_argument('--pin-cores', action='store_true', default=False, help='Pin each parallel test case to its own CPU core, so that parallel runs do not distort the measured time')
+    key_params.add_argument('--no-precheck', action='store_true', default=False, help='Do not check that the submitted file can be sourced and defines the R function before running the test cases')
+    key_params.add_argument('--incremental', action='store_true', default=False, help='Reuse the stored results of the test cases whose inputs (submitted and solution files, args and data files, preload scripts, and options) are unchanged since the last run with the same --out-prefix')
+    key_params.add_argument('--batch-solution', action='store_true', default=False, help='Evaluate the solution for all test cases in a single R process before evaluating the submission')
+    key_params.add_argument('--atol', type=float, help='Absolute tolerance to compare numeric outputs (can be overridden by "atol" of each test case)')
+    key_params.add_argument('--rtol', type=float, help='Relative tolerance to compare numeric outputs (can be overridden by "rtol" of each test case)')
+    key_params.add_argument('--compare', type=str, default="exact", choices=COMPARE_MODES, help='How to compare the outputs: exact, sort-rows, set-rows, or sort-keys (can be overridden by "compare" of each test case)')
+    key_params.add_argument('--diff-style', type=str, default="normal", choices=["normal", "side-by-side"], help='Format of the differences shown with --show-diffs: same as `diff` (normal), or side by side with line numbers')
+    key_params.add_argument('--binary-output', action='store_true', default=False, help='Write numeric vectors and matrices in a binary format, and compare them without text formatting')
+    key_params.add_argument('--results-db', type=str, help='SQLite database to store the results of the test cases in, instead of individual files per test case')
+    key_params.add_argument('--export-files', action='store_true', default=False, help='With --results-db, also write the results of each test case to individual files (e.g. for debugging)')
+    key_params.add_argument('--arg-cache', type=str, help='Directory of the input arguments compiled by compile_r_func_args')
+    key_params.add_argument('--stage-times', action='store_true', default=False, help='Write timestamps in the R scripts to measure the time spent in each stage inside R')
+    key_params.add_argument('--trace', action='store_true', default=False, help='Record the time spent in each step (including the stages inside R) as a Chrome trace event file {out_prefix}.trace.json')
+
+    return parser
+
+## default values of the arguments, to build them in Python (e.g. from a Problem and its TestCase) without parsing a command line
+ARGUMENT_DEFAULTS = parser_defaults(argument_parser())
+
+def default_arguments(**values):
+    """
+    Arguments of eval_r_func_problem with the default values replaced by the given values
+    """
+    return default_namespace(ARGUMENT_DEFAULTS, values)
 
+def parse_arguments(_args):
+    parser = argument_parser()
     if len(_args) == 0:
         parser.print_help()
         sys.exit(1)
 
     return parser.parse_args(_args)
 
-def eval_r_func_problem(_args):
-    # parse argument
-    args=parse_arguments(_args)
+def case_arguments(args, i, v, **values):
+    """
+    Arguments of eval_r_func_args for the i-th test case v (a TestCase) of the problem, with the other given values (e.g. cpu_core, deadline)
+    """
+    return default_case_arguments(
+        r_func=args.r_func, solution=args.solution, submission=args.submission, args=v.args, out_prefix=f"{args.out_prefix}.{i}",
+        max_time=v.get("maxtime", args.default_maxtime),
+        max_time_factor=v.get("maxtime_factor", args.default_maxtime_factor),
+        max_time_floor=v.get("maxtime_floor", args.default_maxtime_floor),
+        max_memory=v.get("maxmemory", args.default_maxmemory),
+        max_cpu_time=v.get("maxcputime", args.default_maxcputime),
+        max_output_mb=v.get("maxoutput", args.default_maxoutput),
+        digits=args.digits, format=args.format,
+        preload_usr=args.preload_usr, preload_sol=args.preload_sol, preload_all=args.preload_all,
+        skip_solution=args.skip_solution, fork_server=args.fork_server,
+        sol_cache=args.sol_cache, sol_cache_max_mb=args.sol_cache_max_mb, solution_precomputed=args.batch_solution,
+        diff_style=args.diff_style, binary_output=args.binary_output, results_db=args.results_db, export_files=args.export_files,
+        stage_times=args.stage_times, arg_cache=args.arg_cache,
+        atol=v.get("atol", args.atol), rtol=v.get("rtol", args.rtol), compare=v.get("compare", args.compare),
+        log=args.log, **(scaling_arguments(v.scaling) if v.scaling is not None else {}), **values)
 
-    log_path = f"{args.out_prefix}.log"
-    logger = create_custom_logger(__name__, log_path if args.log else None)
-#    logger.info("Analysis Started")
+def scaling_arguments(scaling):
+    """
+    Arguments of eval_r_func_args for the "scaling" attribute of a test case
+    """
+    return {"scaling_sizes": ",".join([str(n) for n in scaling["sizes"]]),
+            "scaling_warmup": scaling.get("warmup", 1),
+            "scaling_repeats": scaling.get("repeats", 3),
+            "scaling_tolerance": scaling.get("tolerance", 0.25),
+            "scaling_exponent": scaling.get("exponent"),
+            "scaling_points": scaling.get("points", 1),
+            "scaling_penalty": scaling.get("penalty", 0)}
 
-    ## read the config file
-#    logger.info(f"Reading the config file: {args.config}")
-    config = load_file_to_dict(args.config)
+def run_batch_solution(args, config, logger, indices=None, deadline=None):
+    """
+    Evaluate the solution for all test cases (or those with the indices, except for those found in the solution cache) in a single R process,
+    writing {out_prefix}.{i}.sol.out, .time, .exitcode and .err in the same way as eval_r_func_args.
+    With a deadline (in seconds since the epoch), the R process is stopped at the deadline if it has not finished.
+    """
+    if args.skip_solution:
+        return
+    sol_preloads = [args.preload_all, args.preload_sol]
+    sol_cache = SolutionCache(args.sol_cache, args.sol_cache_max_mb) if args.sol_cache is not None else None
+    pending = []
+    for i, v in enumerate(config):
+        if v.scaling is not None or ( indices is not None and i not in indices ): ## the solution of a scaling test case is timed by eval_r_func_args
+            continue
+        out_sol_prefix = f"{args.out_prefix}.{i}.sol"
+        sol_key = None
+        if sol_cache is not None:
+            sol_key = solution_cache_key(args.r_func, args.solution, v.args, args.digits, args.format, sol_preloads, args.binary_output)
+            if sol_cache.lookup(sol_key, out_sol_prefix) is not None:
+                continue
+        for suffix in CACHED_SUFFIXES: ## remove stale outputs from an earlier run
+            if os.path.exists(f"{out_sol_prefix}.{suffix}"):
+                os.remove(f"{out_sol_prefix}.{suffix}")
+        pending.append((out_sol_prefix, v.args, sol_key, v.get("maxtime", args.default_maxtime)))
+    if len(pending) == 0:
+        return
 
-    n_config = len(config)
-    max_score = 0
+    batch_prefix = f"{args.out_prefix}.sol"
+    logger.info(f"Evaluating the solution for {len(pending)} test case(s) in a single R process")
+    write_r_eval_batch_script(args.r_func, batch_prefix, [p[0] for p in pending], args.solution, [p[1] for p in pending], args.digits, args.format, sol_preloads, args.binary_output,
+                              ArgCache(args.arg_cache) if args.arg_cache is not None else None)
+    max_time = sum([p[3] for p in pending])
+    (elapsed_time, exit_code, error_message) = run_r_eval_script(batch_prefix, max_time if deadline is None else max(0, min(max_time, deadline - time.time())))
+    logger.info(f"Finished evaluating the solution in {elapsed_time:.2f}s")
+
+    for (out_sol_prefix, argval, sol_key, max_time) in pending:
+        if not os.path.exists(f"{out_sol_prefix}.exitcode"): ## the batch script failed before reaching this test case
+            open(f"{out_sol_prefix}.out", 'w').close()
+            with open(f"{out_sol_prefix}.exitcode", 'w') as fexit:
+                fexit.write(f"{exit_code if exit_code != 0 else 1}\n")
+            with open(f"{out_sol_prefix}.err", 'w') as ferr:
+                ferr.write(error_message)
+        else:
+            write_timing_context(out_sol_prefix, "batch")
+            if sol_cache is not None:
+                with open(f"{out_sol_prefix}.exitcode", 'r') as fexit:
+                    if fexit.read().strip() == "0":
+                        sol_cache.store(sol_key, out_sol_prefix)
+
+def measure_startup_overheads(args, config, indices=None):
+    """
+    Measure the time to start R for the solution (see r_startup_overhead() in utils/timeouts.py) before the test cases
+    with the indices are evaluated in parallel, if any of them calibrates its time limit from the time of the solution without the fork server
+    """
+    if args.skip_solution:
+        return
     for i, v in enumerate(config):
-        argval= v["args"]
-        maxtime = v.get("maxtime", args.default_maxtime)
-        max_score += v.get("maxscore", 1)
+        if indices is not None and i not in indices:
+            continue
+        if v.get("maxtime_factor", args.default_maxtime_factor) is not None and ( not args.fork_server or v.scaling is not None ):
+            r_startup_overhead(args.r_func, args.solution, [args.preload_all, args.preload_sol], f"{args.out_prefix}.sol")
+            return
 
-        logger.info("====================================================================")
-        logger.info(f"Evaluating the test case {i+1}/{n_config}:")
-        logger.info("====================================================================")
+def evaluate_problem_case(args, i, v, core=None, write_results=True, deadline=None):
+    """
+    Evaluate the i-th test case v of the problem in this process, and return its results (see evaluate_case() in eval_r_func_args).
+    With write_results, the results are also written to the results database and/or the individual files.
+    With a deadline (in seconds since the epoch), the test case is skipped if it cannot finish by then (see --deadline of eval_r_func_args).
+    """
+    case_args = case_arguments(args, i, v, cpu_core=core, deadline=deadline)
+    case_fields = evaluate_case(case_args, None if write_results else False)
+    if write_results:
+        write_case_results(case_args, case_fields)
+    return case_fields
 
-        get_func("eval_r_func_args")(  
-                        ["--r-func", args.r_func] +
-                        ["--solution", args.solution] +
-                        ["--args", argval] +
-                        ["--out-prefix", f"{args.out_prefix}.{i}"] +
-                        ["--max-time", str(maxtime)] +
-                        ["--digits", str(args.digits)] +
-                        ["--format", args.format] +
-                        ["--submission", args.submission] +
-                        (["--preload-usr", args.preload_usr] if args.preload_usr is not None else []) +
-                        (["--preload-sol", args.preload_sol] if args.preload_sol is not None else []) +
-                        (["--preload-all", args.preload_all] if args.preload_all is not None else []) +
-                        (["--skip-solution"] if args.skip_solution else []) +
-                        (["--log"] if args.log else []))                
+def precheck_submission(args, config, logger, cpu_core=None, write_results=True, indices=None, deadline=None):
+    """
+    Source the submitted file once with the same preload scripts, and check that it defines the R function.
+    Returns None if it does. Otherwise, all test cases (or those with the indices) fail with the same error without running them,
+    and their results are returned as a dict of output prefix to fields (also written with write_results).
+    With a deadline (in seconds since the epoch), the check is stopped at the deadline, and counted as passed if it did not finish because of it
+    (the test cases are then skipped).
+    """
+    if indices is None:
+        indices = range(len(config))
+    check_prefix = f"{args.out_prefix}.precheck"
+    usr_preloads = [args.preload_all, args.preload_usr]
+    write_r_precheck_script(args.r_func, check_prefix, args.submission, usr_preloads, args.fork_server)
+    max_time = max([config[i].get("maxtime", args.default_maxtime) for i in indices], default=args.default_maxtime)
+    check_time = max_time if deadline is None else max(0, min(max_time, deadline - time.time()))
+    (elapsed_time, exit_code, error_message) = run_r_eval_script(check_prefix, check_time,
+                        r_source_scripts(args.submission, usr_preloads) if args.fork_server else None, cpu_core, False,
+                        args.default_maxmemory, args.default_maxcputime, None, args.default_maxoutput if args.default_maxoutput is not None else MIN_OUTPUT_LIMIT_MB)
+    if exit_code == 0 or ( exit_code == 124 and check_time < max_time ):
+        return None
+    logger.info(f"The submitted file {args.submission} could not be loaded (exit code {exit_code}), so its {len(indices)} test case(s) are not run\n{error_message}")
+    return {f"{args.out_prefix}.{i}": record_precheck_failure(case_arguments(args, i, config[i]), elapsed_time, exit_code, error_message, write_results)
+            for i in indices}
 
-    ## collect the results and store into a single output file
+def load_case_results(args, config):
+    """
+    Results of the test cases as a dict of output prefix to fields, from the results database (in a single query) or the output files
+    """
+    prefixes = [f"{args.out_prefix}.{i}" for i in range(len(config))]
+    if args.results_db is not None:
+        return ResultsStore(args.results_db).load_cases(prefixes)
+    return {prefix: read_case_files(prefix) for prefix in prefixes}
+
+def up_to_date_results(args, config, stored_results=None):
+    """
+    Stored results of the test cases whose input hash (see case_input_hash() in eval_r_func_args) is unchanged, as a dict of output prefix to fields.
+    stored_results is a dict of output prefix to fields, loaded by load_case_results() if not given.
+    """
+    if stored_results is None:
+        stored_results = load_case_results(args, config)
+    results = {}
+    for i, v in enumerate(config):
+        fields = stored_results.get(f"{args.out_prefix}.{i}")
+        if fields is None or fields.get("input_hash") is None or fields.get("score") is None:
+            continue
+        if fields["input_hash"] == case_input_hash(case_arguments(args, i, v)):
+            results[f"{args.out_prefix}.{i}"] = fields
+    return results
+
+def collect_problem_results(args, config, case_results=None):
+    """
+    Collect the results of the test cases, in the order of the config (the list of TestCase of the problem).
+    case_results is a dict of output prefix to fields, loaded by load_case_results() if not given.
+    """
+    if case_results is None:
+        case_results = load_case_results(args, config)
     outdict = {}
+    max_score = 0
     sum_scores = 0
     sum_elapsed = 0
+    sum_cpu_time = 0
+    peak_memory_kb = 0
+    resources = []
+    scaling = []
     out_strs = []
     for i, v in enumerate(config):
-        with open(f"{args.out_prefix}.{i}.usr.time", 'r') as ftime:
-            elapsed = ftime.read().strip()
+        max_score += v.get("maxscore", 1)
+        fields = case_results.get(f"{args.out_prefix}.{i}")
+        if fields is None or fields["score"] is None:
+            raise ValueError(f"No results were found for the test case {args.out_prefix}.{i}")
+        elapsed = fields["usr_time"]
+        if fields.get("scaling") is not None: ## the repeated calls of a scaling test case are not counted in the total time
+            scaling.append(dict(json.loads(fields["scaling"]), case=i+1))
+        else:
             sum_elapsed += float(elapsed)
 
-        with open(f"{args.out_prefix}.{i}.score", 'r') as fscore:
-            score = fscore.read().strip()
-            if score == "pass":
-                sum_scores += 1
-            else:
-                try:
-                    fscore = float(score)
-                    sum_scores += fscore
-                except ValueError:
-                    pass
+        usage = parse_usage(fields.get("usr_usage"))
+        sum_cpu_time += ( usage["user"] or 0 ) + ( usage["sys"] or 0 )
+        peak_memory_kb = max(peak_memory_kb, usage["maxrss_kb"] or 0)
+        resources.append({"cpu_user": usage["user"], "cpu_sys": usage["sys"],
+                          "peak_memory_mb": None if usage["maxrss_kb"] is None else round(usage["maxrss_kb"] / 1024, 1),
+                          "max_memory_mb": v.get("maxmemory", args.default_maxmemory), "max_cpu_time": v.get("maxcputime", args.default_maxcputime)})
+        ## the time limit actually applied, with how it was calibrated from the solution if it was
+        time_limit = json.loads(fields["time_limit"]) if fields.get("time_limit") is not None else {"max_time": v.get("maxtime", args.default_maxtime)}
+        resources[-1]["max_time"] = time_limit.pop("max_time")
+        if len(time_limit) > 0:
+            resources[-1]["max_time_calibration"] = time_limit
+
+        score = fields["score"]
+        if score == "pass":
+            sum_scores += 1
+        else:
+            try:
+                fscore = float(score)
+                sum_scores += fscore
+            except ValueError:
+                pass
         #out_strs.append(f"Case {i+1}: {score} in {elapsed}s")
         out_str = f"Case {i+1}: {score} in {elapsed}s\n"
         if args.show_args:
-            with open(f"{args.out_prefix}.{i}.args", 'r') as fargs:
-                out_str += f"-----------------------------\n{fargs.read()}"
+            out_str += f"-----------------------------\n{fields['args']}"
         if args.show_details:
-            with open(f"{args.out_prefix}.{i}.details", 'r') as fdetails:
-                out_str += f"-----------------------------\n{fdetails.read()}"
+            out_str += f"-----------------------------\n{fields['details']}"
         if args.show_diffs:
-            with open(f"{args.out_prefix}.{i}.diffs", 'r') as fdiffs:
-                out_str += f"-----------------------------\n{fdiffs.read()}"
+            out_str += f"-----------------------------\n{fields['diffs']}"
         if args.show_errors:
-            with open(f"{args.out_prefix}.{i}.errors", 'r') as ferrors:
-                out_str += f"-----------------------------\n{ferrors.read()}"
+            out_str += f"-----------------------------\n{fields['errors']}"
         out_strs.append(out_str)
     outdict["score"] = sum_scores
     outdict["elapsed"] = sum_elapsed
+    outdict["cpu_time"] = round(sum_cpu_time, 3)
+    outdict["peak_memory_mb"] = round(peak_memory_kb / 1024, 1)
+    outdict["resources"] = resources
+    if len(scaling) > 0:
+        outdict["scaling"] = scaling
     outdict["max_score"] = max_score
     outdict["name"] = args.filename
     outdict["name_format"] = "text"
     outdict["output"] = f"Score: {sum_scores}/{max_score}\nTotal elapsed time: {sum_elapsed:.3f}s\n================================\nTest Cases:\n================================\n" + "================================\n".join(out_strs) + "\n"
+    return outdict
+
+def eval_r_func_problem(_args):
+    # parse argument
+    args=parse_arguments(_args)
+    start_time = time.time()
+    if args.trace:
+        start_tracing()
+        args.stage_times = True
+
+    log_path = f"{args.out_prefix}.log"
+    logger = create_custom_logger(__name__, log_path if args.log else None)
+#    logger.info("Analysis Started")
+
+    ## read the config file
+#    logger.info(f"Reading the config file: {args.config}")
+    config = TestCase.load_all(args.config)
+
+    n_config = len(config)
+    (cache_hits, cache_misses) = (cache_stats["hits"], cache_stats["misses"])
+
+    def run_case(i, v, core):
+        logger.info("====================================================================")
+        logger.info(f"Evaluating the test case {i+1}/{n_config}:")
+        logger.info("====================================================================")
+
+        return evaluate_problem_case(args, i, v, core)
+
+    if args.results_db is not None: ## create the database before the test cases write to it in parallel
+        ResultsStore(args.results_db)
+
+    ## only the test cases whose inputs changed since the last run are evaluated again
+    case_results = {}
+    if args.incremental:
+        case_results = up_to_date_results(args, config)
+        logger.info(f"Reusing the results of {len(case_results)}/{n_config} test case(s) with unchanged inputs")
+    pending = [i for i in range(n_config) if f"{args.out_prefix}.{i}" not in case_results]
+
+    ## a submitted file that cannot be loaded fails all test cases in the same way, so check it once
+    failures = None
+    if not args.no_precheck and len(pending) > 0:
+        with span("precheck_submission", problem=args.filename):
+            failures = precheck_submission(args, config, logger, indices=pending)
+
+    if failures is not None:
+        case_results.update(failures)
+    elif len(pending) > 0:
+        if args.batch_solution:
+            with span("run_batch_solution", problem=args.filename):
+                run_batch_solution(args, config, logger, pending)
+
+        ## test cases are independent, so they can be evaluated in parallel
+        measure_startup_overheads(args, config, pending)
+        case_fields = run_parallel([functools.partial(run_case, i, config[i]) for i in pending], args.jobs, args.pin_cores)
+        case_results.update({f"{args.out_prefix}.{i}": fields for (i, fields) in zip(pending, case_fields)})
+
+    if args.sol_cache is not None:
+        logger.info(f"Solution cache: {cache_stats['hits']-cache_hits} hits, {cache_stats['misses']-cache_misses} misses")
+
+    ## collect the results and store into a single output file
+    outdict = collect_problem_results(args, config, case_results)
 
     ## write the output to a file
 #    logger.info(f"Writing the evaluation output to {args.out_prefix}.json")
     write_dict_to_file(outdict, f"{args.out_prefix}.json")
+
+    if args.trace:
+        add_span("eval_r_func_problem", start_time, time.time(), {"problem": args.filename})
+        write_trace(f"{args.out_prefix}.trace.json")
         
 #    logger.info(f"Analysis finished")
 
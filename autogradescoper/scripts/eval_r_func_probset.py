@@ -1,8 +1,18 @@
-import sys, os, gzip, argparse, logging, warnings, shutil, subprocess, ast, json, time
+import sys, os, gzip, argparse, logging, warnings, shutil, subprocess, ast, json, time, functools
 
-from autogradescoper.utils.utils import get_func, create_custom_logger, load_file_to_dict, write_dict_to_file, write_r_eval_func_script, run_r_eval_script
+from collections import ChainMap
 
-def parse_arguments(_args):
+from autogradescoper.utils.utils import get_func, create_custom_logger, load_file_to_dict, write_dict_to_file, write_r_eval_func_script, run_r_eval_script, run_parallel, available_cores, parser_defaults, default_namespace
+from autogradescoper.utils.problem import Problem
+from autogradescoper.scripts.eval_r_func_problem import default_arguments as default_problem_arguments, ARGUMENT_DEFAULTS as PROBLEM_ARGUMENT_DEFAULTS, case_arguments, collect_problem_results, run_batch_solution, precheck_submission, evaluate_problem_case, up_to_date_results, measure_startup_overheads
+from autogradescoper.scripts.eval_r_func_args import record_skipped_case
+from autogradescoper.utils.budget import TimeBudget
+from autogradescoper.utils.progress import ProgressWriter, replace_dict_file
+from autogradescoper.utils.solcache import cache_stats
+from autogradescoper.utils.store import ResultsStore
+from autogradescoper.utils.stages import stage, span, start_tracing, add_span, write_trace
+
+def argument_parser():
     repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 
     parser = argparse.ArgumentParser(prog=f"autogradescoper eval_r_func_probset", description="Automatic grading of multiple problem sets implementing R functions")
@@ -20,74 +30,108 @@ def parse_arguments(_args):
     key_params.add_argument('--show-diffs', action='store_true', default=False, help='Show the differences between correct and incorrect output')
     key_params.add_argument('--show-errors', action='store_true', default=False, help='Show the detailed errors to user output')
     key_params.add_argument('--skip-solution', action='store_true', default=False, help='Ignore the solution, and parse the output as a JSON file. "score" and "details" are key attributes')
+    key_params.add_argument('--fork-server', action='store_true', default=False, help='Source the preload scripts and R file once per problem, and fork it for each test case')
+    key_params.add_argument('--sol-cache', type=str, help='Directory of the persistent cache of solution outputs (see autogradescoper cache_r_func_solutions)')
+    key_params.add_argument('--sol-cache-max-mb', type=float, help='Maximum size of the solution cache in megabytes. Least recently used outputs are evicted')
+    key_params.add_argument('--jobs', type=int, help='Number of test cases to evaluate in parallel (default: number of available cores)')
+    key_params.add_argument('--pin-cores', action='store_true', default=False, help='Pin each parallel test case to its own CPU core, so that parallel runs do not distort the measured time')
+    key_params.add_argument('--runtime-history', type=str, help='JSON file of the time spent on each test case in earlier runs, used to evaluate the slowest test cases first. Updated after each run')
+    key_params.add_argument('--no-precheck', action='store_true', default=False, help='Do not check that each submitted file can be sourced and defines the R function before running its test cases')
+    key_params.add_argument('--incremental', action='store_true', default=False, help='Reuse the results stored in the results database for the test cases whose inputs (submitted and solution files, args and data files, preload scripts, and options) are unchanged since the last run. results.json is the same as when all test cases are evaluated again')
+    key_params.add_argument('--batch-solution', action='store_true', default=False, help='Evaluate the solution for all test cases of each problem in a single R process before evaluating the submissions')
+    key_params.add_argument('--time-budget', type=float, help='Total time in seconds for grading the submission, e.g. somewhat less than the timeout of the autograder. The remaining time is shared by the test cases not started yet in proportion to their expected time, and those that cannot be evaluated within it are reported as skipped')
+    key_params.add_argument('--diff-style', type=str, default="normal", choices=["normal", "side-by-side"], help='Format of the differences shown with --show-diffs: same as `diff` (normal), or side by side with line numbers')
+    key_params.add_argument('--binary-output', action='store_true', default=False, help='For all problems, write numeric vectors and matrices in a binary format, and compare them without text formatting')
+    key_params.add_argument('--memory-leaderboard', action='store_true', default=False, help='Add the peak memory of the submissions to the leaderboard')
+    key_params.add_argument('--results-db', type=str, help='SQLite database to store the results of all test cases in (default: {out_prefix}.db)')
+    key_params.add_argument('--arg-cache', type=str, help='Directory of the input arguments compiled by compile_r_func_args (e.g. in setup.sh)')
+    key_params.add_argument('--stage-times', action='store_true', default=False, help='Write timestamps in the R scripts to measure the time spent in each stage inside R')
+    key_params.add_argument('--trace', action='store_true', default=False, help='Record the time spent in each step (including the stages inside R) as a Chrome trace event file {out_prefix}.trace.json, next to {out_prefix}.json')
+    key_params.add_argument('--export-files', action='store_true', default=False, help='Also write the results of each test case to individual files ({out_prefix}.{filename}.{i}.score, .details, ...), e.g. for debugging')
+
+    return parser
 
+## default values of the arguments, to build them in Python (e.g. from a Problem and its TestCase) without parsing a command line
+ARGUMENT_DEFAULTS = parser_defaults(argument_parser())
+
+def default_arguments(**values):
+    """
+    Arguments of eval_r_func_probset with the default values replaced by the given values
+    """
+    return default_namespace(ARGUMENT_DEFAULTS, values)
+
+def parse_arguments(_args):
+    parser = argument_parser()
     if len(_args) == 0:
         parser.print_help()
         sys.exit(1)
 
     return parser.parse_args(_args)
 
-def eval_r_func_probset(_args):
-    # parse argument
-    args=parse_arguments(_args)
+def problem_arguments(args, problem, submission=None):
+    """
+    Arguments of eval_r_func_problem for the Problem, graded against the submitted R file (default: {submission_dir}/{filename}.R)
+    """
+    return default_problem_arguments(
+        r_func=problem.func, filename=problem.filename,
+        solution=f"{args.solution_dir}/{problem.filename}.R",
+        submission=submission if submission is not None else f"{args.submission_dir}/{problem.filename}.R",
+        config=problem.config, out_prefix=f"{args.out_prefix}.{problem.filename}",
+        digits=problem.digits, format=problem.format, preload_usr=problem.preload_usr, preload_sol=problem.preload_sol,
+        atol=problem.atol, rtol=problem.rtol, compare=problem.get("compare", "exact"),
+        default_maxmemory=problem.maxmemory, default_maxcputime=problem.maxcputime, default_maxoutput=problem.maxoutput,
+        default_maxtime_factor=problem.maxtime_factor, default_maxtime_floor=problem.get("maxtime_floor", PROBLEM_ARGUMENT_DEFAULTS["default_maxtime_floor"]),
+        log=args.log, show_args=args.show_args, show_details=args.show_details, show_diffs=args.show_diffs, show_errors=args.show_errors,
+        skip_solution=args.skip_solution, fork_server=args.fork_server, sol_cache=args.sol_cache, sol_cache_max_mb=args.sol_cache_max_mb,
+        pin_cores=args.pin_cores, batch_solution=args.batch_solution, no_precheck=args.no_precheck, incremental=args.incremental,
+        diff_style=args.diff_style, binary_output=problem.get("binary_output", args.binary_output), results_db=args.results_db,
+        export_files=args.export_files, stage_times=args.stage_times, arg_cache=args.arg_cache)
 
-    log_path = f"{args.out_prefix}.log"
-    logger = create_custom_logger(__name__, log_path if args.log else None)
-    logger.info("Started evaluating the whole problem set")
+def measured_case_cost(prob_args, j, case_results):
+    """
+    Time spent on the j-th test case in the last run (solution + submission), or None if not available
+    """
+    fields = case_results.get(f"{prob_args.out_prefix}.{j}", {})
+    if fields.get("score") == "skipped": ## not evaluated to the end
+        return None
+    cost = None
+    for side in ["sol", "usr"]:
+        if fields.get(f"{side}_time") is not None:
+            cost = (cost or 0) + float(fields[f"{side}_time"])
+    return cost
 
-    ## read the config file
-    #logger.info(f"Reading the config file: {args.config}")
-    config = load_file_to_dict(args.config)
-
-    n_config = len(config)
-    jsons = []
-    for i, v in enumerate(config):
-        func = v["func"]
-        filename = v.get("filename", func)
-        conf = v["config"]
-        digits = v.get("digits", 8)
-        format = v.get("format", "g")
-        preload_usr = v.get("preload_usr", None)
-        preload_sol = v.get("preload_sol", None)
-
-        logger.info("====================================================================")
-        logger.info(f"Starting the evaluation of the problem {i+1}/{n_config}: {func}")
-        logger.info("====================================================================")
-
-        out_prefix = f"{args.out_prefix}.{filename}"
-        get_func("eval_r_func_problem")(  
-                        ["--r-func", func] +
-                        ["--filename", filename] +
-                        ["--solution", f"{args.solution_dir}/{filename}.R"] +
-                        ["--submission", f"{args.submission_dir}/{filename}.R"] +
-                        ["--config", conf] +
-                        ["--out-prefix", out_prefix] +
-                        ["--digits", str(digits)] +
-                        ["--format", format] +
-                        (["--preload-usr", preload_usr] if preload_usr is not None else []) +
-                        (["--preload-sol", preload_sol] if preload_sol is not None else []) +
-                        (["--log"] if args.log else []) +
-                        (["--show-args"] if args.show_args else []) +
-                        (["--show-details"] if args.show_details else []) +
-                        (["--show-diffs"] if args.show_diffs else []) +
-                        (["--show-errors"] if args.show_errors else []) +
-                        (["--skip-solution"] if args.skip_solution else []))
-        
-        ## loading the json output
-        jsons.append(load_file_to_dict(f"{out_prefix}.json"))
+def expected_case_cost(prob_args, j, c, history, case_results):
+    """
+    Expected time of the j-th test case c (a TestCase), from the runtime history, the results of an earlier run, or its maxtime
+    """
+    cost = history.get(f"{prob_args.filename}:{c.args}")
+    if cost is None:
+        cost = measured_case_cost(prob_args, j, case_results)
+    if cost is None:
+        cost = float(c.get("maxtime", prob_args.default_maxtime))
+    return cost
 
-    ## write the final output
+def probset_results(jsons, memory_leaderboard=False):
+    """
+    Final output in the Gradescope format, from the outputs of collect_problem_results() for each problem
+    """
     total_score = 0
     total_time = 0
     total_max_score = 0
+    total_cpu_time = 0
+    peak_memory = 0
     for j in jsons:
         total_score += j["score"]
         total_time += j["elapsed"]
         total_max_score += j["max_score"]
+        total_cpu_time += j["cpu_time"]
+        peak_memory = max(peak_memory, j["peak_memory_mb"])
 
     outdict = {
         "score":total_score,
         "execution_time": total_time,
+        "cpu_time": round(total_cpu_time, 3),
+        "peak_memory_mb": peak_memory,
         "output": f"Total Score: {total_score}/{total_max_score}\nTotal Elapsed Time: " + ("%.3f" % (total_time)) + " seconds",
         "stdout_visibility": "hidden", # Optional stdout visibility setting
         "leaderboard": [
@@ -96,10 +140,140 @@ def eval_r_func_probset(_args):
         ],
         "tests": jsons,
     }
+    if memory_leaderboard:
+        outdict["leaderboard"].append({"name":"Memory", "value": peak_memory, "order": "asc"})
+    return outdict
+
+def eval_r_func_probset(_args):
+    # parse argument
+    args=parse_arguments(_args)
+    if args.results_db is None:
+        args.results_db = f"{args.out_prefix}.db"
+    start_time = time.time()
+    if args.trace:
+        start_tracing()
+        args.stage_times = True
+
+    log_path = f"{args.out_prefix}.log"
+    logger = create_custom_logger(__name__, log_path if args.log else None)
+    logger.info("Started evaluating the whole problem set")
+
+    ## read the config file, and build the arguments of each problem in the same way as eval_r_func_problem
+    #logger.info(f"Reading the config file: {args.config}")
+    problems = [(problem_arguments(args, problem), problem.cases) for problem in Problem.load_all(args.config)]
+
+    ## results of all test cases are stored in a single database, also used to estimate the time of each test case in the next run
+    store = ResultsStore(args.results_db)
+    prefixes = [f"{prob_args.out_prefix}.{j}" for (prob_args, prob_config) in problems for j in range(len(prob_config))]
+    earlier_results = store.load_cases(prefixes)
+    case_results = {}
+    deadline = start_time + args.time_budget if args.time_budget is not None else None
+
+    ## results.json is rewritten as the test cases finish, with those not evaluated yet reported as skipped,
+    ## so that the results evaluated so far are kept if the autograder is stopped before the end
+    not_reached = "SKIPPED: The test case was not evaluated, because the autograder was stopped before reaching it."
+    placeholders = {f"{prob_args.out_prefix}.{j}": record_skipped_case(case_arguments(prob_args, j, c), not_reached)
+                    for (prob_args, prob_config) in problems for j, c in enumerate(prob_config)}
+    def build_results(case_results):
+        results = ChainMap(case_results, placeholders)
+        return probset_results([collect_problem_results(prob_args, prob_config, results) for (prob_args, prob_config) in problems], args.memory_leaderboard)
+    progress = ProgressWriter(args.out_prefix, case_results, build_results)
+
+    ## only the test cases whose inputs changed since the last run are evaluated again, as (problem arguments, config, indices of the test cases)
+    if args.incremental:
+        for (prob_args, prob_config) in problems:
+            case_results.update(up_to_date_results(prob_args, prob_config, earlier_results))
+        logger.info(f"Reusing the results of {len(case_results)}/{len(prefixes)} test case(s) with unchanged inputs")
+    progress.write()
+    runnable = [(prob_args, prob_config, [j for j in range(len(prob_config)) if f"{prob_args.out_prefix}.{j}" not in case_results]) for (prob_args, prob_config) in problems]
+    runnable = [problem for problem in runnable if len(problem[2]) > 0]
+
+    ## a submitted file that cannot be loaded fails all its test cases in the same way, so check each file once,
+    ## and record the failure for all test cases of the problem without running them
+    if not args.no_precheck:
+        def run_problem_precheck(prob_args, prob_config, indices, core):
+            with span("precheck_submission", problem=prob_args.filename):
+                return precheck_submission(prob_args, prob_config, logger, core, indices=indices, deadline=deadline)
+        failures = run_parallel([functools.partial(run_problem_precheck, prob_args, prob_config, indices) for (prob_args, prob_config, indices) in runnable], args.jobs, args.pin_cores)
+        for ((prob_args, prob_config, indices), failed) in zip(runnable, failures):
+            for j in (indices if failed is not None else []):
+                progress.record(f"{prob_args.out_prefix}.{j}", failed[f"{prob_args.out_prefix}.{j}"], problem=prob_args.filename, case=j+1)
+        runnable = [problem for (problem, failed) in zip(runnable, failures) if failed is None]
+
+    ## the solutions of different problems are independent, so their batches can run in parallel
+    if args.batch_solution:
+        def run_problem_batch(prob_args, prob_config, indices, core):
+            with span("run_batch_solution", problem=prob_args.filename):
+                run_batch_solution(prob_args, prob_config, logger, indices, deadline)
+        run_parallel([functools.partial(run_problem_batch, prob_args, prob_config, indices) for (prob_args, prob_config, indices) in runnable], args.jobs)
+
+    ## flatten all (problem, test case) pairs into a single queue, longest expected first,
+    ## so that a slow problem does not leave the other cores idle at the end
+    history = load_file_to_dict(args.runtime_history, "json") if args.runtime_history is not None and os.path.exists(args.runtime_history) else {}
+    units = []
+    for (prob_args, prob_config, indices) in runnable:
+        for j in indices:
+            units.append((expected_case_cost(prob_args, j, prob_config[j], history, earlier_results), prob_args, j, prob_config[j], len(prob_config)))
+    units.sort(key=lambda u: -u[0]) ## stable, so ties keep the config order
+    n_units = len(units)
+    logger.info(f"Evaluating {n_units} test cases of {len(problems)} problems")
+
+    ## with a time budget, each test case gets a deadline from the time left when it starts (see utils/budget.py)
+    budget = None
+    if deadline is not None:
+        budget = TimeBudget(deadline, args.jobs if args.jobs is not None else len(available_cores()))
+        for (cost, prob_args, j, c, n_cases) in units:
+            budget.add(f"{prob_args.out_prefix}.{j}", cost)
+        logger.info(f"Time budget: {budget.remaining():.1f}s left for {n_units} test cases expected to take {sum([u[0] for u in units]):.1f}s")
+
+    def run_case(prob_args, j, c, n_cases, core):
+        logger.info("====================================================================")
+        logger.info(f"Evaluating the test case {j+1}/{n_cases} of the problem {prob_args.r_func}:")
+        logger.info("====================================================================")
+        fields = evaluate_problem_case(prob_args, j, c, core, deadline=budget.start(f"{prob_args.out_prefix}.{j}") if budget is not None else None)
+        progress.record(f"{prob_args.out_prefix}.{j}", fields, problem=prob_args.filename, case=j+1)
+        return fields
+
+    for (prob_args, prob_config, indices) in runnable:
+        measure_startup_overheads(prob_args, prob_config, indices)
+
+    ## the results are passed back in memory, and are not read back from the database
+    case_fields = run_parallel([functools.partial(run_case, prob_args, j, c, n_cases) for (cost, prob_args, j, c, n_cases) in units], args.jobs, args.pin_cores)
+    for ((cost, prob_args, j, c, n_cases), fields) in zip(units, case_fields):
+        case_results[f"{prob_args.out_prefix}.{j}"] = fields
+
+    ## reassemble the results of each problem
+    with stage("results_collect"):
+        jsons = []
+        for (prob_args, prob_config) in problems:
+            outdict = collect_problem_results(prob_args, prob_config, case_results)
+            write_dict_to_file(outdict, f"{prob_args.out_prefix}.json")
+            jsons.append(outdict)
+
+    if args.runtime_history is not None:
+        for (prob_args, prob_config) in problems:
+            for j, c in enumerate(prob_config):
+                cost = measured_case_cost(prob_args, j, case_results)
+                if cost is not None or f"{prob_args.filename}:{c.args}" not in history:
+                    history[f"{prob_args.filename}:{c.args}"] = cost
+        write_dict_to_file(history, args.runtime_history, "json")
+
+    if args.sol_cache is not None:
+        logger.info(f"Solution cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses in total")
+
+    ## write the final output
+    outdict = probset_results(jsons, args.memory_leaderboard)
     
     ## write the output to a file
+    n_skipped = len([fields for fields in case_results.values() if fields["score"] == "skipped"])
+    if n_skipped > 0:
+        logger.info(f"{n_skipped} test case(s) were skipped, because the time budget ran out or the solution failed")
     logger.info(f"Writing the evaluation output to {args.out_prefix}.json")
-    write_dict_to_file(outdict, f"{args.out_prefix}.json")
+    replace_dict_file(outdict, f"{args.out_prefix}.json")
+    if args.trace:
+        add_span("eval_r_func_probset", start_time, time.time())
+        logger.info(f"Writing the trace to {args.out_prefix}.trace.json")
+        write_trace(f"{args.out_prefix}.trace.json")
     logger.info(f"Analysis finished")
 
 if __name__ == "__main__":
@@ -0,0 +1,227 @@
+import sys, os, gzip, argparse, logging, warnings, shutil, subprocess, ast, json, time, functools, copy, csv
+
+from autogradescoper.utils.utils import get_func, create_custom_logger, load_file_to_dict, write_dict_to_file, run_parallel, hash_files
+from autogradescoper.utils.solcache import SolutionCache, cache_stats
+from autogradescoper.utils.store import ResultsStore
+from autogradescoper.utils.problem import Problem
+from autogradescoper.scripts.eval_r_func_problem import collect_problem_results, precheck_submission, evaluate_problem_case, up_to_date_results, measure_startup_overheads
+from autogradescoper.scripts.eval_r_func_probset import default_arguments as default_probset_arguments, problem_arguments, expected_case_cost, probset_results
+from autogradescoper.scripts.cache_r_func_solutions import cache_case_solution
+from autogradescoper.scripts.eval_r_func_worker import run_worker
+from autogradescoper.utils.workqueue import WorkQueue
+
+def parse_arguments(_args):
+    repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+    parser = argparse.ArgumentParser(prog=f"autogradescoper eval_r_func_roster", description="Offline grading of the submissions of a whole class, each in its own directory shaped like /autograder/submission")
+
+    inout_params = parser.add_argument_group("Required Input/Output Parameters", "Input/output directory/files.")
+    inout_params.add_argument('--roster-dir', type=str, required=True, help='Directory containing one submission directory per student. The name of each directory is used as the student ID')
+    inout_params.add_argument('--out-dir', type=str, required=True, help='Output directory. The results are written to {out_dir}/{student}/results.json, and the class summary to {out_dir}/summary.json and {out_dir}/summary.tsv')
+    inout_params.add_argument('--config', type=str, default="/autograder/source/config/config.yaml", help='JSON/YAML files containing "func", "config", "digits", "preload" for each problem (default:/autograder/source/config/config.yaml)')
+
+    key_params = parser.add_argument_group("Key Parameters with default values", "Key parameters frequently used by users")
+    key_params.add_argument('--solution-dir', type=str, default="/autograder/source/solution", help='R script containing the correct solution (default: /autograder/source/solution)')
+    key_params.add_argument('--sol-cache', type=str, help='Directory of the persistent cache of solution outputs, shared by all students (default: {out_dir}/cache/solution)')
+    key_params.add_argument('--log', action='store_true', default=False, help='Write log to file')
+    key_params.add_argument('--show-args', action='store_true', default=False, help='Show the arguments to user output')
+    key_params.add_argument('--show-details', action='store_true', default=False, help='Show the correct and incorrect output to user output')
+    key_params.add_argument('--show-diffs', action='store_true', default=False, help='Show the differences between correct and incorrect output')
+    key_params.add_argument('--show-errors', action='store_true', default=False, help='Show the detailed errors to user output')
+    key_params.add_argument('--skip-solution', action='store_true', default=False, help='Ignore the solution, and parse the output as a JSON file. "score" and "details" are key attributes')
+    key_params.add_argument('--fork-server', action='store_true', default=False, help='Source the preload scripts and R file once per solution or distinct submitted file, and fork it for each test case')
+    key_params.add_argument('--jobs', type=int, help='Number of test cases to evaluate in parallel (default: number of available cores). With --queue, 0 only coordinates the workers')
+    key_params.add_argument('--queue', type=str, help='SQLite database of a queue shared with workers on other hosts (see eval_r_func_worker), e.g. {out_dir}/queue.db on a shared filesystem. The test cases are published to the queue instead of being evaluated only on this host')
+    key_params.add_argument('--queue-root', type=str, help='With --queue, directory under which the paths of the test cases (submissions, solutions, configs, outputs) are stored relative to it, so that each worker resolves them from its own --root (default: the directory of --queue)')
+    key_params.add_argument('--poll-interval', type=float, default=2, help='With --queue and --jobs 0, seconds between two checks of the progress of the workers')
+    key_params.add_argument('--pin-cores', action='store_true', default=False, help='Pin each parallel test case to its own CPU core, so that parallel runs do not distort the measured time')
+    key_params.add_argument('--diff-style', type=str, default="normal", choices=["normal", "side-by-side"], help='Format of the differences shown with --show-diffs: same as `diff` (normal), or side by side with line numbers')
+    key_params.add_argument('--binary-output', action='store_true', default=False, help='For all problems, write numeric vectors and matrices in a binary format, and compare them without text formatting')
+    key_params.add_argument('--no-precheck', action='store_true', default=False, help='Do not check that each distinct submitted file can be sourced and defines the R function before running its test cases')
+    key_params.add_argument('--incremental', action='store_true', default=False, help='Reuse the results of an earlier run with the same --out-dir for the test cases whose inputs are unchanged, e.g. when regrading after fixing some args files')
+    key_params.add_argument('--arg-cache', type=str, help='Directory of the input arguments compiled by compile_r_func_args')
+    key_params.add_argument('--memory-leaderboard', action='store_true', default=False, help='Add the peak memory of the submissions to the leaderboard')
+    key_params.add_argument('--export-files', action='store_true', default=False, help='Also write the results of each test case to individual files, e.g. for debugging')
+
+    if len(_args) == 0:
+        parser.print_help()
+        sys.exit(1)
+
+    return parser.parse_args(_args)
+
+def probset_options(args, run_dir):
+    """
+    Arguments of eval_r_func_probset shared by all submissions
+    """
+    return default_probset_arguments(config=args.config, solution_dir=args.solution_dir, out_prefix=f"{run_dir}/results", sol_cache=args.sol_cache,
+                                     results_db=f"{run_dir}/results.db", diff_style=args.diff_style, log=args.log,
+                                     show_args=args.show_args, show_details=args.show_details, show_diffs=args.show_diffs, show_errors=args.show_errors,
+                                     skip_solution=args.skip_solution, fork_server=args.fork_server, pin_cores=args.pin_cores, binary_output=args.binary_output,
+                                     export_files=args.export_files, no_precheck=args.no_precheck, incremental=args.incremental, arg_cache=args.arg_cache)
+
+def eval_r_func_roster(_args):
+    # parse argument
+    args=parse_arguments(_args)
+    if args.sol_cache is None:
+        args.sol_cache = f"{args.out_dir}/cache/solution"
+    run_dir = f"{args.out_dir}/runs"
+    os.makedirs(run_dir, exist_ok=True)
+
+    log_path = f"{args.out_dir}/roster.log"
+    logger = create_custom_logger(__name__, log_path if args.log else None)
+    start_time = time.time()
+
+    students = sorted([d for d in os.listdir(args.roster_dir) if os.path.isdir(os.path.join(args.roster_dir, d))])
+    logger.info(f"Started grading {len(students)} submissions in {args.roster_dir}")
+
+    ## build the arguments of each problem, in the same way as eval_r_func_probset
+    probset_args = probset_options(args, run_dir)
+    problems = [(problem, problem_arguments(probset_args, problem)) for problem in Problem.load_all(args.config)]
+
+    ## byte-identical submitted files are graded only once. Each distinct file is copied to a path named by its content hash,
+    ## so that the messages shown to a student never contain the path of another student's submission
+    graded = {} ## (filename, digest) -> (arguments of eval_r_func_problem, test cases)
+    assigned = {} ## student -> list of (filename, digest) for each problem
+    for student in students:
+        assigned[student] = []
+        for (problem, prob_args) in problems:
+            path = f"{args.roster_dir}/{student}/{prob_args.filename}.R"
+            if os.path.isfile(path):
+                key = (prob_args.filename, hash_files([path]))
+            else: ## missing files are graded separately, as the error message contains the path
+                key = (prob_args.filename, f"missing.{student}")
+            if key not in graded:
+                sub_args = copy.copy(prob_args)
+                if os.path.isfile(path):
+                    sub_args.out_prefix = f"{run_dir}/{key[0]}.{key[1][:16]}"
+                    sub_args.submission = f"{run_dir}/submissions/{key[1]}/{prob_args.filename}.R"
+                    os.makedirs(os.path.dirname(sub_args.submission), exist_ok=True)
+                    shutil.copyfile(path, sub_args.submission)
+                else: ## the full student name, as any shorter part of it may be shared by several students
+                    sub_args.out_prefix = f"{run_dir}/{key[0]}.{key[1]}"
+                    sub_args.submission = path
+                graded[key] = (sub_args, problem.cases)
+            assigned[student].append(key)
+    logger.info(f"Found {len(graded)} distinct submitted files for {len(students)} students and {len(problems)} problems")
+
+    store = ResultsStore(probset_args.results_db)
+    prefixes = [f"{sub_args.out_prefix}.{j}" for (sub_args, prob_config) in graded.values() for j in range(len(prob_config))]
+    earlier_results = store.load_cases(prefixes)
+    case_results = {}
+
+    ## results left in the queue by an interrupted run are kept in the database, so that --incremental can reuse them
+    queue = None
+    if args.queue is not None:
+        queue = WorkQueue(args.queue, args.queue_root)
+        if queue.network_filesystem is not None:
+            logger.warning(f"The queue {args.queue} is on a network filesystem ({queue.network_filesystem}), on which SQLite's file locking is unreliable. The queue may be corrupted, or a test case may be evaluated by two workers")
+        for (prefix, fields) in queue.results(prefixes).items():
+            store.write_case(prefix, fields)
+            earlier_results[prefix] = dict(fields, prefix=prefix)
+        queue.clear()
+
+    ## only the test cases whose inputs changed since the last run are evaluated again
+    if args.incremental:
+        for (sub_args, prob_config) in graded.values():
+            case_results.update(up_to_date_results(sub_args, prob_config, earlier_results))
+        logger.info(f"Reusing the results of {len(case_results)}/{len(prefixes)} test case(s) with unchanged inputs")
+    runnable = [(sub_args, prob_config, [j for j in range(len(prob_config)) if f"{sub_args.out_prefix}.{j}" not in case_results]) for (sub_args, prob_config) in graded.values()]
+    runnable = [unit for unit in runnable if len(unit[2]) > 0]
+
+    if queue is not None:
+        ## the test cases are evaluated by the workers claiming them from the queue, including this process unless --jobs 0.
+        ## The solutions are shared through the solution cache, and each distinct file is checked by the first worker that needs it
+        for (sub_args, prob_config, indices) in runnable:
+            costs = [expected_case_cost(sub_args, j, prob_config[j], {}, earlier_results) for j in indices]
+            queue.publish(sub_args.out_prefix, sub_args.out_prefix, vars(sub_args), [c.to_dict() for c in prob_config], indices, costs)
+        logger.info(f"Published {sum([len(indices) for (sub_args, prob_config, indices) in runnable])} test cases to the queue {args.queue}")
+        if args.jobs != 0:
+            run_worker(queue, logger, args.jobs, args.pin_cores)
+        while True:
+            counts = queue.counts()
+            if counts["pending"] == 0 and counts["running"] == 0:
+                break
+            logger.info(f"Waiting for the workers: {counts['done']} done, {counts['running']} running, {counts['pending']} pending")
+            time.sleep(args.poll_interval)
+        published = [f"{sub_args.out_prefix}.{j}" for (sub_args, prob_config, indices) in runnable for j in indices]
+        for (prefix, fields) in queue.results(published).items():
+            store.write_case(prefix, fields)
+            case_results[prefix] = fields
+    else:
+        ## the solution outputs do not depend on the submission, so evaluate them once and share them through the solution cache
+        if not args.skip_solution:
+            sol_cache = SolutionCache(args.sol_cache)
+            sol_work_dir = f"{run_dir}/solution"
+            os.makedirs(sol_work_dir, exist_ok=True)
+            pending = set([(sub_args.filename, j) for (sub_args, prob_config, indices) in runnable for j in indices])
+            sol_tasks = [functools.partial(lambda problem, i, c, preload_all, core: cache_case_solution(sol_cache, problem, i, c, args.solution_dir, sol_work_dir, preload_all, args.fork_server, args.binary_output), problem, i, c, prob_args.preload_all)
+                         for (problem, prob_args) in problems for i, c in enumerate(problem.cases) if c.scaling is None and (prob_args.filename, i) in pending]
+            run_parallel(sol_tasks, args.jobs)
+            logger.info(f"Evaluated the solutions for {len(sol_tasks)} test cases in {time.time() - start_time:.2f}s")
+
+        ## distinct files that cannot be loaded fail all their test cases without running them
+        if not args.no_precheck:
+            n_runnable = len(runnable)
+            failures = run_parallel([functools.partial(lambda sub_args, prob_config, indices, core: precheck_submission(sub_args, prob_config, logger, core, indices=indices), sub_args, prob_config, indices)
+                                     for (sub_args, prob_config, indices) in runnable], args.jobs, args.pin_cores)
+            runnable = [unit for (unit, failed) in zip(runnable, failures) if failed is None]
+            for failed in failures:
+                case_results.update(failed or {})
+            logger.info(f"{n_runnable - len(runnable)} of {n_runnable} distinct submitted files could not be loaded")
+
+        ## evaluate the test cases of all distinct files from a single queue, longest expected first
+        units = []
+        for (sub_args, prob_config, indices) in runnable:
+            for j in indices:
+                units.append((expected_case_cost(sub_args, j, prob_config[j], {}, earlier_results), sub_args, j, prob_config[j]))
+        units.sort(key=lambda u: -u[0]) ## stable, so ties keep the roster order
+        logger.info(f"Evaluating {len(units)} test cases")
+        for (sub_args, prob_config, indices) in runnable: ## measured once for each problem, as all submissions share the solution
+            measure_startup_overheads(sub_args, prob_config, indices)
+
+        case_fields = run_parallel([functools.partial(evaluate_problem_case, sub_args, j, c) for (cost, sub_args, j, c) in units], args.jobs, args.pin_cores)
+        for ((cost, sub_args, j, c), fields) in zip(units, case_fields):
+            case_results[f"{sub_args.out_prefix}.{j}"] = fields
+
+    ## write the results of each student, in the same format as eval_r_func_probset
+    problem_jsons = {key: collect_problem_results(sub_args, prob_config, case_results) for (key, (sub_args, prob_config)) in graded.items()}
+    summary = []
+    for student in students:
+        outdict = probset_results([copy.deepcopy(problem_jsons[key]) for key in assigned[student]], args.memory_leaderboard)
+        os.makedirs(f"{args.out_dir}/{student}", exist_ok=True)
+        write_dict_to_file(outdict, f"{args.out_dir}/{student}/results.json")
+        summary.append({"student": student, "score": outdict["score"], "execution_time": outdict["execution_time"], "peak_memory_mb": outdict["peak_memory_mb"],
+                        "problems": {j["name"]: j["score"] for j in outdict["tests"]}})
+
+    elapsed_time = time.time() - start_time
+    per_minute = len(students) / elapsed_time * 60 if elapsed_time > 0 else 0
+    logger.info(f"Graded {len(students)} submissions in {elapsed_time:.2f}s ({per_minute:.1f} submissions per minute)")
+    if not args.skip_solution and queue is None: ## the workers count their own hits and misses
+        logger.info(f"Solution cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses in total")
+
+    ## write the class summary
+    max_score = sum(c.maxscore for (problem, prob_args) in problems for c in problem.cases)
+    write_dict_to_file({
+        "n_submissions": len(students),
+        "n_distinct_files": len(graded),
+        "max_score": max_score,
+        "elapsed_time": elapsed_time,
+        "submissions_per_minute": per_minute,
+        "students": summary,
+    }, f"{args.out_dir}/summary.json", "json")
+    with open(f"{args.out_dir}/summary.tsv", 'w', newline='') as fsummary:
+        writer = csv.writer(fsummary, delimiter='\t')
+        writer.writerow(["student"] + [prob_args.filename for (problem, prob_args) in problems] + ["score", "execution_time"])
+        for s in summary:
+            writer.writerow([s["student"]] + [s["problems"][prob_args.filename] for (problem, prob_args) in problems] + [s["score"], f"{s['execution_time']:.3f}"])
+    logger.info(f"Analysis finished")
+
+if __name__ == "__main__":
+    # Get the base file name without extension
+    script_name = os.path.splitext(os.path.basename(__file__))[0]
+
+    # Dynamically get the function based on the script name
+    func = getattr(sys.modules[__name__], script_name)
+
+    # Call the function with command line arguments
+    func(sys.argv[1:])
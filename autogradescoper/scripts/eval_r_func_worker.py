@@ -0,0 +1,132 @@
+import sys, os, gzip, argparse, logging, warnings, shutil, subprocess, ast, json, time, functools, socket, threading
+
+from autogradescoper.utils.utils import create_custom_logger, run_parallel, available_cores
+from autogradescoper.utils.workqueue import WorkQueue, DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS
+from autogradescoper.utils.problem import TestCase
+from autogradescoper.scripts.eval_r_func_problem import case_arguments, precheck_submission, evaluate_problem_case
+from autogradescoper.scripts.eval_r_func_args import record_skipped_case
+
+def parse_arguments(_args):
+    repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+    parser = argparse.ArgumentParser(prog=f"autogradescoper eval_r_func_worker", description="Worker evaluating the test cases published to a shared queue by eval_r_func_roster --queue, on this host")
+
+    inout_params = parser.add_argument_group("Required Input/Output Parameters", "Input/output directory/files.")
+    inout_params.add_argument('--queue', type=str, required=True, help='SQLite database of the queue, on a filesystem shared with the other hosts (same as --queue of eval_r_func_roster)')
+    inout_params.add_argument('--root', type=str, help='Directory on this host corresponding to --queue-root of eval_r_func_roster. The paths of the test cases under it are resolved from this directory (default: the directory of --queue)')
+
+    key_params = parser.add_argument_group("Key Parameters with default values", "Key parameters frequently used by users")
+    key_params.add_argument('--log', action='store_true', default=False, help='Write log to file')
+    key_params.add_argument('--log-path', type=str, help='Log file (default: {queue}.{host}.{pid}.log)')
+    key_params.add_argument('--jobs', type=int, help='Number of test cases to evaluate in parallel (default: number of available cores)')
+    key_params.add_argument('--pin-cores', action='store_true', default=False, help='Pin each parallel test case to its own CPU core, so that parallel runs do not distort the measured time')
+    key_params.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS, help=f'Seconds after which a test case claimed by a worker that stopped renewing it (e.g. crashed) is claimed by another worker (default: {DEFAULT_LEASE_SECONDS})')
+    key_params.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS, help=f'Number of times a test case is claimed before it is reported as skipped (default: {DEFAULT_MAX_ATTEMPTS})')
+    key_params.add_argument('--poll-interval', type=float, default=2, help='Seconds to wait before checking the queue again when no test case can be claimed')
+    key_params.add_argument('--wait', action='store_true', default=False, help='Keep waiting for new test cases when all test cases in the queue are finished, instead of exiting')
+
+    if len(_args) == 0:
+        parser.print_help()
+        sys.exit(1)
+
+    return parser.parse_args(_args)
+
+def evaluate_unit(queue, unit, logger, core=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Evaluate a unit claimed from the queue in the same way as eval_r_func_probset, and return its results (see evaluate_case() in eval_r_func_args).
+    The submitted file of its group is checked by the first worker that needs it, and the outcome is shared through the queue.
+    """
+    prob_args = argparse.Namespace(**unit["problem_args"])
+    config = [TestCase.from_dict(c) for c in unit["config"]]
+    (j, c) = (unit["case_index"], config[unit["case_index"]])
+    if unit["attempts"] > max_attempts:
+        str_details = f"SKIPPED: The test case was not evaluated, because the workers running it stopped {unit['attempts'] - 1} times."
+        logger.info(f"{unit['prefix']}: {str_details}")
+        return record_skipped_case(case_arguments(prob_args, j, c), str_details)
+
+    if not prob_args.no_precheck:
+        (checked, failures) = queue.group_precheck(unit["grp"])
+        if not checked:
+            failures = precheck_submission(prob_args, config, logger, core, False, unit["indices"])
+            ## keyed by the index of the test case, as the output prefix depends on the root of each host
+            queue.set_group_precheck(unit["grp"], None if failures is None else {i: failures[f"{prob_args.out_prefix}.{i}"] for i in unit["indices"]})
+            (checked, failures) = queue.group_precheck(unit["grp"]) ## the outcome recorded first, if another worker checked it at the same time
+        if failures is not None:
+            return failures[str(j)]
+    return evaluate_problem_case(prob_args, j, c, core, write_results=False)
+
+def run_worker(queue, logger, jobs=None, pin_cores=False, lease=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS, poll_interval=2, wait=False, worker_id=None):
+    """
+    Claim and evaluate units from the queue with `jobs` threads, until no unit is pending or running (or forever with wait).
+    The leases of the units being evaluated are renewed in the background. Returns the number of units evaluated.
+    """
+    if worker_id is None:
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    held = set()
+    held_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def renew_leases():
+        while not stopped.wait(lease / 3):
+            with held_lock:
+                prefixes = list(held)
+            queue.renew(prefixes, worker_id, lease)
+    threading.Thread(target=renew_leases, name="autogradescoper-lease", daemon=True).start()
+
+    def work(core):
+        n_done = 0
+        while True:
+            unit = queue.claim(worker_id, lease)
+            if unit is None:
+                counts = queue.counts()
+                if not wait and counts["pending"] == 0 and counts["running"] == 0:
+                    return n_done
+                time.sleep(poll_interval) ## units running on other workers may still be claimed again if their lease expires
+                continue
+            with held_lock:
+                held.add(unit["prefix"])
+            try:
+                logger.info(f"Evaluating {unit['prefix']} (attempt {unit['attempts']})")
+                fields = evaluate_unit(queue, unit, logger, core, max_attempts)
+                queue.complete(unit["prefix"], fields)
+                n_done += 1
+            except Exception as e:
+                logger.error(f"Failed to evaluate {unit['prefix']}, returning it to the queue: {e!r}")
+                queue.release(unit["prefix"], worker_id)
+                time.sleep(poll_interval)
+            finally:
+                with held_lock:
+                    held.discard(unit["prefix"])
+
+    ## each thread claims units until the queue is finished, so run as many threads as run_parallel() would
+    n_threads = max(1, jobs if jobs is not None else len(available_cores()))
+    if pin_cores:
+        n_threads = min(n_threads, len(available_cores()))
+    try:
+        return sum(run_parallel([work] * n_threads, n_threads, pin_cores))
+    finally:
+        stopped.set()
+
+def eval_r_func_worker(_args):
+    # parse argument
+    args=parse_arguments(_args)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    log_path = args.log_path if args.log_path is not None else f"{args.queue}.{worker_id.replace(':', '.')}.log"
+    logger = create_custom_logger(__name__, log_path if args.log else None)
+
+    queue = WorkQueue(args.queue, args.root)
+    if queue.network_filesystem is not None:
+        logger.warning(f"The queue {args.queue} is on a network filesystem ({queue.network_filesystem}), on which SQLite's file locking is unreliable. The queue may be corrupted, or a test case may be evaluated by two workers")
+    logger.info(f"Worker {worker_id} started on the queue {args.queue}: {queue.counts()}")
+    n_done = run_worker(queue, logger, args.jobs, args.pin_cores, args.lease, args.max_attempts, args.poll_interval, args.wait, worker_id)
+    logger.info(f"Worker {worker_id} evaluated {n_done} test case(s)")
+
+if __name__ == "__main__":
+    # Get the base file name without extension
+    script_name = os.path.splitext(os.path.basename(__file__))[0]
+
+    # Dynamically get the function based on the script name
+    func = getattr(sys.modules[__name__], script_name)
+
+    # Call the function with command line arguments
+    func(sys.argv[1:])
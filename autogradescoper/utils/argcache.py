@@ -0,0 +1,130 @@
+import os, re, subprocess, tempfile, threading
+
+from autogradescoper.utils.utils import hash_files, r_load_arg_expr, eval_data_files
+
+## types of input arguments that are compiled into RDS files
+COMPILED_TYPES = ["df", "mat", "eval"]
+
+## bump when the way the artifacts are written changes, so that old artifacts are not used
+ARTIFACT_VERSION = 1
+
+## calls whose value changes each time an expression is evaluated, so that eval expressions calling them are not compiled.
+## The random number generators are allowed after set.seed() in the same expression
+R_RNG_CALL = re.compile(r"(?<![\w.])(r(unif|norm|binom|pois|exp|gamma|beta|chisq|t|f|cauchy|logis|lnorm|weibull|geom|hyper|nbinom|multinom|signrank|wilcox)|sample|sample\.int)\s*\(")
+R_VOLATILE_CALL = re.compile(r"(?<![\w.])(Sys\.time|Sys\.Date|date|proc\.time|Sys\.getpid|Sys\.getenv|tempfile|file\.info|file\.mtime|list\.files|dir)\s*\(")
+R_SET_SEED = re.compile(r"(?<![\w.])set\.seed\s*\(")
+
+def is_pure_expr(expr):
+    """
+    Whether the eval expression gives the same value each time it is evaluated, as far as can be told from its text:
+    it does not read the clock, the environment, or the directory listing, and calls the random number generators only after set.seed()
+    """
+    if R_VOLATILE_CALL.search(expr) is not None:
+        return False
+    rng_call = R_RNG_CALL.search(expr)
+    if rng_call is None:
+        return True
+    seed_call = R_SET_SEED.search(expr)
+    return seed_call is not None and seed_call.start() < rng_call.start()
+
+class ArgCache:
+    """
+    Input arguments (df, mat, eval types) compiled into uncompressed RDS files, keyed by the content hash of their specification.
+    Each artifact is stored as {cache_dir}/{key[:2]}/{key}.rds
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._keys = {} ## (type, value, size, mtime) -> key, so that each data file is hashed once per process
+        self._lock = threading.Lock()
+
+    def key(self, type, value):
+        """
+        Content hash of an input argument, or None if it is not compiled
+        """
+        if type not in COMPILED_TYPES:
+            return None
+        if type == "eval": ## the expression, and the data files it reads
+            if not is_pure_expr(value): ## compiling would freeze a value that is meant to change each time
+                return None
+            paths = eval_data_files(value)
+            if paths is None:
+                return None
+            extra = [ARTIFACT_VERSION, type, value]
+        elif not os.path.isfile(value):
+            return None
+        else:
+            (paths, extra) = ([value], [ARTIFACT_VERSION, type])
+        stats = [os.stat(path) for path in paths]
+        memo_key = (type, value) + tuple((stat.st_size, stat.st_mtime_ns) for stat in stats)
+        with self._lock:
+            if memo_key not in self._keys:
+                self._keys[memo_key] = hash_files(paths, extra=extra)
+            return self._keys[memo_key]
+
+    def artifact_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.rds")
+
+    def lookup(self, type, value):
+        """
+        Path of the compiled RDS file of the input argument, or None if it has not been compiled
+        """
+        key = self.key(type, value)
+        if key is None or not os.path.exists(self.artifact_path(key)):
+            return None
+        return self.artifact_path(key)
+
+    def compile(self, specs, preload_scripts=()):
+        """
+        Compile the input arguments [(type, value), ...] that are not in the cache yet, in a single R process.
+        Arguments that fail to load (e.g. eval expressions depending on the submission) are skipped, and loaded as before.
+        Returns (number of compiled arguments, number of arguments already in the cache, error message of R).
+        """
+        pending = {}
+        n_cached = 0
+        for (type, value) in specs:
+            key = self.key(type, value)
+            if key is None or key in pending:
+                continue
+            if os.path.exists(self.artifact_path(key)):
+                n_cached += 1
+            else:
+                pending[key] = (type, value)
+        if len(pending) == 0:
+            return (0, n_cached, "")
+
+        with tempfile.NamedTemporaryFile('w', suffix=".R", delete=False) as fscript:
+            for preload_script in preload_scripts:
+                if preload_script is not None:
+                    fscript.write(f"source('{preload_script}')\n")
+            for (key, (type, value)) in pending.items():
+                path = self.artifact_path(key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                ## write to a temporary file and rename it, so that a partial artifact is never loaded
+                fscript.write("local({ tryCatch({\n")
+                fscript.write(f"  x <- {r_load_arg_expr(type, value)}\n")
+                fscript.write(f"  saveRDS(x, file='{path}.tmp{os.getpid()}', compress=FALSE)\n")
+                fscript.write(f"  file.rename('{path}.tmp{os.getpid()}', '{path}')\n")
+                fscript.write(f"}}, error = function(e) message('Could not compile {type}:', {r_string(value)}, ': ', conditionMessage(e))) }})\n")
+        try:
+            proc = subprocess.run(["Rscript", fscript.name], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        finally:
+            os.remove(fscript.name)
+        n_compiled = sum(1 for key in pending if os.path.exists(self.artifact_path(key)))
+        return (n_compiled, n_cached, proc.stderr.decode(errors="replace"))
+
+def r_string(value):
+    """
+    R string literal of the value
+    """
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n") + "'"
+
+def args_specs(in_params):
+    """
+    List of (type, value) of the input arguments in the .args file
+    """
+    specs = []
+    with open(in_params, 'r') as fparams:
+        for line in fparams:
+            (type, value) = line.split(":", maxsplit=1)
+            specs.append((type, value.strip()))
+    return specs
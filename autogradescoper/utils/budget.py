@@ -0,0 +1,43 @@
+import threading, time
+
+class TimeBudget:
+    """
+    Global time budget of a run, shared by the test cases evaluated in parallel by `jobs` workers.
+    Each test case is registered with its expected time, and when it starts, it is given a deadline that leaves
+    the remaining time to the test cases not started yet, in proportion to their expected times (but at least its expected time).
+    """
+    def __init__(self, deadline, jobs=1):
+        self.deadline = deadline
+        self.jobs = max(1, jobs)
+        self.pending = {}
+        self.pending_total = 0.0
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        """
+        Seconds left until the deadline of the whole run
+        """
+        return self.deadline - time.time()
+
+    def add(self, key, expected_time):
+        """
+        Register a test case that has not started yet, with its expected time in seconds
+        """
+        with self.lock:
+            self.pending[key] = max(expected_time, 0.01)
+            self.pending_total += self.pending[key]
+
+    def start(self, key):
+        """
+        Deadline of the test case starting now (already passed if no time is left for it)
+        """
+        with self.lock:
+            expected_time = self.pending.pop(key, 0.01)
+            self.pending_total = max(0.0, self.pending_total - expected_time)
+            remaining = self.remaining()
+            if remaining <= 0:
+                return self.deadline
+            ## all workers are busy until the end, so the remaining time is shared by this and the test cases not started yet,
+            ## but each test case may take at least its expected time, so that a tight budget is not split into shares too short to finish any of them
+            share = remaining * self.jobs * expected_time / ( expected_time + self.pending_total )
+            return time.time() + min(remaining, max(share, expected_time))
@@ -0,0 +1,442 @@
+import os, re, mmap, json, warnings
+import numpy as np
+
+from autogradescoper.utils.jsonstream import iter_json_object
+
+def read_output_table(path):
+    """
+    Read an output file written by the R evaluation script into a 2D array of strings.
+    Scalars and vectors become a single column, and data frames / sparse triplets are split by tabs.
+    Returns (header, table), where header is None if the first line does not look like column names.
+    Returns (None, None) if the output is not tabular (e.g. JSON for lists, or ragged lines).
+    """
+    with open(path, 'r') as f:
+        text = f.read().strip()
+    if text.startswith("{"):
+        return (None, None)
+    lines = text.split("\n")
+    n_cols = lines[0].count("\t") + 1
+    tokens = np.array(text.replace("\n", "\t").split("\t"))
+    if tokens.size != len(lines) * n_cols:
+        return (None, None)
+    table = np.char.strip(tokens.reshape(len(lines), n_cols))
+
+    header = None
+    if len(lines) > 1 and to_numeric(table[0]) is None:
+        header = table[0]
+        table = table[1:]
+    return (header, table)
+
+def to_numeric(values):
+    """
+    Convert an array of strings into floats (NA and NaN as nan), or None if any value is not numeric
+    """
+    try:
+        return np.where(values == "NA", "nan", values).astype(float)
+    except ValueError:
+        return None
+
+def parse_numbers(text):
+    """
+    Parse whitespace-separated numbers (NA and NaN as nan) into a float array, or None if any token is not numeric
+    """
+    if "NA" in text:
+        text = re.sub(r"\bNA\b", "nan", text)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(text, sep=" ")
+        except (ValueError, DeprecationWarning):
+            return None
+
+def read_numeric_output(path):
+    """
+    Fast path of read_output_table() for outputs containing only numbers (besides the header).
+    Returns (header, values) with values as a 2D float array, or None if the output is not purely numeric.
+    """
+    with open(path, 'r') as f:
+        text = f.read().strip()
+    if len(text) == 0 or text.startswith("{"):
+        return None
+    first_nl = text.find("\n")
+    first = text if first_nl < 0 else text[:first_nl]
+    n_cols = first.count("\t") + 1
+    header = None
+    if first_nl >= 0 and parse_numbers(first) is None:
+        header = np.char.strip(np.array(first.split("\t")))
+        text = text[first_nl+1:]
+    n_rows = text.count("\n") + 1
+    values = parse_numbers(text)
+    if values is None or values.size != n_rows * n_cols:
+        return None
+    return (header, values.reshape(n_rows, n_cols))
+
+def compare_outputs_numeric(sol_path, usr_path, atol=0, rtol=0, max_report=5):
+    """
+    Compare the numeric values in two output files with absolute/relative tolerance,
+    i.e. |usr - sol| <= atol + rtol * |sol| for every element. Non-numeric columns must match exactly.
+    Returns (passed, message), where message describes the mismatches.
+    passed is None if the outputs are not tabular, and should be compared as text instead.
+    """
+    sol_numeric = read_numeric_output(sol_path)
+    usr_numeric = read_numeric_output(usr_path) if sol_numeric is not None else None
+    if sol_numeric is not None and usr_numeric is not None: ## all values are numbers
+        ((sol_header, sol_table), (usr_header, usr_table)) = (sol_numeric, usr_numeric)
+    else:
+        (sol_header, sol_table) = read_output_table(sol_path)
+        (usr_header, usr_table) = read_output_table(usr_path)
+    if sol_table is None or usr_table is None:
+        return (None, "The outputs are not numeric tables, so they cannot be compared with tolerance")
+    if sol_table.shape != usr_table.shape:
+        return (False, f"The output has {usr_table.shape[0]} row(s) and {usr_table.shape[1]} column(s), but {sol_table.shape[0]} row(s) and {sol_table.shape[1]} column(s) were expected")
+    if (sol_header is None) != (usr_header is None) or ( sol_header is not None and not np.array_equal(sol_header, usr_header) ):
+        return (False, f"The column names are different: expected {sol_header}, observed {usr_header}")
+
+    n_rows, n_cols = sol_table.shape
+    col_names = sol_header if sol_header is not None else [str(j+1) for j in range(n_cols)]
+    n_mismatches = 0
+    worst = [] ## (excess, row, col, expected, observed)
+    for j in range(n_cols):
+        if sol_table.dtype.kind == 'f':
+            (sol_values, usr_values) = (sol_table[:, j], usr_table[:, j])
+        else:
+            sol_values = to_numeric(sol_table[:, j])
+            usr_values = to_numeric(usr_table[:, j]) if sol_values is not None else None
+        if sol_values is None or usr_values is None:
+            mismatched = np.nonzero(sol_table[:, j] != usr_table[:, j])[0]
+            n_mismatches += mismatched.size
+            worst.extend([(np.inf, i, j, sol_table[i, j], usr_table[i, j]) for i in mismatched[:max_report]])
+            continue
+        ok = np.isclose(usr_values, sol_values, rtol=rtol, atol=atol, equal_nan=True)
+        mismatched = np.nonzero(~ok)[0]
+        if mismatched.size == 0:
+            continue
+        n_mismatches += mismatched.size
+        with np.errstate(invalid='ignore'):
+            excess = np.abs(usr_values[mismatched] - sol_values[mismatched]) - (atol + rtol * np.abs(sol_values[mismatched]))
+        excess = np.where(np.isnan(excess), np.inf, excess)
+        top = np.argsort(-excess, kind="stable")[:max_report]
+        worst.extend([(excess[k], mismatched[k], j, sol_table[mismatched[k], j], usr_table[mismatched[k], j]) for k in top])
+
+    if n_mismatches == 0:
+        return (True, f"All {n_rows * n_cols} values are within the tolerance (atol={atol}, rtol={rtol})")
+    worst.sort(key=lambda w: -w[0])
+    message = f"{n_mismatches} of {n_rows * n_cols} values are not within the tolerance (atol={atol}, rtol={rtol}). The largest differences are:\n"
+    for (excess, i, j, expected, observed) in worst[:max_report]:
+        loc = f"row {i+1}" if n_cols == 1 else f"row {i+1}, column {col_names[j]}"
+        message += f"  {loc}: expected {expected}, observed {observed}\n"
+    return (False, message)
+
+## text outputs are compared as memory-mapped bytes, without reading them into memory
+COMPARE_CHUNK_BYTES = 1 << 20
+_NON_WHITESPACE = re.compile(rb"[^ \t\n\r\x0b\x0c]")
+
+class MappedOutput:
+    """
+    Memory-mapped output file, with the range [start, end) of its content without leading/trailing whitespace
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b""
+        m = _NON_WHITESPACE.search(self.buf)
+        (self.start, self.end) = (size, size) if m is None else (m.start(), size)
+        while self.end > self.start and self.buf[self.end-1:self.end].isspace():
+            self.end -= 1
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+    def count_lines(self, stop):
+        """
+        Number of newlines before the offset stop, counted in chunks
+        """
+        return sum(self.buf[k:min(k + COMPARE_CHUNK_BYTES, stop)].count(b"\n") for k in range(0, stop, COMPARE_CHUNK_BYTES))
+
+    def preview(self, max_chars, offset=None):
+        """
+        Content as text if shorter than max_chars, otherwise a window of about max_chars around the offset (default: the beginning),
+        starting at a line boundary when possible
+        """
+        if len(self) <= max_chars:
+            return self.buf[self.start:self.end].decode(errors='replace')
+        begin = self.start if offset is None else max(self.start, offset - max_chars // 4)
+        if begin > self.start:
+            nl = self.buf.find(b"\n", begin, offset)
+            begin = begin if nl < 0 else nl + 1
+        stop = min(self.end, begin + max_chars)
+        text = self.buf[begin:stop].decode(errors='replace')
+        return ("..." if begin > self.start else "") + text + (" ..." if stop < self.end else "")
+
+def first_difference(a, b, chunk_bytes=COMPARE_CHUNK_BYTES):
+    """
+    Position of the first differing byte between the contents of two MappedOutput, relative to their start, or None if identical.
+    The contents are compared chunk by chunk, and the differing chunk is bisected.
+    """
+    n = min(len(a), len(b))
+    for k in range(0, n, chunk_bytes):
+        m = min(chunk_bytes, n - k)
+        if a.buf[a.start+k:a.start+k+m] == b.buf[b.start+k:b.start+k+m]:
+            continue
+        (lo, hi) = (k, k + m) ## the first difference is in [lo, hi)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if a.buf[a.start+lo:a.start+mid] == b.buf[b.start+lo:b.start+mid]:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+    return None if len(a) == len(b) else n
+
+def compare_outputs_exact(sol_path, usr_path, max_preview_chars=500):
+    """
+    Check whether two output files are identical after stripping leading/trailing whitespace, streaming through memory-mapped files.
+    Returns (passed, sol_preview, usr_preview, mismatch), where the previews are bounded windows around the first difference,
+    and mismatch is None if passed, otherwise a dict with the (1-based) "line" of the first difference, whether the previews are "windowed",
+    and the byte "offset" and 0-based "start_line" of the start of that line in both files if their leading whitespace is the same
+    (so that a diff can start there), or None.
+    """
+    with MappedOutput(sol_path) as sol, MappedOutput(usr_path) as usr:
+        ## outputs of different lengths cannot be identical, but the first difference is still located for the previews
+        diff = first_difference(sol, usr)
+        if diff is None:
+            return (True, sol.preview(max_preview_chars), usr.preview(max_preview_chars), None)
+        line_start = sol.buf.rfind(b"\n", sol.start, sol.start + diff) + 1
+        line_start = max(line_start, sol.start)
+        n_lines = sol.count_lines(line_start)
+        mismatch = {"line": n_lines - sol.count_lines(sol.start) + 1, "offset": None, "start_line": None,
+                    "windowed": max(len(sol), len(usr)) > max_preview_chars}
+        if sol.start == usr.start and sol.buf[:sol.start] == usr.buf[:usr.start]:
+            mismatch.update({"offset": line_start, "start_line": n_lines})
+        return (False, sol.preview(max_preview_chars, sol.start + diff), usr.preview(max_preview_chars, usr.start + diff), mismatch)
+
+## comparison modes for outputs whose order is not significant
+COMPARE_MODES = ["exact", "sort-rows", "set-rows", "sort-keys"]
+_COLUMN_PADDING = [(" \t", re.compile(r" +\t"), "\t"), ("\t ", re.compile(r"\t +"), "\t"), (" \n", re.compile(r" +\n"), "\n"), ("\n ", re.compile(r"\n +"), "\n")]
+
+def strip_column_padding(text):
+    """
+    Remove the spaces around tabs and newlines, e.g. added by format() to align the columns of data frames
+    """
+    for (padding, pattern, sep) in _COLUMN_PADDING:
+        if padding in text: ## much faster than searching with the regular expression
+            text = pattern.sub(sep, text)
+    return text
+
+def row_sort_keys(lines):
+    """
+    Sort keys (for np.lexsort, last key first) of the rows of a text output: one array per tab-separated column,
+    numeric for numeric columns and strings otherwise
+    """
+    n_cols = lines[0].count("\t") + 1
+    values = parse_numbers("\n".join(lines)) if len(lines) > 0 else None ## fast path for purely numeric rows
+    if values is not None and values.size == len(lines) * n_cols:
+        return list(values.reshape(len(lines), n_cols).T[::-1])
+    tokens = np.array("\t".join(lines).split("\t"))
+    table = tokens.reshape(len(lines), n_cols) if tokens.size == len(lines) * n_cols else np.array(lines).reshape(len(lines), 1)
+    keys = []
+    for j in range(table.shape[1]):
+        numeric = to_numeric(table[:, j])
+        keys.append(table[:, j] if numeric is None else numeric)
+    return keys[::-1]
+
+def sort_rows(lines, unique=False):
+    """
+    Sort the rows (lines) of a text output by their columns from left to right, numerically for numeric columns
+    (so that triplets are sorted by i and then j), and remove duplicated rows if unique
+    """
+    if len(lines) <= 1:
+        return lines
+    lines = np.array(lines, dtype=object)[np.lexsort(row_sort_keys(lines))].tolist()
+    if unique:
+        lines = [line for (k, line) in enumerate(lines) if k == 0 or line != lines[k-1]]
+    return lines
+
+class _JsonNumber(str):
+    """
+    A number in a JSON text, kept as written
+    """
+
+class _JsonPairs(list):
+    """
+    The (name, value) pairs of a JSON object, in the order written
+    """
+
+_raw_json_decoder = json.JSONDecoder(object_pairs_hook=_JsonPairs, parse_float=_JsonNumber, parse_int=_JsonNumber, parse_constant=_JsonNumber)
+
+def sorted_json_text(value):
+    """
+    JSON text of a value parsed by _raw_json_decoder, with the elements of objects sorted by name at all levels and numbers kept as written
+    """
+    if isinstance(value, _JsonPairs):
+        return "{" + ", ".join([f"{json.dumps(name)}: {sorted_json_text(v)}" for (name, v) in sorted(value, key=lambda item: item[0])]) + "}"
+    if isinstance(value, list):
+        return "[" + ", ".join([sorted_json_text(v) for v in value]) + "]"
+    if isinstance(value, _JsonNumber):
+        return str(value)
+    return json.dumps(value)
+
+def sort_json_keys(path):
+    """
+    A list written by write_list_to_json() with its elements sorted by name (also in nested lists), one per line, or None if it is not a valid JSON object.
+    The file is parsed one element at a time, and numbers are kept as written.
+    """
+    try:
+        items = [(name, sorted_json_text(_raw_json_decoder.decode(raw)) if raw[0] in "{[" else raw) for (name, value, raw) in iter_json_object(path)]
+    except ValueError:
+        return None
+    items.sort(key=lambda item: item[0])
+    return "{\n" + ",\n".join([f"{json.dumps(name)}: {raw}" for (name, raw) in items]) + "\n}"
+
+def first_char(path):
+    """
+    First non-whitespace character of a text file, or "" if there is none
+    """
+    with open(path, 'r', errors='replace') as f:
+        while True:
+            chunk = f.read(4096)
+            if len(chunk) == 0:
+                return ""
+            chunk = chunk.lstrip()
+            if len(chunk) > 0:
+                return chunk[0]
+
+def canonicalize_outputs(sol_path, usr_path, mode, sol_canon_path, usr_canon_path):
+    """
+    Write the two output files in a canonical order for the comparison mode, so that they can be compared exactly (or with tolerance):
+      - "sort-rows": rows of data frames, triplets of sparse matrices, and elements of vectors in any order, and list elements in any order of names
+      - "set-rows": same as "sort-rows", but duplicated rows are ignored
+      - "sort-keys": list elements in any order of names
+    The header of data frames (the first line, if the same and not numeric in both outputs) is kept first.
+    Returns the paths of the files to compare, which are the original files if the mode does not apply to the outputs.
+    """
+    if mode == "exact":
+        return (sol_path, usr_path)
+    firsts = [first_char(path) for path in [sol_path, usr_path]]
+    if firsts == ["{", "{"]:
+        canon = [sort_json_keys(path) for path in [sol_path, usr_path]]
+        if None in canon:
+            return (sol_path, usr_path)
+    elif mode == "sort-keys" or "{" in firsts:
+        return (sol_path, usr_path)
+    else:
+        texts = []
+        for path in [sol_path, usr_path]:
+            with open(path, 'r', errors='replace') as f:
+                texts.append(f.read().strip())
+        lines = [strip_column_padding(t).split("\n") for t in texts]
+        n_header = 1 if ( lines[0][0] == lines[1][0] and min(len(lines[0]), len(lines[1])) > 1 and parse_numbers(lines[0][0]) is None ) else 0
+        canon = ["\n".join(l[:n_header] + sort_rows(l[n_header:], mode == "set-rows")) for l in lines]
+    for (path, text) in zip([sol_canon_path, usr_canon_path], canon):
+        with open(path, 'w') as f:
+            f.write(text + "\n")
+    return (sol_canon_path, usr_canon_path)
+
+## binary results written by write.binary.result() in assets/autogradescoper_utils.R
+BINARY_MAGIC = b"AGSB"
+BINARY_TYPES = {1: ("double", "<f8"), 2: ("integer", "<i4"), 3: ("logical", "<i4")}
+INT_NA = np.iinfo(np.int32).min
+
+def is_binary_result(path):
+    """
+    Check whether the output file was written by write.binary.result()
+    """
+    with open(path, 'rb') as f:
+        return f.read(4) == BINARY_MAGIC
+
+def read_binary_result(path):
+    """
+    Read an output file written by write.binary.result() as a memory-mapped array (column-major, as in R).
+    Returns (type_name, values).
+    """
+    with open(path, 'rb') as f:
+        (magic, version, type, ndim) = np.frombuffer(f.read(16), dtype="<i4")
+        dims = tuple(int(d) for d in np.frombuffer(f.read(4 * ndim), dtype="<i4"))
+    if version != 1 or type not in BINARY_TYPES:
+        raise ValueError(f"Unsupported binary result in {path}")
+    (type_name, dtype) = BINARY_TYPES[type]
+    offset = 16 + 4 * ndim + (4 if ndim % 2 == 1 else 0)
+    if np.prod(dims) == 0:
+        return (type_name, np.zeros(dims, dtype=dtype))
+    return (type_name, np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=dims, order='F'))
+
+def binary_as_float(type_name, values):
+    """
+    Convert the values of a binary result into floats, with NA as nan
+    """
+    if type_name == "double":
+        return np.asarray(values)
+    return np.where(values == INT_NA, np.nan, values.astype(float))
+
+def format_like_formatc(values, digits, format):
+    """
+    Text of the values as written by formatC(values, digits, format) in R, which formats each value with C sprintf
+    (after round() for "d"), or None for the formats that are not numeric
+    """
+    if format == "d":
+        spec = "%.0f"
+    elif format in ["f", "e", "E", "g", "G"]:
+        spec = f"%.{digits}{format}"
+    else:
+        return None
+    return np.array([spec % v for v in values.tolist()], dtype=object)
+
+def format_binary_preview(path, max_values=20):
+    """
+    Short text description of a binary result, showing only the first values
+    """
+    (type_name, values) = read_binary_result(path)
+    flat = np.asarray(values).ravel(order='F')
+    shown = " ".join(["NA" if ( type_name != "double" and v == INT_NA ) else f"{v:.8g}" for v in flat[:max_values]])
+    dims = "x".join(str(d) for d in values.shape)
+    return f"[{type_name} {'matrix' if values.ndim == 2 else ( 'vector' if values.ndim == 1 else 'array' )} of size {dims}] {shown}" + (" ..." if flat.size > max_values else "")
+
+def compare_binary_results(sol_path, usr_path, digits=8, format="g", atol=None, rtol=None, max_report=5):
+    """
+    Compare two binary results. The values are compared with tolerance if atol or rtol is given,
+    otherwise as the text output would be (see format_like_formatc()).
+    Returns (passed, message), where message describes the mismatches.
+    """
+    if not is_binary_result(usr_path):
+        return (False, "The output is not a numeric vector or matrix as expected")
+    ((sol_type, sol_values), (usr_type, usr_values)) = (read_binary_result(sol_path), read_binary_result(usr_path))
+    if sol_values.shape != usr_values.shape:
+        return (False, f"The output has dimensions {usr_values.shape}, but {sol_values.shape} were expected")
+    if ( sol_type == "logical" ) != ( usr_type == "logical" ):
+        return (False, f"The output is {usr_type}, but {sol_type} was expected")
+
+    (sol_flat, usr_flat) = (binary_as_float(sol_type, sol_values.ravel(order='F')), binary_as_float(usr_type, usr_values.ravel(order='F')))
+    if atol is not None or rtol is not None:
+        (atol, rtol) = (atol if atol is not None else 0, rtol if rtol is not None else 0)
+        ok = np.isclose(usr_flat, sol_flat, rtol=rtol, atol=atol, equal_nan=True)
+        criteria = f"within the tolerance (atol={atol}, rtol={rtol})"
+    else:
+        ok = ( ( sol_flat == usr_flat ) & ( np.signbit(sol_flat) == np.signbit(usr_flat) ) ) | ( np.isnan(sol_flat) & np.isnan(usr_flat) ) ## -0 is printed as "-0"
+        ## only the values that differ are formatted, with the same sprintf format as the text output, so that both outputs give the same result
+        differ = np.nonzero(~ok)[0]
+        (sol_text, usr_text) = (format_like_formatc(sol_flat[differ], digits, format), format_like_formatc(usr_flat[differ], digits, format))
+        if sol_text is not None:
+            ok[differ] = sol_text == usr_text
+        (atol, rtol) = (0, 0)
+        criteria = f"identical up to digits={digits} (format={format})"
+    mismatched = np.nonzero(~ok)[0]
+    if mismatched.size == 0:
+        return (True, f"All {sol_flat.size} values are {criteria}")
+
+    with np.errstate(invalid='ignore'):
+        excess = np.abs(usr_flat[mismatched] - sol_flat[mismatched]) - (atol + rtol * np.abs(sol_flat[mismatched]))
+    excess = np.where(np.isnan(excess), np.inf, excess)
+    top = mismatched[np.argsort(-excess, kind="stable")[:max_report]]
+    message = f"{mismatched.size} of {sol_flat.size} values are not {criteria}. The largest differences are:\n"
+    n_rows = sol_values.shape[0] if sol_values.ndim > 0 else 1
+    for k in top:
+        loc = f"element {k+1}" if sol_values.ndim < 2 else f"row {k % n_rows + 1}, column {k // n_rows + 1}"
+        message += f"  {loc}: expected {sol_flat[k]:.10g}, observed {usr_flat[k]:.10g}\n"
+    return (False, message)
@@ -0,0 +1,109 @@
+import os, signal, asyncio, subprocess, threading
+
+## exit codes reported for processes killed by the driver
+TIMEOUT_EXIT_CODE = 124 ## same as the timeout command
+OUTPUT_LIMIT_EXIT_CODE = 128 + signal.SIGXFSZ ## same as exceeding the file size limit of prlimit --fsize
+
+## maximum size of stderr kept in memory, beyond which it is truncated (but still counted towards the output limit)
+MAX_KEPT_STDERR_BYTES = 1 << 20
+
+async def _drain(stream, max_bytes, max_kept_bytes, on_exceed):
+    """
+    Read the stream until EOF, keeping up to max_kept_bytes, and call on_exceed() once if more than max_bytes are read
+    """
+    (total, kept) = (0, [])
+    while True:
+        data = await stream.read(1 << 16)
+        if not data:
+            return b"".join(kept)
+        if total < max_kept_bytes:
+            kept.append(data[:max_kept_bytes - total])
+        total += len(data)
+        if max_bytes is not None and total > max_bytes:
+            on_exceed()
+
+async def _open_stream(pipe):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    return reader
+
+async def _wait4(pid):
+    """
+    Wait for the process to exit without blocking the event loop, and return (pid, status, rusage) of os.wait4()
+    """
+    pidfd = None
+    if hasattr(os, "pidfd_open"): ## Linux 5.3+, readable when the process exits
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            pidfd = None
+    if pidfd is not None:
+        loop = asyncio.get_running_loop()
+        exited = loop.create_future()
+        loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await exited
+        finally:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+        return os.wait4(pid, 0)
+    while True:
+        (wpid, status, rusage) = os.wait4(pid, os.WNOHANG)
+        if wpid != 0:
+            return (wpid, status, rusage)
+        await asyncio.sleep(0.005)
+
+async def run_command_async(cmd, timeout=None, max_output_bytes=None):
+    """
+    Run the command (a list, without a shell) in its own process group, streaming its stdout (discarded) and stderr.
+    The whole process group is killed if it runs longer than timeout seconds, or writes more than max_output_bytes to stdout or stderr.
+    Returns (exit code, stderr, usage), where the exit code is TIMEOUT_EXIT_CODE or OUTPUT_LIMIT_EXIT_CODE if killed by the driver,
+    and usage is a dict of the user/system CPU time and the peak RSS in kilobytes (see format_usage() in utils.py).
+    """
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+    killed = []
+    def kill(reason):
+        if len(killed) == 0:
+            killed.append(reason)
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    (stdout, stderr) = (await _open_stream(proc.stdout), await _open_stream(proc.stderr))
+    on_exceed = lambda: kill(OUTPUT_LIMIT_EXIT_CODE)
+    finished = asyncio.gather(_drain(stdout, max_output_bytes, 0, on_exceed),
+                              _drain(stderr, max_output_bytes, MAX_KEPT_STDERR_BYTES, on_exceed),
+                              _wait4(proc.pid))
+    try:
+        (_, err, (pid, status, rusage)) = await asyncio.wait_for(asyncio.shield(finished), timeout)
+    except asyncio.TimeoutError:
+        kill(TIMEOUT_EXIT_CODE)
+        (_, err, (pid, status, rusage)) = await finished
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    if len(killed) > 0:
+        exit_code = killed[0]
+    else:
+        exit_code = proc.returncode if proc.returncode >= 0 else 128 - proc.returncode ## same as the exit code reported by a shell
+    usage = {"user": rusage.ru_utime, "sys": rusage.ru_stime, "maxrss_kb": rusage.ru_maxrss}
+    return (exit_code, err.decode(errors="replace"), usage)
+
+## a single event loop in a background thread handles the I/O of all processes in flight
+_loop = None
+_loop_lock = threading.Lock()
+
+def driver_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="autogradescoper-driver", daemon=True).start()
+    return _loop
+
+def run_command(cmd, timeout=None, max_output_bytes=None):
+    """
+    Same as run_command_async(), for callers outside of the event loop (e.g. the threads of run_parallel())
+    """
+    return asyncio.run_coroutine_threadsafe(run_command_async(cmd, timeout, max_output_bytes), driver_loop()).result()
@@ -0,0 +1,155 @@
+import os, signal, subprocess, tempfile, threading, queue, time, atexit
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+forkserver_script = f"{repo_dir}/assets/autogradescoper_forkserver.R"
+
+REPLY_PREFIX = "@@AGS@@\t"
+
+class RForkServer:
+    """
+    A long-lived R process that sources the preload scripts and the function file once,
+    and forks a child process for each test case script (see assets/autogradescoper_forkserver.R)
+    """
+    def __init__(self, source_scripts, startup_timeout=None):
+        self.source_scripts = tuple(source_scripts)
+        self.startup_timeout = startup_timeout ## seconds to source the scripts (None for no limit)
+        self.ferr = tempfile.TemporaryFile()
+        start_time = time.time()
+        self.proc = subprocess.Popen(["Rscript", forkserver_script] + list(self.source_scripts),
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.ferr,
+                                     text=True, bufsize=1, start_new_session=True) ## its own process group, killed on timeout except the server
+        self.replies = queue.Queue()
+        threading.Thread(target=self._read_replies, name="autogradescoper-forkserver", daemon=True).start()
+        try:
+            reply = self.replies.get(timeout=startup_timeout)
+            self.startup_timed_out = False
+        except queue.Empty: ## e.g. an infinite loop at the top level of the sourced file
+            reply = None
+            self.startup_timed_out = True
+            self.kill()
+        self.startup_time = time.time() - start_time
+        self.ready = (reply == ["READY"])
+        self.startup_failed = not self.ready  ## sourcing errors are deterministic, so the server stays reusable
+        self.error_message = "" if self.ready else self._read_stderr()
+
+    def _read_replies(self):
+        """
+        Queue the replies of the server, skipping anything printed by the sourced scripts, and None at the end of its output
+        """
+        for line in self.proc.stdout:
+            if line.startswith(REPLY_PREFIX):
+                self.replies.put(line[len(REPLY_PREFIX):].rstrip("\n").split("\t"))
+        self.replies.put(None)
+
+    def _read_reply(self):
+        """
+        Read the next reply from the server (None if it exited)
+        """
+        return self.replies.get()
+
+    def _read_stderr(self):
+        self.ferr.seek(0)
+        return self.ferr.read().decode(errors="replace")
+
+    def alive(self):
+        return self.startup_failed or ( self.ready and self.proc.poll() is None )
+
+    def usable(self, startup_timeout=None):
+        """
+        Whether the server can run test cases that may spend up to startup_timeout seconds sourcing the scripts:
+        a server that timed out while sourcing them is reused only for test cases that would time out as well
+        """
+        if self.startup_timed_out and ( startup_timeout is None or startup_timeout > self.startup_timeout ):
+            return False
+        return self.alive()
+
+    def kill(self):
+        """
+        Kill the server and all the processes it started
+        """
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.proc.wait()
+
+    def run(self, script_path, out_path, err_path, timeout=None, limit_options=()):
+        """
+        Run a test case script in a forked child, and return (exit code, usage), where the exit code is 124 for timeout
+        (including a timeout while the server was sourcing the scripts), and usage is a dict of the user/system CPU time
+        and peak RSS of the child since it was forked (None if unknown).
+        limit_options are the options of prlimit (see r_limit_options() in utils.py) applied to the child only.
+        """
+        usage = {"user": None, "sys": None, "maxrss_kb": None}
+        if not self.ready:
+            open(out_path, 'w').close()
+            with open(err_path, 'w') as ferr:
+                ferr.write(self.error_message)
+            return (124 if self.startup_timed_out else 1, usage)
+        try:
+            self.proc.stdin.write(f"RUN\t{script_path}\t{out_path}\t{err_path}\t{timeout if timeout is not None else 0}\t{' '.join(limit_options)}\n")
+            self.proc.stdin.flush()
+            reply = self._read_reply()
+        except (BrokenPipeError, OSError):
+            reply = None
+        if reply is None or reply[0] != "DONE":
+            ## the server died while running the case
+            self.ready = False
+            self.error_message = self._read_stderr()
+            with open(err_path, 'a') as ferr:
+                ferr.write(self.error_message)
+            return (1, usage)
+        for (k, v) in zip(["user", "sys", "maxrss_kb"], reply[2:5]):
+            usage[k] = None if v == "NA" else ( int(float(v)) if k == "maxrss_kb" else float(v) )
+        return (int(reply[1]), usage)
+
+    def close(self):
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.write("QUIT\n")
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except (BrokenPipeError, OSError, subprocess.TimeoutExpired):
+                self.kill()
+        self.ferr.close()
+
+## idle servers, keyed by the tuple of scripts they have sourced
+_idle_servers = {}
+_all_servers = []
+_servers_lock = threading.Lock()
+
+def acquire_fork_server(source_scripts, startup_timeout=None):
+    """
+    Get an idle fork server that sourced the given scripts, starting a new one if needed,
+    which must source them within startup_timeout seconds (None for no limit)
+    """
+    key = tuple(source_scripts)
+    with _servers_lock:
+        idle = _idle_servers.get(key, [])
+        for server in list(idle):
+            if server.usable(startup_timeout):
+                idle.remove(server)
+                return server
+            if not server.alive():
+                idle.remove(server)
+                _all_servers.remove(server)
+                server.close()
+    server = RForkServer(key, startup_timeout)
+    with _servers_lock:
+        _all_servers.append(server)
+    return server
+
+def release_fork_server(server):
+    """
+    Return a fork server to the idle pool so that other test cases can reuse it
+    """
+    with _servers_lock:
+        _idle_servers.setdefault(server.source_scripts, []).append(server)
+
+@atexit.register
+def shutdown_fork_servers():
+    with _servers_lock:
+        for server in _all_servers:
+            server.close()
+        _all_servers.clear()
+        _idle_servers.clear()
@@ -0,0 +1,95 @@
+import json
+
+## number of characters read at a time when parsing a JSON file
+JSON_CHUNK_CHARS = 1 << 20
+
+_WHITESPACE = " \t\n\r"
+
+class _JsonReader:
+    """
+    Buffer over a text file for parsing a JSON document one value at a time, keeping only the unparsed part in memory
+    """
+    def __init__(self, f, chunk_chars):
+        (self.f, self.chunk_chars) = (f, chunk_chars)
+        (self.buf, self.pos, self.eof) = ("", 0, False)
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        """
+        Read more of the file, at least as much as is already buffered so that retrying a long value takes linear time overall.
+        Returns False at the end of the file.
+        """
+        if self.eof:
+            return False
+        if self.pos > 0:
+            (self.buf, self.pos) = (self.buf[self.pos:], 0)
+        data = self.f.read(max(self.chunk_chars, len(self.buf)))
+        if len(data) == 0:
+            self.eof = True
+            return False
+        self.buf += data
+        return True
+
+    def peek(self):
+        """
+        Next character after whitespace (without consuming it), or "" at the end of the file
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos+1]
+
+    def expect(self, chars):
+        c = self.peek()
+        if c == "" or c not in chars:
+            raise ValueError(f"Expected one of {chars!r} in the JSON output, found {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        """
+        Parse the next value, and return it with its JSON text
+        """
+        self.peek()
+        while True:
+            try:
+                (obj, end) = self.decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof: ## a number may continue in the next chunk
+                    raw = self.buf[self.pos:end]
+                    self.pos = end
+                    return (obj, raw)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+def iter_json_object(path, chunk_chars=JSON_CHUNK_CHARS):
+    """
+    Iterate over the elements of the JSON object in a file (e.g. written by write_list_to_json() in assets/autogradescoper_utils.R)
+    without reading the whole file at once, yielding (name, value, raw) where raw is the JSON text of the value.
+    NaN and Infinity are accepted as numbers. Raises ValueError if the file is not a valid JSON object.
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        reader = _JsonReader(f, chunk_chars)
+        reader.expect("{")
+        if reader.peek() == "}":
+            reader.pos += 1
+        else:
+            while True:
+                (name, _) = reader.value()
+                if not isinstance(name, str):
+                    raise ValueError("Expected a string as the name of an element in the JSON output")
+                reader.expect(":")
+                (value, raw) = reader.value()
+                yield (name, value, raw)
+                if reader.expect(",}") == "}":
+                    break
+        if reader.peek() != "":
+            raise ValueError("Extra data after the JSON object in the output")
+
+def load_json_object(path):
+    """
+    The JSON object in a file as a dict, parsed one element at a time
+    """
+    return {name: value for (name, value, raw) in iter_json_object(path)}
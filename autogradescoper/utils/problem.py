@@ -0,0 +1,95 @@
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+from autogradescoper.utils.utils import load_file_to_dict
+
+class ConfigEntry:
+    """
+    Entry of a configuration file, whose fields are read in the same way as the dict loaded from the file
+    """
+    def get(self, name: str, default: Any = None) -> Any:
+        """
+        Value of the field, or default if it is not set
+        """
+        value = getattr(self, name)
+        return default if value is None else value
+
+@dataclass
+class TestCase(ConfigEntry):
+    """
+    A test case, with the same fields as each entry of the problem-specific configuration file (see docs/full/config.md).
+    Limits left as None use the values of the problem.
+    """
+    args: str
+    maxtime: Optional[float] = None
+    maxtime_factor: Optional[float] = None
+    maxtime_floor: Optional[float] = None
+    maxscore: float = 1
+    maxmemory: Optional[float] = None
+    maxcputime: Optional[float] = None
+    maxoutput: Optional[float] = None
+    atol: Optional[float] = None
+    rtol: Optional[float] = None
+    compare: Optional[str] = None
+    scaling: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "TestCase":
+        return cls(**{k: v for (k, v) in d.items() if k in cls.__dataclass_fields__})
+
+    @classmethod
+    def load_all(cls, config_path: str) -> List["TestCase"]:
+        """
+        All test cases of the problem-specific configuration file
+        """
+        return [cls.from_dict(c) for c in load_file_to_dict(config_path)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: v for (k, v) in asdict(self).items() if v is not None}
+
+@dataclass
+class Problem(ConfigEntry):
+    """
+    A problem, with the same fields as each entry of the general configuration file (see docs/full/config.md), and its test cases
+    """
+    func: str
+    cases: List[TestCase]
+    filename: Optional[str] = None ## default: func
+    digits: int = 8
+    format: str = "g"
+    preload_usr: Optional[str] = None
+    preload_sol: Optional[str] = None
+    binary_output: Optional[bool] = None
+    atol: Optional[float] = None
+    rtol: Optional[float] = None
+    compare: Optional[str] = None
+    maxmemory: Optional[float] = None
+    maxcputime: Optional[float] = None
+    maxoutput: Optional[float] = None
+    maxtime_factor: Optional[float] = None
+    maxtime_floor: Optional[float] = None
+    config: Optional[str] = None ## problem-specific configuration file the test cases were loaded from, if any
+
+    def __post_init__(self):
+        if self.filename is None:
+            self.filename = self.func
+
+    @classmethod
+    def from_dict(cls, v: Dict[str, Any]) -> "Problem":
+        """
+        Problem from an entry of the general configuration file, loading its test cases from the "config" file
+        """
+        return cls(cases=TestCase.load_all(v["config"]), **{k: val for (k, val) in v.items() if k in cls.__dataclass_fields__ and k != "cases"})
+
+    @classmethod
+    def load_all(cls, config_path: str) -> List["Problem"]:
+        """
+        All problems of the general configuration file
+        """
+        return [cls.from_dict(v) for v in load_file_to_dict(config_path)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Entry of the general configuration file, without the test cases
+        """
+        return {k: v for (k, v) in asdict(self).items() if v is not None and k != "cases"}
@@ -0,0 +1,52 @@
+import os, json, threading, time
+
+from autogradescoper.utils.utils import write_dict_to_file
+
+## minimum interval in seconds between two rewrites of the results file while test cases are being evaluated
+RESULTS_REFRESH_SECONDS = 1.0
+
+def replace_dict_file(data, file_path):
+    """
+    Write a dictionary to a JSON file through a temporary file, so that readers never see a partially written file
+    """
+    tmp_path = f"{file_path}.tmp"
+    write_dict_to_file(data, tmp_path, "json")
+    os.replace(tmp_path, file_path)
+
+class ProgressWriter:
+    """
+    Streams the results of a run to disk while the test cases are evaluated, so that they are not lost if the run is stopped:
+    an event is appended to {out_prefix}.events.jsonl for each finished test case, and {out_prefix}.json is rewritten
+    from build_results(case_results) at most every `interval` seconds, always as a complete and valid file.
+    case_results is the dict of output prefix to fields shared with the caller, updated through record().
+    """
+    def __init__(self, out_prefix, case_results, build_results, interval=RESULTS_REFRESH_SECONDS):
+        (self.out_prefix, self.case_results, self.build_results, self.interval) = (out_prefix, case_results, build_results, interval)
+        self.start_time = time.time()
+        self.last_write = None
+        self.lock = threading.Lock()
+        with open(f"{out_prefix}.events.jsonl", 'w'):
+            pass
+
+    def record(self, prefix, fields, **event):
+        """
+        Store the results of a finished test case, and append an event with its score and elapsed time (and the other keyword arguments)
+        """
+        with self.lock:
+            self.case_results[prefix] = fields
+            event.update({"time": round(time.time() - self.start_time, 3), "score": fields["score"], "elapsed": float(fields["usr_time"])})
+            with open(f"{self.out_prefix}.events.jsonl", 'a') as f:
+                f.write(json.dumps(event) + "\n")
+            if self.last_write is None or time.time() - self.last_write >= self.interval:
+                self._write()
+
+    def write(self):
+        """
+        Rewrite the results file now
+        """
+        with self.lock:
+            self._write()
+
+    def _write(self):
+        replace_dict_file(self.build_results(self.case_results), f"{self.out_prefix}.json")
+        self.last_write = time.time()
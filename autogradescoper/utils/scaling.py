@@ -0,0 +1,104 @@
+import os, math, statistics
+
+from autogradescoper.utils.utils import r_load_args_cmds, r_source_scripts
+
+def write_r_scaling_script(func_name, out_prefix, in_func_path, in_params, sizes, warmup, repeats, preload_scripts):
+    """
+    Write {out_prefix}.R that calls the R function on inputs of increasing size, and appends a line for each size
+    to {out_prefix}.out with the index of the size and the elapsed time of each timed call, separated by tabs.
+    The input arguments are loaded again for each size, with the size available as the variable n (e.g. eval:runif(n)),
+    and the function is called warmup times before the timed calls.
+    """
+    out_path = f"{out_prefix}.out"
+    if os.path.exists(out_path): ## the timings are appended
+        os.remove(out_path)
+    out_cmds = r_load_args_cmds(in_params)
+    call_cmd = f"{func_name}(" + ", ".join([f"arg{i+1}" for i in range(len(out_cmds))]) + ")"
+    with open(f"{out_prefix}.R", 'w') as fout:
+        for source_script in r_source_scripts(in_func_path, preload_scripts):
+            fout.write(f"source('{source_script}')\n")
+        fout.write("autograde.sizes <- c(" + ", ".join([f"{int(n)}L" for n in sizes]) + ")\n")
+        fout.write("for (autograde.k in seq_along(autograde.sizes)) {\n")
+        fout.write("n <- autograde.sizes[autograde.k]\n")
+        fout.write("\n".join(out_cmds))
+        fout.write("\n")
+        fout.write(f"for (autograde.i in seq_len({int(warmup)})) invisible({call_cmd})\n")
+        fout.write("autograde.times <- numeric(0)\n")
+        fout.write(f"for (autograde.i in seq_len({int(repeats)})) {{\n")
+        fout.write("    invisible(gc(FALSE)) ## so that garbage collection of earlier calls is not timed\n")
+        fout.write("    autograde.start <- as.numeric(Sys.time())\n")
+        fout.write(f"    invisible({call_cmd})\n")
+        fout.write("    autograde.times <- c(autograde.times, as.numeric(Sys.time()) - autograde.start)\n")
+        fout.write("}\n")
+        fout.write(f"cat(paste(c(autograde.k, sprintf('%.6f', autograde.times)), collapse='\\t'), '\\n', sep='', file='{out_path}', append=TRUE)\n")
+        fout.write("}\n")
+
+def read_scaling_times(out_path, sizes):
+    """
+    Median elapsed time for each size written by the script of write_r_scaling_script(), as a list in the order of sizes.
+    Sizes not reached (e.g. due to an error) are None.
+    """
+    medians = [None] * len(sizes)
+    if not os.path.exists(out_path):
+        return medians
+    with open(out_path, 'r') as f:
+        for line in f:
+            toks = line.split()
+            if len(toks) < 2:
+                continue
+            k = int(toks[0]) - 1
+            if 0 <= k < len(sizes):
+                medians[k] = statistics.median([float(t) for t in toks[1:]])
+    return medians
+
+def fit_scaling_exponent(sizes, times):
+    """
+    Least squares slope of log(time) against log(size), i.e. the exponent k of time ~ size^k.
+    Returns None if fewer than two sizes have a measured time.
+    """
+    points = [(math.log(n), math.log(max(t, 1e-6))) for (n, t) in zip(sizes, times) if t is not None and n > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for (x, y) in points) / len(points)
+    mean_y = sum(y for (x, y) in points) / len(points)
+    sxx = sum((x - mean_x) ** 2 for (x, y) in points)
+    if sxx == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for (x, y) in points) / sxx
+
+def format_scaling_table(sizes, usr_times, sol_times=None):
+    """
+    Table of the median elapsed time for each size, to show in the details
+    """
+    lines = [f"{'n':>12s} {'submission':>12s}" + (f" {'solution':>12s}" if sol_times is not None else "")]
+    for k, n in enumerate(sizes):
+        line = f"{n:>12d} " + (f"{usr_times[k]:>11.6f}s" if usr_times[k] is not None else f"{'NA':>12s}")
+        if sol_times is not None:
+            line += " " + (f"{sol_times[k]:>11.6f}s" if sol_times[k] is not None else f"{'NA':>12s}")
+        lines.append(line)
+    return "\n".join(lines)
+
+def score_scaling(sizes, usr_times, sol_times, ref_exponent, tolerance, points=1, penalty=0):
+    """
+    Score of a scaling test case from the median times of the submission and the solution (None if the solution was not run).
+    The exponent of the submission is compared with ref_exponent if given, and otherwise with the exponent of the solution.
+    Passing awards points (shown as "pass" if 1), and failing deducts penalty (shown as "incorrect" if 0).
+    Returns (score, details, summary), where summary is a dict of the measurements to store with the results.
+    """
+    usr_exponent = fit_scaling_exponent(sizes, usr_times)
+    sol_exponent = fit_scaling_exponent(sizes, sol_times) if sol_times is not None else None
+    if ref_exponent is None:
+        ref_exponent = sol_exponent
+    summary = {"sizes": sizes, "usr_times": usr_times, "sol_times": sol_times, "usr_exponent": usr_exponent, "sol_exponent": sol_exponent,
+               "ref_exponent": ref_exponent, "tolerance": tolerance}
+    table = format_scaling_table(sizes, usr_times, sol_times)
+    if usr_exponent is None or None in usr_times:
+        return ("error", f"ERROR: The running time of the code could not be measured for all input sizes.\n{table}", summary)
+    if ref_exponent is None:
+        return ("error", f"ERROR: The running time of the solution could not be measured for all input sizes.\n{table}", summary)
+    str_growth = f"The running time grows as n^{usr_exponent:.2f} (expected: n^{ref_exponent:.2f}, allowed up to n^{ref_exponent + tolerance:.2f})."
+    if usr_exponent <= ref_exponent + tolerance:
+        score = "pass" if points == 1 else f"{points:g}"
+        return (score, f"PASS: {str_growth}\n{table}", summary)
+    score = "incorrect" if penalty == 0 else f"{-penalty:g}"
+    return (score, f"INCORRECT: {str_growth}\n{table}", summary)
@@ -0,0 +1,179 @@
+import os, shutil, tempfile, threading, time, socket
+
+from autogradescoper.utils.utils import args_data_files, hash_files
+
+## suffixes of the files produced by run_r_eval_script() (and write_timing_context()) that are stored in the cache
+CACHED_SUFFIXES = ["out", "time", "exitcode", "usage", "err", "context"]
+
+## bump when the way the solution outputs are written changes (e.g. r_write_result_cmds() in utils.py, or
+## write_list_to_json() in assets/autogradescoper_utils.R), so that outputs written in an old format are not used
+CACHE_VERSION = 3
+
+## hit/miss counts of the solution cache in this process
+cache_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+def solution_cache_key(func_name, in_func_path, in_params, out_digits, out_format, preload_scripts, binary_output=False):
+    """
+    Content hash of everything that determines the output of the solution for a test case,
+    or None if the input arguments may read files that cannot be tracked (see args_data_files()), so that the output is not cached
+    """
+    data_files = args_data_files(in_params)
+    if data_files is None:
+        return None
+    paths = [in_func_path, in_params] + data_files + list(preload_scripts)
+    return hash_files(paths, extra=[CACHE_VERSION, func_name, out_digits, out_format] + (["binary"] if binary_output else []))
+
+def timing_context(executor):
+    """
+    Where and how a solution time is measured: the host, and how the solution was run ("plain", "forked", or "batch")
+    """
+    return f"{socket.gethostname()}\t{executor}"
+
+def write_timing_context(out_prefix, executor):
+    """
+    Record in {out_prefix}.context that the time in {out_prefix}.time was measured on this host with the executor
+    """
+    with open(f"{out_prefix}.context", 'w') as fcontext:
+        fcontext.write(timing_context(executor) + "\n")
+
+def read_timing_context(out_prefix):
+    """
+    Where and how the time in {out_prefix}.time was measured (see timing_context()), or None if unknown
+    """
+    if not os.path.exists(f"{out_prefix}.context"):
+        return None
+    with open(f"{out_prefix}.context", 'r') as fcontext:
+        return fcontext.read().strip()
+
+def _count(key):
+    with _stats_lock:
+        cache_stats[key] += 1
+
+class SolutionCache:
+    """
+    Persistent on-disk cache of the solution outputs, keyed by solution_cache_key().
+    Each entry is a directory {cache_dir}/{key[:2]}/{key}/ containing the .out, .time, .exitcode, .usage, and .err files.
+    """
+    def __init__(self, cache_dir, max_mb=None):
+        self.cache_dir = cache_dir
+        self.max_mb = max_mb
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def lookup(self, key, out_prefix):
+        """
+        Copy the cached outputs to {out_prefix}.* and return (elapsed_time, exit_code, error_message), or None if missing
+        (always for the key None of an output that is not cached)
+        """
+        if key is None:
+            _count("misses")
+            return None
+        entry = self.entry_dir(key)
+        if not os.path.isfile(os.path.join(entry, "exitcode")):
+            _count("misses")
+            return None
+        try:
+            for suffix in CACHED_SUFFIXES:
+                if os.path.exists(os.path.join(entry, suffix)):
+                    shutil.copyfile(os.path.join(entry, suffix), f"{out_prefix}.{suffix}")
+                elif os.path.exists(f"{out_prefix}.{suffix}"): ## stale output from an earlier run
+                    os.remove(f"{out_prefix}.{suffix}")
+            os.utime(entry) ## mark as recently used for eviction
+        except FileNotFoundError: ## evicted by another process in the meantime
+            _count("misses")
+            return None
+        _count("hits")
+
+        with open(f"{out_prefix}.time", 'r') as ftime:
+            elapsed_time = float(ftime.read().strip())
+        with open(f"{out_prefix}.exitcode", 'r') as fexit:
+            exit_code = int(fexit.read().strip())
+        error_message = ""
+        if os.path.exists(f"{out_prefix}.err"):
+            with open(f"{out_prefix}.err", 'r') as ferr:
+                error_message = ferr.read()
+        return (elapsed_time, exit_code, error_message)
+
+    def store(self, key, out_prefix):
+        """
+        Store the outputs {out_prefix}.* produced by run_r_eval_script() under the key (nothing for the key None)
+        """
+        if key is None:
+            return
+        entry = self.entry_dir(key)
+        if os.path.exists(entry):
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp.", dir=os.path.dirname(entry))
+        for suffix in CACHED_SUFFIXES:
+            if os.path.exists(f"{out_prefix}.{suffix}"):
+                shutil.copyfile(f"{out_prefix}.{suffix}", os.path.join(tmp_dir, suffix))
+        try:
+            os.rename(tmp_dir, entry) ## atomic, so that readers never see a partial entry
+        except OSError: ## stored by another process in the meantime
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        if self.max_mb is not None:
+            self.evict(self.max_mb)
+
+    def entries(self):
+        """
+        List of (last_used, size_in_bytes, path) for each cache entry
+        """
+        rets = []
+        for sub in os.listdir(self.cache_dir):
+            sub_dir = os.path.join(self.cache_dir, sub)
+            if not os.path.isdir(sub_dir):
+                continue
+            for key in os.listdir(sub_dir):
+                entry = os.path.join(sub_dir, key)
+                if key.startswith(".tmp.") or not os.path.isdir(entry):
+                    continue
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                    rets.append((os.path.getmtime(entry), size, entry))
+                except FileNotFoundError:
+                    pass
+        return rets
+
+    def evict(self, max_mb):
+        """
+        Remove the least recently used entries until the cache fits in max_mb megabytes.
+        Returns the number of removed entries.
+        """
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+        n_removed = 0
+        for (last_used, size, entry) in entries:
+            if total <= max_mb * 1024 * 1024:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            n_removed += 1
+        return n_removed
+
+    def clear(self):
+        """
+        Remove all cache entries
+        """
+        for (last_used, size, entry) in self.entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+def run_cached_solution(sol_cache, key, out_prefix, run_func, executor=None):
+    """
+    Look up the solution outputs in the cache, or run run_func() and store its outputs if it succeeded,
+    with the timing context of the executor run_func() uses (see timing_context()).
+    Returns ((elapsed_time, exit_code, error_message), hit).
+    """
+    if sol_cache is not None:
+        ret = sol_cache.lookup(key, out_prefix)
+        if ret is not None:
+            return (ret, True)
+    ret = run_func()
+    if executor is not None:
+        write_timing_context(out_prefix, executor)
+    if sol_cache is not None and ret[1] == 0:
+        sol_cache.store(key, out_prefix)
+    return (ret, False)
@@ -0,0 +1,136 @@
+import os, threading, time, json, functools
+from contextlib import contextmanager
+
+## total time and number of calls of each grading stage in this process
+_stage_totals = {}
+_stages_lock = threading.Lock()
+
+## spans recorded as Chrome trace events, or None if tracing is disabled
+_trace_events = None
+
+## stages inside the R script, in the order of the timestamps written by r_timestamp_cmd()
+R_STAGES = ["sourcing", "argument_load", "function_call", "output_write"]
+
+def record_stage(name, seconds, start_time=None):
+    """
+    Add the time spent in a stage. If start_time (seconds since the epoch) is given, the stage is also traced as a span.
+    """
+    with _stages_lock:
+        total = _stage_totals.setdefault(name, {"seconds": 0.0, "count": 0})
+        total["seconds"] += seconds
+        total["count"] += 1
+    if start_time is not None:
+        add_span(name, start_time, start_time + seconds)
+
+@contextmanager
+def stage(name):
+    """
+    Context manager measuring the time spent in a stage
+    """
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        record_stage(name, time.time() - start_time, start_time)
+
+def start_tracing():
+    """
+    Start recording spans, discarding any spans recorded earlier
+    """
+    global _trace_events
+    with _stages_lock:
+        _trace_events = []
+
+def tracing():
+    return _trace_events is not None
+
+def add_span(name, start_time, end_time, args=None, cat="python"):
+    """
+    Record a span from start_time to end_time (seconds since the epoch) in the current thread, if tracing is enabled
+    """
+    if _trace_events is None:
+        return
+    event = {"name": name, "cat": cat, "ph": "X", "ts": round(start_time * 1e6, 1), "dur": round(max(0.0, end_time - start_time) * 1e6, 1),
+             "pid": os.getpid(), "tid": threading.get_native_id()}
+    if args:
+        event["args"] = args
+    with _stages_lock:
+        _trace_events.append(event)
+
+@contextmanager
+def span(name, **args):
+    """
+    Context manager recording a span if tracing is enabled
+    """
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        add_span(name, start_time, time.time(), args)
+
+def traced(name):
+    """
+    Decorator recording each call of the function as a span if tracing is enabled
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def write_trace(path):
+    """
+    Write the recorded spans as a Chrome trace event file (viewable in chrome://tracing or https://ui.perfetto.dev), and stop tracing
+    """
+    global _trace_events
+    with _stages_lock:
+        events = _trace_events if _trace_events is not None else []
+        _trace_events = None
+    with open(path, 'w') as f:
+        json.dump({"traceEvents": sorted(events, key=lambda e: e["ts"]), "displayTimeUnit": "ms"}, f)
+
+def stage_totals():
+    """
+    Copy of the total time and number of calls of each stage, as a dict of name to {"seconds", "count"}
+    """
+    with _stages_lock:
+        return {name: dict(total) for (name, total) in _stage_totals.items()}
+
+def reset_stages():
+    with _stages_lock:
+        _stage_totals.clear()
+
+def r_timestamp_cmd(timing_path, label):
+    """
+    R command appending a label and the current time (seconds since the epoch) to timing_path
+    """
+    return f"base::cat('{label}\\t', base::sprintf('%.6f', base::as.numeric(base::Sys.time())), '\\n', sep='', file='{timing_path}', append=TRUE)\n"
+
+def record_r_stages(timing_path, launch_time, end_time):
+    """
+    Record the stages of an R script from the timestamps written by r_timestamp_cmd(), where
+    launch_time and end_time are the times (seconds since the epoch) when R was launched and exited.
+    The time before the first timestamp is recorded as "r_startup", and after the last one as "r_exit".
+    """
+    if not os.path.exists(timing_path):
+        return
+    stamps = {}
+    with open(timing_path, 'r') as f:
+        for line in f:
+            toks = line.rstrip("\n").split("\t")
+            if len(toks) == 2:
+                stamps[toks[0]] = float(toks[1])
+    if "start" not in stamps:
+        return
+    record_stage("r_startup", max(0.0, stamps["start"] - launch_time))
+    add_span("r_startup", launch_time, stamps["start"], cat="R")
+    prev = stamps["start"]
+    for name in R_STAGES:
+        if name in stamps:
+            record_stage(name, max(0.0, stamps[name] - prev))
+            add_span(name, prev, stamps[name], cat="R")
+            prev = stamps[name]
+    record_stage("r_exit", max(0.0, end_time - prev))
+    add_span("r_exit", prev, end_time, cat="R")
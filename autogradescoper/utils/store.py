@@ -0,0 +1,97 @@
+import os, sqlite3, time, contextlib
+
+## fields stored for each test case, and the suffix of the corresponding file in the per-file layout
+CASE_FIELDS = {
+    "score": "score",
+    "usr_time": "usr.time",
+    "usr_exitcode": "usr.exitcode",
+    "usr_err": "usr.err",
+    "usr_usage": "usr.usage",
+    "sol_time": "sol.time",
+    "sol_exitcode": "sol.exitcode",
+    "sol_err": "sol.err",
+    "args": "args",
+    "details": "details",
+    "diffs": "diffs",
+    "errors": "errors",
+    "scaling": "scaling",
+    "input_hash": "input_hash",
+    "time_limit": "time_limit",
+}
+
+class ResultsStore:
+    """
+    Results of the test cases in a single SQLite database, one row per test case keyed by its output prefix
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir != "" and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cases (prefix TEXT PRIMARY KEY, "
+                         + ", ".join([f"{f} TEXT" for f in CASE_FIELDS]) + ", updated REAL)")
+            ## add the fields missing from a database created by an earlier version
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(cases)")]
+            for f in CASE_FIELDS:
+                if f not in columns:
+                    conn.execute(f"ALTER TABLE cases ADD COLUMN {f} TEXT")
+
+    @contextlib.contextmanager
+    def connect(self):
+        ## a new connection for each call, so that the store can be used from multiple threads, closed at the end of the call
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=60)) as conn:
+            with conn:
+                yield conn
+
+    def write_case(self, prefix, fields):
+        """
+        Insert or replace the results of the test case with the output prefix
+        """
+        names = [f for f in CASE_FIELDS if f in fields]
+        with self.connect() as conn:
+            conn.execute(f"INSERT OR REPLACE INTO cases (prefix, {', '.join(names)}, updated) VALUES (?, {', '.join(['?'] * len(names))}, ?)",
+                         [prefix] + [None if fields[f] is None else str(fields[f]) for f in names] + [time.time()])
+
+    def load_cases(self, prefixes):
+        """
+        Results of the test cases with the output prefixes, as a dict of prefix to a dict of fields
+        """
+        rows = {}
+        with self.connect() as conn:
+            conn.row_factory = sqlite3.Row
+            for start in range(0, len(prefixes), 500): ## stay within the limit of the number of SQL variables
+                chunk = prefixes[start:start+500]
+                for row in conn.execute(f"SELECT * FROM cases WHERE prefix IN ({', '.join(['?'] * len(chunk))})", chunk):
+                    rows[row["prefix"]] = dict(row)
+        return rows
+
+## fields written by eval_r_func_args in the per-file layout, in addition to the .time/.exitcode/.err files of each side
+EXPORTED_FIELDS = ["score", "args", "details", "diffs", "errors"]
+
+def export_case_files(prefix, fields):
+    """
+    Write the results of a test case in the per-file layout ({prefix}.score, {prefix}.details, ...)
+    """
+    for field in EXPORTED_FIELDS:
+        with open(f"{prefix}.{CASE_FIELDS[field]}", 'w') as f:
+            f.write(f"{fields[field]}\n" if field == "score" else fields[field])
+    for field in ["scaling", "input_hash", "time_limit"]: ## only for scaling test cases, and test cases evaluated by evaluate_case()
+        if fields.get(field) is not None:
+            with open(f"{prefix}.{CASE_FIELDS[field]}", 'w') as f:
+                f.write(f"{fields[field]}\n")
+
+def read_case_files(prefix):
+    """
+    Read the results of a test case from the per-file layout, in the same form as ResultsStore.load_cases()
+    """
+    fields = {"prefix": prefix}
+    for (field, suffix) in CASE_FIELDS.items():
+        if not os.path.exists(f"{prefix}.{suffix}"):
+            fields[field] = None
+            continue
+        with open(f"{prefix}.{suffix}", 'r') as f:
+            value = f.read()
+        fields[field] = value if field in EXPORTED_FIELDS[1:] or field.endswith("_err") else value.strip()
+    return fields
@@ -0,0 +1,38 @@
+import os, threading, statistics
+
+from autogradescoper.utils.utils import write_r_precheck_script, run_r_eval_script
+
+## time to start R and source the scripts, measured once per process for each list of scripts
+_overheads = {}
+_overheads_locks = {} ## one lock for each list of scripts, so that measuring one does not hold up the others
+_overheads_lock = threading.Lock()
+
+def r_startup_overhead(func_name, in_func_path, preload_scripts, work_prefix, repeats=3):
+    """
+    Median time in seconds to start R and source the preload scripts and the R file, without calling the function.
+    This is the part of the elapsed time of a test case (run without the fork server) that does not depend on the implementation of the function.
+    Measured on this machine the first time it is needed, and reused for the other test cases. Call it before evaluating
+    test cases in parallel (see measure_startup_overheads() in eval_r_func_problem), so that it is measured on an idle machine.
+    """
+    key = (func_name, in_func_path) + tuple(preload_scripts)
+    with _overheads_lock:
+        if key in _overheads:
+            return _overheads[key]
+        lock = _overheads_locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _overheads:
+            overhead_prefix = f"{work_prefix}.overhead"
+            write_r_precheck_script(func_name, overhead_prefix, in_func_path, preload_scripts)
+            times = []
+            for _ in range(repeats):
+                (elapsed_time, exit_code, error_message) = run_r_eval_script(overhead_prefix, None, record_files=False)
+                times.append(elapsed_time if exit_code == 0 else 0)
+            _overheads[key] = statistics.median(times)
+        return _overheads[key]
+
+def adaptive_time_limit(sol_time, overhead, factor, floor):
+    """
+    Time limit of the submission: the time spent by the solution in the function (sol_time) times factor, plus floor seconds,
+    plus the overhead of starting R that is not counted in sol_time
+    """
+    return round(overhead + floor + factor * sol_time, 2)
@@ -1,4 +1,9 @@
-import logging, os, shutil, sys, importlib, csv, json, yaml, subprocess, time
+import logging, io, os, re, argparse, shutil, sys, importlib, csv, json, yaml, subprocess, time, hashlib, queue, difflib, math, tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from autogradescoper.utils.forkserver import acquire_fork_server, release_fork_server
+from autogradescoper.utils.driver import run_command
+from autogradescoper.utils.stages import stage, record_stage, record_r_stages, r_timestamp_cmd, add_span, traced
 
 def get_func(name):
     """
@@ -8,6 +13,22 @@ def get_func(name):
     module = importlib.import_module(f"autogradescoper.scripts.{name}")
     return getattr(module,name)
 
+def parser_defaults(parser):
+    """
+    Default values of all arguments of an argparse parser, as a dict of destination to value
+    """
+    return {action.dest: action.default for action in parser._actions if action.dest != "help"}
+
+def default_namespace(defaults, values):
+    """
+    Arguments with the default values (see parser_defaults()) replaced by the given values, built without parsing a command line.
+    Raises TypeError for an unknown argument.
+    """
+    unknown = [name for name in values if name not in defaults]
+    if len(unknown) > 0:
+        raise TypeError(f"Unknown argument(s) {', '.join(unknown)}")
+    return argparse.Namespace(**dict(defaults, **values))
+
 def create_custom_logger(name, logfile=None, level=logging.INFO):
     """
     Create a custom logger object
@@ -17,6 +38,8 @@ def create_custom_logger(name, logfile=None, level=logging.INFO):
     logger.propagate = False  # Prevent log messages from being propagated to parent loggers
     
     if logger.hasHandlers():
+        for handler in logger.handlers:
+            handler.close()
         logger.handlers.clear()
     
     log_console_handler = logging.StreamHandler()
@@ -39,6 +62,15 @@ def create_custom_logger(name, logfile=None, level=logging.INFO):
     
     return logger
 
+def close_custom_logger(logger):
+    """
+    Close the handlers of a logger created by create_custom_logger, and forget the logger
+    """
+    for handler in logger.handlers:
+        handler.close()
+    logger.handlers.clear()
+    logging.Logger.manager.loggerDict.pop(logger.name, None)
+
 ## code suggested by ChatGPT
 def load_file_to_dict(file_path, file_type=None):
     """
@@ -93,36 +125,399 @@ def write_dict_to_file(data, file_path, file_type=None):
     else:
         raise ValueError("Unsupported file type. Please provide 'json' or 'yaml'/'yml' as file_type.")
     
-def diff_files(file1, file2, max_chars=500):
-    cmd = f"diff {file1} {file2}"
-    proc = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE)
-    diff_output = proc.stdout.decode()
+def edit_opcodes(a, b):
+    """
+    Differences between the lists a and b as (tag, i1, i2, j1, j2) tuples in the same format as difflib.SequenceMatcher.get_opcodes(),
+    from a shortest edit script (Myers' O(ND) algorithm), so that the differences are as few as those of `diff`
+    """
+    (n, m) = (len(a), len(b))
+    v = {1: 0}
+    trace = [] ## v before each round d, to trace the path back
+    for d in range(n + m + 1):
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            x = v[k + 1] if k == -d or ( k != d and v[k - 1] < v[k + 1] ) else v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                (x, y) = (x + 1, y + 1)
+            v[k] = x
+            if x >= n and y >= m:
+                break
+        else:
+            continue
+        break
+
+    ## trace the path back from the end, flagging the deleted lines of a and the inserted lines of b.
+    ## The flags are padded with an unchanged line before and after each list, as in shift_boundaries()
+    changed = ([0] * (n + 2), [0] * (m + 2))
+    (x, y) = (n, m)
+    for d in range(len(trace) - 1, 0, -1):
+        v = trace[d]
+        k = x - y
+        prev_k = k + 1 if k == -d or ( k != d and v[k - 1] < v[k + 1] ) else k - 1
+        (prev_x, prev_y) = (v[prev_k], v[prev_k] - prev_k)
+        (x, y) = (x - min(x - prev_x, y - prev_y), y - min(x - prev_x, y - prev_y)) ## back along the common lines
+        if x > prev_x:
+            changed[0][x] = 1 ## a[x-1] is deleted
+        else:
+            changed[1][y] = 1 ## b[y-1] is inserted
+        (x, y) = (prev_x, prev_y)
+    shift_boundaries(a, changed[0], changed[1])
+    shift_boundaries(b, changed[1], changed[0])
+
+    ## group the lines into runs of common lines and of changes
+    opcodes = []
+    (x, y) = (0, 0)
+    while x < n or y < m:
+        (x0, y0) = (x, y)
+        if x < n and y < m and not changed[0][x + 1] and not changed[1][y + 1]:
+            while x < n and y < m and not changed[0][x + 1] and not changed[1][y + 1]:
+                (x, y) = (x + 1, y + 1)
+            opcodes.append(("equal", x0, x, y0, y))
+            continue
+        while x < n and changed[0][x + 1]:
+            x += 1
+        while y < m and changed[1][y + 1]:
+            y += 1
+        opcodes.append(("replace" if x > x0 and y > y0 else ( "delete" if x > x0 else "insert" ), x0, x, y0, y))
+    return opcodes
+
+def shift_boundaries(lines, changed, other_changed):
+    """
+    Slide the runs of changed lines (flags changed[k+1] for lines[k], padded with 0 at both ends) over equal lines, so that they merge
+    with each other and line up with the runs of changes in the other list where possible (as in GNU diff), without changing their number
+    """
+    (i, j, i_end) = (0, 0, len(lines))
+    while True:
+        ## find the next run of changes, and the corresponding point in the other list
+        while i < i_end and not changed[i + 1]:
+            while other_changed[j + 1]:
+                j += 1
+            (i, j) = (i + 1, j + 1)
+        if i == i_end:
+            return
+        start = i
+        i += 1
+        while changed[i + 1]:
+            i += 1
+        while other_changed[j + 1]:
+            j += 1
+        while True:
+            runlength = i - start
+            ## move the run back while the previous unchanged line equals its last line, merging with earlier runs
+            while start > 0 and lines[start - 1] == lines[i - 1]:
+                start -= 1
+                changed[start + 1] = 1
+                i -= 1
+                changed[i + 1] = 0
+                while changed[start]:
+                    start -= 1
+                j -= 1
+                while other_changed[j + 1]:
+                    j -= 1
+            ## the end of the run at the last point where it lines up with a run of changes in the other list
+            corresponding = i if other_changed[j] else i_end
+            ## move the run forward while its first line equals the next unchanged line, merging with later runs
+            while i != i_end and lines[start] == lines[i]:
+                changed[start + 1] = 0
+                start += 1
+                changed[i + 1] = 1
+                i += 1
+                while changed[i + 1]:
+                    i += 1
+                j += 1
+                while other_changed[j + 1]:
+                    j += 1
+                    corresponding = i
+            if runlength == i - start:
+                break
+        ## move the merged run back to line up with a run of changes in the other list, if possible
+        while corresponding < i:
+            start -= 1
+            changed[start + 1] = 1
+            i -= 1
+            changed[i + 1] = 0
+            j -= 1
+            while other_changed[j + 1]:
+                j -= 1
+
+def diff_hunks(f1, f2, window=200, max_line_chars=65536):
+    """
+    Compare two text streams line by line, and yield the differences as (i, a_lines, j, b_lines),
+    where a_lines starting at line i (0-based) of f1 are replaced by b_lines starting at line j of f2.
+    Only `window` lines of each stream are kept in memory, and very long lines are split into chunks.
+    The hunks have as few changed lines as those of GNU diff, and are the same for typical outputs (checked against `diff` in tests/test_diff.py).
+    When many lines repeat, several alignments have the fewest changes, and GNU diff may choose another one.
+    """
+    (buf1, buf2) = ([], [])
+    (off1, off2) = (0, 0)
+    (eof1, eof2) = (False, False)
+    while True:
+        while not eof1 and len(buf1) < window:
+            line = f1.readline(max_line_chars)
+            if line:
+                buf1.append(line.rstrip("\n"))
+            else:
+                eof1 = True
+        while not eof2 and len(buf2) < window:
+            line = f2.readline(max_line_chars)
+            if line:
+                buf2.append(line.rstrip("\n"))
+            else:
+                eof2 = True
+        if len(buf1) == 0 and len(buf2) == 0:
+            return
+
+        ## skip the common lines
+        k = 0
+        while k < len(buf1) and k < len(buf2) and buf1[k] == buf2[k]:
+            k += 1
+        if k > 0:
+            (buf1, buf2) = (buf1[k:], buf2[k:])
+            (off1, off2) = (off1 + k, off2 + k)
+            continue
+
+        ## align the lines in the window. With the whole rest of both streams in the window, all differences are final.
+        ## Otherwise, the differences before the last common block are final, and the rest is aligned again with the next lines
+        opcodes = edit_opcodes(buf1, buf2)
+        if not ( eof1 and eof2 ):
+            last_equal = max([k for (k, op) in enumerate(opcodes) if op[0] == "equal"], default=None)
+            if last_equal is None: ## not in sync within the window
+                opcodes = [("replace", 0, len(buf1), 0, len(buf2))]
+            else:
+                opcodes = opcodes[:last_equal]
+        for (tag, a1, a2, b1, b2) in opcodes:
+            if tag != "equal":
+                yield (off1 + a1, buf1[a1:a2], off2 + b1, buf2[b1:b2])
+        (n1, n2) = (opcodes[-1][2], opcodes[-1][4]) if len(opcodes) > 0 else (0, 0)
+        if eof1 and eof2:
+            return
+        (buf1, buf2) = (buf1[n1:], buf2[n2:])
+        (off1, off2) = (off1 + n1, off2 + n2)
+
+def _diff_range(start, n):
+    return f"{start+1}" if n == 1 else f"{start+1},{start+n}"
+
+def format_diff_hunk(i, a_lines, j, b_lines, style="normal", width=30):
+    """
+    Format a hunk from diff_hunks() in the format of `diff` (normal), or side by side with line numbers
+    """
+    if style == "side-by-side":
+        out = []
+        for k in range(max(len(a_lines), len(b_lines))):
+            left = a_lines[k] if k < len(a_lines) else ""
+            right = b_lines[k] if k < len(b_lines) else ""
+            if len(left) > width:
+                left = left[:width-3] + "..."
+            mark = "|" if k < len(a_lines) and k < len(b_lines) else ( "<" if k < len(a_lines) else ">" )
+            line_a = f"{i+k+1}" if k < len(a_lines) else ""
+            line_b = f"{j+k+1}" if k < len(b_lines) else ""
+            out.append(f"{line_a:>6} {left:<{width}} {mark} {line_b:>6} {right}\n")
+        return "".join(out)
+    if len(b_lines) == 0:
+        header = f"{_diff_range(i, len(a_lines))}d{j}\n"
+    elif len(a_lines) == 0:
+        header = f"{i}a{_diff_range(j, len(b_lines))}\n"
+    else:
+        header = f"{_diff_range(i, len(a_lines))}c{_diff_range(j, len(b_lines))}\n"
+    return header + "".join([f"< {l}\n" for l in a_lines]) + ("---\n" if len(a_lines) > 0 and len(b_lines) > 0 else "") + "".join([f"> {l}\n" for l in b_lines])
+
+@traced("diff_files")
+def diff_files(file1, file2, max_chars=500, style="normal", start_offset=0, start_line=0):
+    """
+    Show the differences between two files (similar to `diff file1 file2`) without running an external process.
+    The files are read incrementally, and the comparison stops after max_chars characters of output.
+    style is "normal" (same as `diff`) or "side-by-side" (with line numbers of both files)
+    If both files are known to be identical up to the byte start_offset (the beginning of line start_line, 0-based), the comparison starts there.
+    """
+    diff_output = ""
+    with open(file1, 'rb') as b1, open(file2, 'rb') as b2:
+        b1.seek(start_offset)
+        b2.seek(start_offset)
+        (f1, f2) = (io.TextIOWrapper(b1, errors='replace'), io.TextIOWrapper(b2, errors='replace'))
+        for (i, a_lines, j, b_lines) in diff_hunks(f1, f2):
+            diff_output += format_diff_hunk(i + start_line, a_lines, j + start_line, b_lines, style)
+            if len(diff_output) > max_chars:
+                break
     if len(diff_output) > max_chars:
         diff_output = diff_output[:max_chars] + "\n... (truncated)"
     return diff_output
 
-def run_r_eval_script(out_prefix, timeout = None):
+def r_source_scripts(in_func_path, preload_scripts):
+    """
+    List of R scripts sourced (in order) before evaluating the R function
+    """
+    return [p for p in preload_scripts if p is not None] + [in_func_path]
+
+def available_cores():
+    """
+    List of CPU cores this process is allowed to run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def run_parallel(tasks, jobs = None, pin_cores = False):
+    """
+    Run the tasks with a pool of `jobs` threads (default: number of available cores), and return their results in order.
+    Each task is a function taking the CPU core to pin its processes to (None if pin_cores is False).
+    With pin_cores, no two tasks run on the same core at the same time.
+    """
+    cores = available_cores()
+    if jobs is None:
+        jobs = len(cores)
+    if pin_cores:
+        jobs = min(jobs, len(cores))
+    jobs = max(1, jobs)
+
+    free_cores = queue.Queue()
+    for core in cores[:jobs]:
+        free_cores.put(core)
+
+    def run_task(task):
+        if not pin_cores:
+            return task(None)
+        core = free_cores.get()
+        try:
+            return task(core)
+        finally:
+            free_cores.put(core)
+
+    if jobs == 1:
+        return [run_task(task) for task in tasks]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_task, task) for task in tasks]
+        return [f.result() for f in futures]
+
+def r_limit_options(max_memory = None, max_cpu_time = None, max_output = None):
+    """
+    Options of prlimit to limit the memory (address space, in megabytes), CPU time (in seconds), and size of each written file (in megabytes)
+    """
+    options = []
+    if max_memory is not None:
+        options.append(f"--as={int(max_memory * 1024 * 1024)}")
+    if max_cpu_time is not None: ## SIGXCPU at the soft limit, SIGKILL one second later
+        options.append(f"--cpu={int(math.ceil(max_cpu_time))}:{int(math.ceil(max_cpu_time)) + 1}")
+    if max_output is not None: ## SIGXFSZ when writing beyond the limit
+        options.append(f"--fsize={int(max_output * 1024 * 1024)}")
+    return options
+
+def r_limit_cmd(max_memory = None, max_cpu_time = None, max_output = None):
+    """
+    Command prefix to apply the limits of r_limit_options() to R and its child processes
+    """
+    options = r_limit_options(max_memory, max_cpu_time, max_output)
+    if len(options) == 0:
+        return []
+    return ["prlimit"] + options + ["--"]
+
+def format_usage(usage):
+    """
+    Resource usage as a string "[user CPU seconds] [system CPU seconds] [peak RSS in kilobytes]", with NA for unknown values
+    """
+    if usage is None:
+        return "NA NA NA"
+    return " ".join(["NA" if usage.get(k) is None else fmt.format(usage[k]) for (k, fmt) in [("user", "{:.3f}"), ("sys", "{:.3f}"), ("maxrss_kb", "{:d}")]])
+
+def parse_usage(str_usage):
+    """
+    Inverse of format_usage(), as a dict with None for unknown values
+    """
+    values = str_usage.split() if str_usage is not None else ["NA"] * 3
+    (user, sys, maxrss_kb) = [None if v == "NA" else float(v) for v in values]
+    return {"user": user, "sys": sys, "maxrss_kb": None if maxrss_kb is None else int(maxrss_kb)}
+
+def record_run_stages(out_prefix, start_time, end_time):
+    """
+    Record the time spent in R, broken down into stages if the script wrote {out_prefix}.timing
+    """
+    add_span("run_r_eval_script", start_time, end_time, {"out_prefix": out_prefix})
+    if os.path.exists(f"{out_prefix}.timing"):
+        record_r_stages(f"{out_prefix}.timing", start_time, end_time)
+    else:
+        record_stage("r_process", end_time - start_time)
+
+def run_r_eval_script(out_prefix, timeout = None, source_scripts = None, cpu_core = None, record_files = True,
+                      max_memory = None, max_cpu_time = None, usage = None, max_output = None):
+    """
+    Run {out_prefix}.R and record .out, .time, .exitcode, .usage, and .err files.
+    If source_scripts is given, the script is run by forking a fork server that already sourced them.
+    If cpu_core is given, R runs only on that CPU core.
+    If record_files is False, only the .out file is kept, and the rest is only returned.
+    max_memory (megabytes) and max_cpu_time (seconds) limit the resources of R, and max_output (megabytes) limits
+    the size of the printed output and of each written file, with the exit code 153 (see utils/driver.py) when exceeded.
+    If usage is a dict, it is filled with the CPU time and peak memory of R (see format_usage()).
+    """
+    if source_scripts is not None:
+        return run_r_eval_script_forked(out_prefix, timeout, source_scripts, cpu_core, record_files, max_memory, max_cpu_time, usage, max_output)
     start_time = time.time()
-    with open(f"{out_prefix}.out", 'w') as fout:
-        if timeout is None:
-            cmd = f"Rscript {out_prefix}.R"
-        else:
-            cmd = f"timeout {timeout}s Rscript {out_prefix}.R"
-        proc = subprocess.run(cmd, shell=True, stdout=fout, stderr=subprocess.PIPE)
+    cmd = r_limit_cmd(max_memory, max_cpu_time, max_output) + ["Rscript", f"{out_prefix}.R"]
+    if cpu_core is not None:
+        cmd = ["taskset", "-c", str(cpu_core)] + cmd
+    run_usage = {"user": None, "sys": None, "maxrss_kb": None}
+    open(f"{out_prefix}.out", 'w').close() ## the output is written by the script, and the printed output is discarded
+    try:
+        (exit_code, error_message, run_usage) = run_command(cmd, timeout, int(max_output * 1024 * 1024) if max_output is not None else None)
+    except FileNotFoundError as e: ## e.g. R is not installed
+        (exit_code, error_message) = (127, f"{e}\n")
     end_time = time.time()
     elapsed_time = end_time - start_time
-    with open(f"{out_prefix}.time", 'w') as ftime:
-        ftime.write(f"{elapsed_time:.2f}\n")
-    exit_code = proc.returncode
-    with open(f"{out_prefix}.exitcode", 'w') as fexit:
-        fexit.write(f"{exit_code}\n")
+    record_run_stages(out_prefix, start_time, end_time)
+    if usage is not None:
+        usage.update(run_usage)
+    if record_files:
+        with open(f"{out_prefix}.time", 'w') as ftime:
+            ftime.write(f"{elapsed_time:.2f}\n")
+        with open(f"{out_prefix}.exitcode", 'w') as fexit:
+            fexit.write(f"{exit_code}\n")
+        with open(f"{out_prefix}.usage", 'w') as fusage:
+            fusage.write(f"{format_usage(run_usage)}\n")
+        if len(error_message) > 0:
+            with open(f"{out_prefix}.err", 'w') as ferr:
+                ferr.write(error_message)
+
+    return (elapsed_time, exit_code, error_message)
+
+def run_r_eval_script_forked(out_prefix, timeout, source_scripts, cpu_core = None, record_files = True,
+                             max_memory = None, max_cpu_time = None, usage = None, max_output = None):
+    """
+    Same as run_r_eval_script(), but forks a fork server instead of starting a new Rscript.
+    The printed output of the forked child is discarded (sent to /dev/null, as the .out file is written by the script itself),
+    so max_output only limits the size of each written file. The limits apply to the forked child only, and its usage is counted from the fork.
+    If the fork server cannot source the scripts within the timeout (e.g. an infinite loop at the top level of the R file),
+    it is killed, and the test case times out as if it was run by a new Rscript.
+    """
+    server = acquire_fork_server(source_scripts, timeout)
+    try:
+        if cpu_core is not None and server.ready: ## the forked child inherits the affinity of the server
+            os.sched_setaffinity(server.proc.pid, {cpu_core})
+        start_time = time.time()
+        open(f"{out_prefix}.out", 'w').close()
+        (exit_code, run_usage) = server.run(f"{out_prefix}.R", os.devnull, f"{out_prefix}.err", timeout, r_limit_options(max_memory, max_cpu_time, max_output))
+        end_time = time.time()
+        if server.startup_timed_out: ## the time spent sourcing the scripts until the timeout
+            start_time = end_time - min(server.startup_time, timeout)
+    finally:
+        release_fork_server(server)
+    elapsed_time = end_time - start_time
+    record_run_stages(out_prefix, start_time, end_time)
+    if usage is not None:
+        usage.update(run_usage)
+    if record_files:
+        with open(f"{out_prefix}.time", 'w') as ftime:
+            ftime.write(f"{elapsed_time:.2f}\n")
+        with open(f"{out_prefix}.exitcode", 'w') as fexit:
+            fexit.write(f"{exit_code}\n")
+        with open(f"{out_prefix}.usage", 'w') as fusage:
+            fusage.write(f"{format_usage(run_usage)}\n")
 
     error_message = ""
-    if proc.stderr:
-        error_message = proc.stderr.decode()
-        with open(f"{out_prefix}.err", 'w') as ferr:
-            ferr.write(error_message)
-        
+    if os.path.exists(f"{out_prefix}.err"):
+        with open(f"{out_prefix}.err", 'r') as ferr:
+            error_message = ferr.read()
+        if len(error_message) == 0 or not record_files: ## keep the same behavior as run_r_eval_script()
+            os.remove(f"{out_prefix}.err")
+
     return (elapsed_time, exit_code, error_message)
 
 
@@ -157,79 +552,233 @@ def params2str(in_params):
     return f"{n_args} Argument(s):\n"+ "\n".join(str_params)
 
 
-# write an R script based on the R function, input parameters, and output prefix
-def write_r_eval_func_script(func_name, out_prefix, in_func_path, in_params, out_digits, out_format, preload_scripts):
+## string literals in an eval expression, which are tracked as the files it reads if they are paths of existing files
+R_STRING_LITERAL = re.compile(r""""((?:[^"\\]|\\.)*)"|'((?:[^'\\]|\\.)*)'""")
+
+## calls that may read a file in an eval expression. Its files are only tracked if each of them reads a file named by a string literal
+R_READ_CALL = re.compile(r"\b(read[\w.]*|load|scan|source|file|gzfile|bzfile|xzfile|url|fread|readLines|readRDS)\s*\(\s*")
+
+## optional name of the first argument of a call (e.g. file=)
+R_ARG_NAME = re.compile(r"(?:[\w.]+\s*=\s*)?")
+
+def eval_data_files(value):
+    """
+    Existing files named by string literals in an eval expression, or None if it may read a file whose path is not
+    a string literal (e.g. built by paste()), which cannot be tracked
+    """
+    paths = []
+    for m in R_STRING_LITERAL.finditer(value):
+        path = m.group(1) if m.group(1) is not None else m.group(2)
+        if os.path.isfile(path) and path not in paths:
+            paths.append(path)
+    for m in R_READ_CALL.finditer(value):
+        literal = R_STRING_LITERAL.match(value, R_ARG_NAME.match(value, m.end()).end())
+        if literal is None or ( literal.group(1) if literal.group(1) is not None else literal.group(2) ) not in paths:
+            return None
+    return paths
+
+def args_data_files(in_params):
+    """
+    List of data files read by the input arguments: the files of the df, rds, mat, and bin types, and those read by eval and asis
+    expressions (see eval_data_files()). None if an eval or asis expression may read a file that cannot be tracked.
+    """
+    data_files = []
+    with open(in_params, 'r') as fparams:
+        for line in fparams:
+            (type, value) = line.split(":", maxsplit=1)
+            if type in ["df", "rds", "mat", "bin"]:
+                data_files.append(value.strip())
+            elif type in ["eval", "asis"]:
+                paths = eval_data_files(value.strip())
+                if paths is None:
+                    return None
+                data_files += paths
+    return data_files
+
+def hash_files(paths, extra = ()):
+    """
+    SHA-256 digest of the contents of the files (None for no file) and extra string values
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        if path is None:
+            h.update(b"\0none\0")
+            continue
+        h.update(f"\0file:{os.path.getsize(path)}\0".encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    for value in extra:
+        h.update(f"\0{value}".encode())
+    return h.hexdigest()
+
+## digests of files already hashed in this process, keyed by (path, size, modification time)
+_file_digests = {}
+
+def file_digest(path):
+    """
+    SHA-256 digest of the contents of the file, computed only once per process unless the file is modified
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if key not in _file_digests:
+        _file_digests[key] = hash_files([path])
+    return _file_digests[key]
+
+def r_load_arg_expr(type, value):
+    """
+    R expression loading an input argument of the type (e.g. numeric, df) and value in the .args file
+    """
+    if type == "int" or type == "numeric":
+        return "c(" + ",".join(value.split()) + ")"
+    elif type == "str":
+        values = value.split()
+        return "c(" + ",".join([f"'{v}'" for v in values]) + ")"
+    elif type == "df":
+        return f"read.table('{value}', header=TRUE)"
+    elif type == "rds":
+        return f"readRDS('{value}')"
+    elif type == "mat":
+        return f"as.matrix(read.table('{value}', header=FALSE))"
+    elif type == "bin":
+        return f"read.binary.matrix('{value}')"
+    elif type == "eval":
+        return "(function()" + "{" + value + "})()"
+    elif type == "asis":
+        return "( " + value + " )"
+    else:
+        raise ValueError(f"Unknown type {type}")
+
+def r_load_args_cmds(in_params, arg_cache = None):
+    """
+    R commands to load the input arguments into arg1, arg2, ...
+    If arg_cache (see utils/argcache.py) is given, arguments compiled into RDS files are loaded from them instead.
+    """
     n_args = 0
+    out_cmds = []
+    with open(in_params, 'r') as fparams:
+        for line in fparams:
+            n_args += 1
+            (type, value) = line.split(":", maxsplit=1)
+            value = value.strip()
+            artifact = arg_cache.lookup(type, value) if arg_cache is not None else None
+            if artifact is not None:
+                cmd = f"arg{n_args} <- readRDS('{artifact}')"
+            else:
+                cmd = f"arg{n_args} <- " + r_load_arg_expr(type, value)
+            out_cmds.append(cmd)
+
+    if len(out_cmds) == 0:
+        raise ValueError("No input parameters found")
+    return out_cmds
+
+def r_call_func_cmd(func_name, n_args):
+    """
+    R command to call the R function with arg1, arg2, ... and store the result in rst
+    """
+    return f"rst <- {func_name}(" + ", ".join([f"arg{i+1}" for i in range(n_args)]) + ")\n"
+
+def r_write_result_cmds(out_path, out_digits, out_format, binary_output=False):
+    """
+    R commands to write the result rst into out_path.
+    With binary_output, numeric/integer/logical vectors and matrices are written by write.binary.result() instead of as text.
+    """
+    cmd = "if ( is.null(rst) ) {\n"
+    cmd += f"    cat('NA',sep='\\n',file='{out_path}')\n"
+    cmd += "} else if ( identical(class(rst), 'data.frame') ) {\n"
+    cmd += f"    utils::write.table(format(rst, scientific=TRUE, digits={out_digits}), file='{out_path}', sep='\\t', quote=FALSE, row.names=FALSE)\n"
+    cmd += "} else if ( identical(class(rst), 'list') ) {\n"
+    cmd += f"    write_list_to_json(rst, file_path='{out_path}', digits={out_digits})\n"
+    cmd += "} else if ( inherits(rst, 'TsparseMatrix') ) {\n"  ## triplet sparse matrix, print as data frame
+    cmd += f"    utils::write.table(format(data.frame(i=rst@i+1,j=rst@j+1,x=rst@x), scientific=TRUE, digits={out_digits}), file='{out_path}', sep='\\t', quote=FALSE, row.names=FALSE)\n"
+    if binary_output:
+        cmd += "} else if ( is.atomic(rst) && ( is.double(rst) || is.integer(rst) || is.logical(rst) ) && !is.factor(rst) ) {\n"
+        cmd += f"    write.binary.result(rst, '{out_path}')\n"
+    cmd += "} else if ( is.na(rst[1]) || is.nan(rst[1]) ) {\n"
+    cmd += f"    cat('NA',sep='\\n',file='{out_path}')\n"
+    cmd += "} else {\n"
+    cmd += f"    cat(formatC(rst, digits={out_digits}, format='{out_format}', flag='-'), sep='\\n', file='{out_path}')\n"
+    cmd += "}\n"
+    return cmd
+
+# write an R script based on the R function, input parameters, and output prefix
+def write_r_eval_func_script(func_name, out_prefix, in_func_path, in_params, out_digits, out_format, preload_scripts, fork_server=False, binary_output=False, stage_times=False, arg_cache=None):
+    """
+    With stage_times, the script appends the time at the end of each stage to {out_prefix}.timing (see record_r_stages()).
+    With arg_cache, the input arguments compiled by compile_r_func_args are loaded from the compiled RDS files.
+    """
+    timing_path = f"{out_prefix}.timing"
+    if os.path.exists(timing_path):
+        os.remove(timing_path)
+    with stage("script_generation"), open(f"{out_prefix}.R", 'w') as fout:
+        if stage_times:
+            fout.write(r_timestamp_cmd(timing_path, "start"))
+        if fork_server: ## the scripts are sourced once by the fork server
+            for source_script in r_source_scripts(in_func_path, preload_scripts):
+                fout.write(f"## source('{source_script}') -- sourced by the fork server\n")
+        else:
+            for preload_script in preload_scripts: ## preload the script if needed
+                if preload_script is not None:
+                    fout.write(f"source('{preload_script}')\n")
+            fout.write(f"source('{in_func_path}')\n")
+            if stage_times:
+                fout.write(r_timestamp_cmd(timing_path, "sourcing"))
+        out_cmds = r_load_args_cmds(in_params, arg_cache)
+        fout.write("\n".join(out_cmds))
+        fout.write("\n")    
+        if stage_times:
+            fout.write(r_timestamp_cmd(timing_path, "argument_load"))
+
+        ## execute the R function
+        fout.write(r_call_func_cmd(func_name, len(out_cmds)))
+        if stage_times:
+            fout.write(r_timestamp_cmd(timing_path, "function_call"))
+        fout.write(r_write_result_cmds(f"{out_prefix}.out", out_digits, out_format, binary_output))
+        if stage_times:
+            fout.write(r_timestamp_cmd(timing_path, "output_write"))
+
+# write an R script checking that the submitted file can be sourced and defines the R function
+def write_r_precheck_script(func_name, out_prefix, in_func_path, preload_scripts, fork_server=False):
+    """
+    Write {out_prefix}.R that sources the preload scripts and the R file (unless sourced by the fork server),
+    and fails if the R function is not defined
+    """
     with open(f"{out_prefix}.R", 'w') as fout:
+        if not fork_server:
+            for source_script in r_source_scripts(in_func_path, preload_scripts):
+                fout.write(f"source('{source_script}')\n")
+        fout.write(f"if ( !exists('{func_name}', mode='function') ) stop(\"The function {func_name}() is not defined in {os.path.basename(in_func_path)}\", call.=FALSE)\n")
+
+# write a single R script evaluating the R function for all test cases, sourcing the scripts only once
+def write_r_eval_batch_script(func_name, batch_prefix, out_prefixes, in_func_path, params_list, out_digits, out_format, preload_scripts, binary_output=False, arg_cache=None):
+    """
+    Write {batch_prefix}.R that evaluates the R function for each input parameter file in params_list,
+    and writes {out_prefix}.out, .time, .exitcode, (and .err on error) for the corresponding out_prefix.
+    An error in one test case does not abort the other test cases.
+    """
+    with open(f"{batch_prefix}.R", 'w') as fout:
         for preload_script in preload_scripts: ## preload the script if needed
             if preload_script is not None:
                 fout.write(f"source('{preload_script}')\n")
         fout.write(f"source('{in_func_path}')\n")
-        out_cmds = []
-#        include_read_binary_matrix = False
-        with open(in_params, 'r') as fparams:
-            for line in fparams:
-                n_args += 1
-                (type, value) = line.split(":", maxsplit=1)
-                value = value.strip()
-                if type == "int" or type == "numeric":
-                    cmd = f"arg{n_args} <- c(" + ",".join(value.split()) + ")"
-                elif type == "str":
-                    values = value.split()
-                    cmd = f"arg{n_args} <- c(" + ",".join([f"'{v}'" for v in values]) + ")"
-                elif type == "df":
-                    cmd = f"arg{n_args} <- read.table('{value}', header=TRUE)"
-                elif type == "rds":
-                    cmd = f"arg{n_args} <- readRDS('{value}')"
-                elif type == "mat":
-                    cmd = f"arg{n_args} <- as.matrix(read.table('{value}', header=FALSE)"
-                elif type == "bin":
-                    cmd = f"arg{n_args} <- read.binary.matrix('{value}')"
-#                    include_read_binary_matrix = True
-                elif type == "eval":
-                    cmd = f"arg{n_args} <- (function()" + "{" + value + "})()"
-                elif type == "asis":
-                    cmd = f"arg{n_args} <- ( " + value + " )"
-                else:
-                    raise ValueError(f"Unknown type {type}")
-                out_cmds.append(cmd)
-        
-        if len(out_cmds) == 0:
-            raise ValueError("No input parameters found")
-        
-#         if include_read_binary_matrix:
-#             cmd = """read.binary.matrix = function(filename) {
-#     fh = file(filename,"rb")
-#     dims = readBin(fh,what="integer",n=2L,size=4L)
-#     n = dims[1]
-#     p = dims[2]
-#     X = matrix(readBin(fh,what="numeric",n=n*p,size=8L),nrow=n,ncol=p)
-#     close(fh)
-#     return(X)
-# }
-# """
-#             fout.write(cmd)
-        fout.write("\n".join(out_cmds))
-        fout.write("\n")    
 
-        ## execute the R function
-        cmd = f"rst <- {func_name}("
-        for i in range(n_args):
-            if i > 0:
-                cmd += ", "
-            cmd += f"arg{i+1}"
-        cmd += ")\n"
-        cmd += "if ( is.null(rst) ) {\n"
-        cmd += f"    cat('NA',sep='\\n',file='{out_prefix}.out')\n"
-        cmd += "} else if ( class(rst) == 'data.frame') {\n"
-        cmd += f"    utils::write.table(format(rst, scientific=TRUE, digits={out_digits}), file='{out_prefix}.out', sep='\\t', quote=FALSE, row.names=FALSE)\n"
-        cmd += "} else if ( class(rst) == 'list') {\n"
-        cmd += f"    write_list_to_json(rst, file_path='{out_prefix}.out')\n"
-        cmd += "} else if ( inherits(rst, 'TsparseMatrix') ) {\n"  ## triplet sparse matrix, print as data frame
-        cmd += f"    utils::write.table(format(data.frame(i=rst@i+1,j=rst@j+1,x=rst@x), scientific=TRUE, digits={out_digits}), file='{out_prefix}.out', sep='\\t', quote=FALSE, row.names=FALSE)\n"
-        cmd += "} else if ( is.na(rst) || is.nan(rst) ) {\n"
-        cmd += f"    cat('NA',sep='\\n',file='{out_prefix}.out')\n"
-        cmd += "} else {\n"
-        cmd += f"    cat(formatC(rst, digits={out_digits}, format='{out_format}', flag='-'), sep='\\n', file='{out_prefix}.out')\n"
-        cmd += "}\n"
-        fout.write(cmd)
\ No newline at end of file
+        for (out_prefix, in_params) in zip(out_prefixes, params_list):
+            out_cmds = r_load_args_cmds(in_params, arg_cache)
+            fout.write("\n## " + "="*70 + "\n")
+            fout.write(f"## {in_params}\n")
+            fout.write("local({\n")
+            fout.write("start_time <- proc.time()[['elapsed']]\n")
+            fout.write("exit_code <- tryCatch({\n")
+            fout.write("\n".join(out_cmds))
+            fout.write("\n")
+            fout.write(r_call_func_cmd(func_name, len(out_cmds)))
+            fout.write(r_write_result_cmds(f"{out_prefix}.out", out_digits, out_format, binary_output))
+            fout.write("0L\n")
+            fout.write("}, error = function(e) {\n")
+            fout.write(f"    cat(if ( is.null(conditionCall(e)) ) 'Error: ' else paste0('Error in ', deparse(conditionCall(e))[1], ' : '), conditionMessage(e), '\\n', sep='', file='{out_prefix}.err')\n")
+            fout.write(f"    if ( !file.exists('{out_prefix}.out') ) file.create('{out_prefix}.out')\n")
+            fout.write("    1L\n")
+            fout.write("})\n")
+            fout.write(f"cat(sprintf('%.2f', proc.time()[['elapsed']] - start_time), sep='\\n', file='{out_prefix}.time')\n")
+            fout.write(f"cat(exit_code, sep='\\n', file='{out_prefix}.exitcode')\n")
+            fout.write("})\n")
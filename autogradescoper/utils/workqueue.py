@@ -0,0 +1,199 @@
+import os, sqlite3, json, time, contextlib
+
+## seconds a claimed unit stays reserved for its worker without being renewed, after which another worker may claim it
+DEFAULT_LEASE_SECONDS = 60
+
+## number of times a unit is claimed before it is given up (e.g. because it crashes every worker running it)
+DEFAULT_MAX_ATTEMPTS = 3
+
+## filesystems on which the file locking that SQLite relies on is known to be unreliable
+NETWORK_FILESYSTEMS = ["nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p", "afs", "glusterfs", "ceph", "fuse.ceph"]
+
+## arguments of eval_r_func_problem holding paths, stored relative to the root of the queue
+PATH_ARGUMENTS = ["solution", "submission", "config", "out_prefix", "preload_usr", "preload_sol", "preload_all", "sol_cache", "results_db", "arg_cache"]
+
+def filesystem_type(path):
+    """
+    Type of the filesystem (as in /proc/mounts) containing the path, or None if it cannot be found
+    """
+    path = os.path.realpath(path)
+    (mount_point, fs_type) = ("", None)
+    try:
+        with open("/proc/mounts", 'r') as fmounts:
+            for line in fmounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                point = fields[1].replace("\\040", " ")
+                if ( path == point or path.startswith(point.rstrip("/") + "/") ) and len(point) >= len(mount_point):
+                    (mount_point, fs_type) = (point, fields[2])
+    except OSError:
+        return None
+    return fs_type
+
+def relative_path(path, root):
+    """
+    Path relative to the root if it is under the root, otherwise the absolute path
+    """
+    path = os.path.abspath(path)
+    rel = os.path.relpath(path, root)
+    return path if rel == ".." or rel.startswith("../") else rel
+
+def rooted_path(path, root):
+    """
+    Path stored by relative_path(), on this host
+    """
+    return path if os.path.isabs(path) else os.path.join(root, path)
+
+class WorkQueue:
+    """
+    Queue of test cases (units) shared by any number of worker processes on any number of hosts, in a single SQLite database.
+    Each unit is keyed by the output prefix of the test case, and belongs to a group (a submitted file of a problem) whose
+    submitted file is checked once (see precheck_submission() in eval_r_func_problem).
+    A worker claims a unit for a lease, renews the lease while running it, and posts its results. Units whose lease expired
+    (e.g. the worker crashed) are claimed again by another worker.
+    The database must be on a filesystem shared by the workers on which file locking works. SQLite's locking is unreliable on
+    network filesystems such as NFS and SMB, which the queue reports in network_filesystem. The rollback journal is used instead of WAL, which requires
+    all processes to be on the same host.
+    The paths of the published test cases that are under the root (default: the directory of the database) are stored relative to it,
+    so that each host can reach them through its own root, e.g. where it mounts the shared filesystem. Other paths must be the same on all hosts.
+    """
+    def __init__(self, db_path, root=None):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir != "" and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        self.root = os.path.abspath(root if root is not None else db_dir)
+        fs_type = filesystem_type(db_dir if db_dir != "" else ".")
+        ## type of the network filesystem the database is on, if any, to warn that the queue may be corrupted or hand a unit to two workers
+        self.network_filesystem = fs_type if fs_type in NETWORK_FILESYSTEMS else None
+        with self.connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS groups (grp TEXT PRIMARY KEY, problem_args TEXT, config TEXT, indices TEXT, precheck TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS units (prefix TEXT PRIMARY KEY, grp TEXT, case_index INTEGER, cost REAL, status TEXT, "
+                         "worker TEXT, lease_expires REAL, attempts INTEGER, fields TEXT, updated REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS units_status ON units (status, cost)")
+
+    @contextlib.contextmanager
+    def connect(self):
+        ## a new connection for each call, so that the queue can be used from multiple threads, closed at the end of the call
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=60, isolation_level=None)) as conn:
+            with conn:
+                yield conn
+
+    def clear(self):
+        """
+        Remove all units and groups, e.g. of an earlier run
+        """
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM units")
+            conn.execute("DELETE FROM groups")
+            conn.execute("COMMIT")
+
+    def publish(self, grp, out_prefix, problem_args, config, indices, costs):
+        """
+        Add the test cases with the indices of a group (with the output prefix, arguments of eval_r_func_problem as a dict, and config) as pending units,
+        replacing the units and results of an earlier run. costs are the expected times, used to claim the longest units first.
+        """
+        problem_args = dict(problem_args, **{name: relative_path(problem_args[name], self.root) for name in PATH_ARGUMENTS if problem_args.get(name) is not None})
+        config = [dict(c, args=relative_path(c["args"], self.root)) if os.path.exists(c["args"]) else c for c in config]
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR REPLACE INTO groups (grp, problem_args, config, indices, precheck) VALUES (?, ?, ?, ?, NULL)",
+                         [grp, json.dumps(problem_args), json.dumps(config), json.dumps(list(indices))])
+            conn.executemany("INSERT OR REPLACE INTO units (prefix, grp, case_index, cost, status, worker, lease_expires, attempts, fields, updated) "
+                             "VALUES (?, ?, ?, ?, 'pending', NULL, NULL, 0, NULL, ?)",
+                             [(f"{out_prefix}.{j}", grp, j, cost, time.time()) for (j, cost) in zip(indices, costs)])
+            conn.execute("COMMIT")
+
+    def claim(self, worker, lease=DEFAULT_LEASE_SECONDS):
+        """
+        Claim the pending unit expected to take the longest (or a unit whose lease expired) for the worker,
+        and return it as a dict of the columns of the unit and its group, or None if there is none
+        """
+        with self.connect() as conn:
+            conn.row_factory = sqlite3.Row
+            conn.execute("BEGIN IMMEDIATE") ## only one worker selects and updates at a time
+            now = time.time()
+            row = conn.execute("SELECT * FROM units WHERE status = 'pending' OR ( status = 'running' AND lease_expires < ? ) "
+                               "ORDER BY status = 'running', cost DESC LIMIT 1", [now]).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE units SET status = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? WHERE prefix = ?",
+                         [worker, now + lease, now, row["prefix"]])
+            group = conn.execute("SELECT * FROM groups WHERE grp = ?", [row["grp"]]).fetchone()
+            conn.execute("COMMIT")
+        unit = dict(row)
+        unit["attempts"] += 1
+        problem_args = json.loads(group["problem_args"])
+        problem_args.update({name: rooted_path(problem_args[name], self.root) for name in PATH_ARGUMENTS if problem_args.get(name) is not None})
+        config = [dict(c, args=rooted_path(c["args"], self.root)) if not os.path.isabs(c["args"]) and os.path.exists(rooted_path(c["args"], self.root)) else c
+                  for c in json.loads(group["config"])]
+        unit.update({"problem_args": problem_args, "config": config, "indices": json.loads(group["indices"])})
+        return unit
+
+    def renew(self, prefixes, worker, lease=DEFAULT_LEASE_SECONDS):
+        """
+        Extend the leases of the units still held by the worker
+        """
+        if len(prefixes) == 0:
+            return
+        with self.connect() as conn:
+            conn.execute(f"UPDATE units SET lease_expires = ? WHERE status = 'running' AND worker = ? AND prefix IN ({', '.join(['?'] * len(prefixes))})",
+                         [time.time() + lease, worker] + list(prefixes))
+
+    def complete(self, prefix, fields):
+        """
+        Post the results of a unit (the fields returned by evaluate_case() in eval_r_func_args). The first results posted are kept,
+        in case the unit was claimed again after its lease expired.
+        """
+        with self.connect() as conn:
+            conn.execute("UPDATE units SET status = 'done', fields = ?, lease_expires = NULL, updated = ? WHERE prefix = ? AND status != 'done'",
+                         [json.dumps(fields), time.time(), prefix])
+
+    def release(self, prefix, worker):
+        """
+        Return a unit claimed by the worker to the queue without results, e.g. after an unexpected error
+        """
+        with self.connect() as conn:
+            conn.execute("UPDATE units SET status = 'pending', worker = NULL, lease_expires = NULL, updated = ? WHERE prefix = ? AND status = 'running' AND worker = ?",
+                         [time.time(), prefix, worker])
+
+    def group_precheck(self, grp):
+        """
+        (whether the submitted file of the group was checked, results of the test cases if it failed or None)
+        """
+        with self.connect() as conn:
+            row = conn.execute("SELECT precheck FROM groups WHERE grp = ?", [grp]).fetchone()
+        if row is None or row[0] is None:
+            return (False, None)
+        return (True, json.loads(row[0]))
+
+    def set_group_precheck(self, grp, failures):
+        """
+        Record the outcome of checking the submitted file of the group (see precheck_submission() in eval_r_func_problem), with the results keyed by the index of the test case.
+        The first outcome recorded is kept, if several workers checked the same file at the same time.
+        """
+        with self.connect() as conn:
+            conn.execute("UPDATE groups SET precheck = ? WHERE grp = ? AND precheck IS NULL", [json.dumps(failures), grp])
+
+    def counts(self):
+        """
+        Number of units in each status (pending, running, done)
+        """
+        with self.connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ["pending", "running", "done"]}
+
+    def results(self, prefixes):
+        """
+        Results of the finished units with the output prefixes, as a dict of prefix to fields
+        """
+        results = {}
+        with self.connect() as conn:
+            for start in range(0, len(prefixes), 500): ## stay within the limit of the number of SQL variables
+                chunk = prefixes[start:start+500]
+                for (prefix, fields) in conn.execute(f"SELECT prefix, fields FROM units WHERE status = 'done' AND prefix IN ({', '.join(['?'] * len(chunk))})", chunk):
+                    results[prefix] = json.loads(fields)
+        return results
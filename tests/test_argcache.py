@@ -0,0 +1,11 @@
+import pytest
+
+from autogradescoper.utils.argcache import ArgCache
+
+@pytest.mark.parametrize("expr", ["rnorm(10)", "sort(runif (5))", "stats::sample.int(5)", "rnorm(10); set.seed(1)", "Sys.time()", "as.numeric(Sys.Date())", "list.files('.')"])
+def test_nondeterministic_eval_not_compiled(tmp_path, expr):
+    assert ArgCache(str(tmp_path)).key("eval", expr) is None
+
+@pytest.mark.parametrize("expr", ["matrix(1:4, 2)", "{ set.seed(1); rnorm(10) }", "x.rt(3)", "format(3)"])
+def test_deterministic_eval_compiled(tmp_path, expr):
+    assert ArgCache(str(tmp_path)).key("eval", expr) is not None
@@ -0,0 +1,56 @@
+import random, struct
+
+import numpy as np
+import pytest
+
+from autogradescoper.utils.compare import compare_binary_results, compare_outputs_exact
+
+def write_binary_result(path, values):
+    ## same layout as write.binary.result() in assets/autogradescoper_utils.R, for a double vector
+    with open(path, 'wb') as f:
+        f.write(b"AGSB" + struct.pack("<4i", 1, 1, 1, len(values)) + struct.pack("<i", 0))
+        f.write(np.asarray(values, dtype="<f8").tobytes())
+
+def write_text_result(path, values, digits, format):
+    ## same text as formatC(values, digits, format) in R, which formats each value with C sprintf
+    spec = "%.0f" if format == "d" else f"%.{digits}{format}"
+    with open(path, 'w') as f:
+        f.write("\n".join([spec % v for v in values]) + "\n")
+
+def modes_agree(tmp_path, sol, usr, digits, format):
+    for (name, values) in [("sol", sol), ("usr", usr)]:
+        write_binary_result(tmp_path / f"{name}.bin", values)
+        write_text_result(tmp_path / f"{name}.txt", values, digits, format)
+    (binary_passed, message) = compare_binary_results(str(tmp_path / "sol.bin"), str(tmp_path / "usr.bin"), digits, format)
+    text_passed = compare_outputs_exact(str(tmp_path / "sol.txt"), str(tmp_path / "usr.txt"))[0]
+    return (binary_passed, text_passed)
+
+## values at rounding boundaries, where rounding the scaled binary value and printing it give different results
+BOUNDARY_CASES = [
+    ([0.15], [0.2], 1, "f"),      ## 0.15 is slightly below the midpoint, so it prints as 0.1
+    ([2.675], [2.68], 2, "f"),
+    ([1.0000000050000001], [1.00000001], 8, "g"),
+    ([1.2345678949999999e-10], [1.23456789e-10], 8, "e"),
+    ([0.5], [1.0], 0, "d"),       ## ties are rounded to even, as round() in R
+    ([2.5], [2.0], 0, "d"),
+    ([123456789012345.67], [123456789012345.6], 16, "g"),
+    ([-0.0], [0.0], 8, "g"),
+]
+
+@pytest.mark.parametrize("sol, usr, digits, format", BOUNDARY_CASES)
+def test_binary_and_text_agree_at_boundaries(tmp_path, sol, usr, digits, format):
+    (binary_passed, text_passed) = modes_agree(tmp_path, sol, usr, digits, format)
+    assert binary_passed == text_passed
+
+@pytest.mark.parametrize("format", ["g", "e", "f"])
+def test_binary_and_text_agree_on_random_midpoints(tmp_path, format):
+    rng = random.Random(format)
+    for _ in range(200):
+        digits = rng.randint(1, 15)
+        ## a value with a 5 just after the last printed digit, and its neighbours
+        text = f"{rng.randint(1, 9)}.{''.join([str(rng.randint(0, 9)) for _ in range(digits)])}5e{rng.randint(-5, 5)}"
+        x = float(text)
+        sol = [x, np.nextafter(x, 0), np.nextafter(x, np.inf)]
+        usr = [float(f"%.{digits}e" % v) for v in sol]
+        (binary_passed, text_passed) = modes_agree(tmp_path, sol, usr, digits, format)
+        assert binary_passed == text_passed, (sol, digits, format)
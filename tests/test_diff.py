@@ -0,0 +1,91 @@
+import io, random, functools, shutil, subprocess
+
+import pytest
+
+from autogradescoper.utils.utils import diff_hunks, format_diff_hunk
+
+def normal_diff(a, b, window=200):
+    return "".join([format_diff_hunk(*hunk) for hunk in diff_hunks(io.StringIO(a), io.StringIO(b), window)])
+
+## outputs of GNU diff, with the fewest changed lines and hunks
+GNU_DIFFS = [
+    ("1\n2\n3\n4\n5\n6\n7\n8\n9\n10\n11\n12\n", "1\n2\n3\n4\n5\n6\n7\n8\nnine\n10\n11\n12\n", "9c9\n< 9\n---\n> nine\n"),
+    ("1\n2\n3\n", "1\n2\n2\n3\n", "2a3\n> 2\n"),
+    ("a\nb\nx\nb\nc\n", "a\nb\nc\n", "3,4d2\n< x\n< b\n"),
+    ("a\nb\nc\nd\ne\nf\ng\nh\ni\nj\nk\nl\n", "a\nX\nc\nd\ne\nf\ng\nh\ni\nj\nY\nl\n", "2c2\n< b\n---\n> X\n11c11\n< k\n---\n> Y\n"),
+    ("", "a\n", "0a1\n> a\n"),
+    ("a\n", "", "1d0\n< a\n"),
+    ("a\nb\n", "a\nb\n", ""),
+]
+
+@pytest.mark.parametrize("a, b, expected", GNU_DIFFS)
+def test_same_hunks_as_gnu_diff(a, b, expected):
+    assert normal_diff(a, b) == expected
+
+@pytest.mark.parametrize("window", [2, 3, 4, 5])
+def test_hunks_across_windows(window):
+    ## a change beyond the first window is still a single replaced line
+    (a, b, expected) = GNU_DIFFS[0]
+    assert normal_diff(a, b, window) == expected
+    (a, b, expected) = GNU_DIFFS[3]
+    assert normal_diff(a, b, window) == expected
+
+def test_fewest_changed_lines():
+    rng = random.Random(0)
+    for _ in range(500):
+        a = [rng.choice("abc") for _ in range(rng.randint(0, 15))]
+        b = [rng.choice("abc") for _ in range(rng.randint(0, 15))]
+        @functools.lru_cache(None)
+        def lcs(i, j):
+            if i == len(a) or j == len(b):
+                return 0
+            return 1 + lcs(i + 1, j + 1) if a[i] == b[j] else max(lcs(i + 1, j), lcs(i, j + 1))
+        hunks = list(diff_hunks(io.StringIO("".join([x + "\n" for x in a])), io.StringIO("".join([x + "\n" for x in b]))))
+        assert sum([len(a_lines) + len(b_lines) for (i, a_lines, j, b_lines) in hunks]) == len(a) + len(b) - 2 * lcs(0, 0)
+
+def gnu_diff(tmp_path, a, b):
+    (tmp_path / "a").write_text(a)
+    (tmp_path / "b").write_text(b)
+    return subprocess.run(["diff", str(tmp_path / "a"), str(tmp_path / "b")], capture_output=True, text=True).stdout
+
+def edited_lines(rng, n_lines, n_edits):
+    ## numeric output, and the same output with a few lines replaced, inserted, or deleted
+    a = [f"{rng.random():.6g}" for _ in range(n_lines)]
+    b = list(a)
+    for _ in range(n_edits):
+        (op, k) = (rng.choice("rid"), rng.randint(0, len(b)))
+        if op == "i":
+            b.insert(k, f"{rng.random():.6g}")
+        elif k < len(b):
+            if op == "r":
+                b[k] = f"{rng.random():.6g}"
+            else:
+                del b[k]
+    return ("".join([x + "\n" for x in a]), "".join([x + "\n" for x in b]))
+
+@pytest.mark.skipif(shutil.which("diff") is None, reason="diff is not installed")
+@pytest.mark.parametrize("window", [200, 7])
+def test_same_output_as_gnu_diff_on_random_edits(tmp_path, window):
+    rng = random.Random(window)
+    for _ in range(200):
+        (a, b) = edited_lines(rng, rng.randint(0, 300), rng.randint(0, 10))
+        assert normal_diff(a, b, window) == gnu_diff(tmp_path, a, b)
+
+@pytest.mark.skipif(shutil.which("diff") is None, reason="diff is not installed")
+def test_as_few_changed_lines_as_gnu_diff_on_repeated_lines(tmp_path):
+    ## with many repeated lines, several alignments have the fewest changed lines, and GNU diff may choose another one
+    def n_changed(text):
+        return len([line for line in text.split("\n") if line[:2] in ["< ", "> "]])
+    rng = random.Random(1)
+    for (alphabet, max_lines) in [("abc", 15), ("abcdefgh", 40), ("ab", 60)]:
+        for _ in range(200):
+            a = "".join([rng.choice(alphabet) + "\n" for _ in range(rng.randint(0, max_lines))])
+            b = "".join([rng.choice(alphabet) + "\n" for _ in range(rng.randint(0, max_lines))])
+            hunks = list(diff_hunks(io.StringIO(a), io.StringIO(b)))
+            assert n_changed(normal_diff(a, b)) == n_changed(gnu_diff(tmp_path, a, b))
+            ## applying the hunks to a gives b
+            (lines, patched, pos) = (a.splitlines(), [], 0)
+            for (i, a_lines, j, b_lines) in hunks:
+                patched += lines[pos:i] + b_lines
+                pos = i + len(a_lines)
+            assert patched + lines[pos:] == b.splitlines()
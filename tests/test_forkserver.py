@@ -0,0 +1,65 @@
+import os, shutil, subprocess, time
+
+import pytest
+
+from autogradescoper.scripts.eval_r_func_args import eval_r_func_args
+
+def r_available():
+    if shutil.which("Rscript") is None:
+        return False
+    try:
+        proc = subprocess.run(["Rscript", "-e", "cat(1)"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return proc.returncode == 0 and proc.stdout.decode().strip() == "1"
+
+pytestmark = pytest.mark.skipif(not r_available(), reason="R is not installed")
+
+def grade(tmp_path, submission, fork_server, options=(), name=None):
+    """
+    Grade a submission of f(x) = 2x for x = 21, and return its score ("pass", "incorrect", "error", or "timeout")
+    """
+    with open(tmp_path / "sol.R", 'w') as f:
+        f.write("f <- function(x) x * 2\n")
+    with open(tmp_path / "usr.R", 'w') as f:
+        f.write(submission)
+    with open(tmp_path / "test.args", 'w') as f:
+        f.write("numeric:21\n")
+    out_prefix = str(tmp_path / ( name or ( "forked" if fork_server else "plain" ) ))
+    eval_r_func_args(["--r-func", "f", "--solution", str(tmp_path / "sol.R"), "--submission", str(tmp_path / "usr.R"),
+                      "--args", str(tmp_path / "test.args"), "--out-prefix", out_prefix] + (["--fork-server"] if fork_server else []) + list(options))
+    with open(f"{out_prefix}.score") as f:
+        return f.read().strip()
+
+@pytest.mark.parametrize("fork_server", [False, True])
+def test_printed_output_is_discarded(tmp_path, fork_server):
+    ## the printed output must not be mixed with the result written to the .out file
+    submission = "f <- function(x) {\n  print(\"computing\")\n  cat(rep(\"noise\", 1000), \"\\n\")\n  x * 2\n}\n"
+    assert grade(tmp_path, submission, fork_server) == "pass"
+
+def test_startup_timeout(tmp_path):
+    ## an infinite loop at the top level of the submitted file times out instead of blocking the fork server
+    start_time = time.time()
+    assert grade(tmp_path, "while (TRUE) {}\nf <- function(x) x * 2\n", True, ["--max-time", "2"]) == "timeout"
+    assert time.time() - start_time < 30
+
+def test_cpu_limit_per_case(tmp_path):
+    ## the CPU time limit applies to each forked test case, not to the fork server used by all of them
+    submission = "f <- function(x) {\n  t0 <- proc.time()[[1]]\n  while (proc.time()[[1]] - t0 < 1) {}\n  x * 2\n}\n"
+    for i in range(3):
+        assert grade(tmp_path, submission, True, ["--max-cpu-time", "2"], f"case{i}") == "pass"
+
+def test_timeout_kills_spawned_processes(tmp_path):
+    marker = tmp_path / "survived"
+    submission = f"f <- function(x) {{\n  system(\"sleep 3 && touch {marker}\", wait = FALSE)\n  Sys.sleep(60)\n}}\n"
+    with open(tmp_path / "sol.R", 'w') as f:
+        f.write("f <- function(x) x * 2\n")
+    with open(tmp_path / "usr.R", 'w') as f:
+        f.write(submission)
+    with open(tmp_path / "test.args", 'w') as f:
+        f.write("numeric:21\n")
+    out_prefix = str(tmp_path / "forked")
+    eval_r_func_args(["--r-func", "f", "--solution", str(tmp_path / "sol.R"), "--submission", str(tmp_path / "usr.R"),
+                      "--args", str(tmp_path / "test.args"), "--out-prefix", out_prefix, "--fork-server", "--max-time", "1"])
+    subprocess.run(["sleep", "4"])
+    assert not os.path.exists(marker)